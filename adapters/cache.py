@@ -0,0 +1,255 @@
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, ClassVar, Generic, Optional, Tuple, TypeVar
+
+import numpy as np
+import redis
+
+from adapters.common import VectorT
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    evicted_weight: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class AbstractCache(ABC, Generic[V]):
+    def __init__(self):
+        self.stats = CacheStats()
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[V]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, value: V) -> None:
+        raise NotImplementedError
+
+
+def _unit_weight(_) -> int:
+    return 1
+
+
+class LRUCache(AbstractCache[V]):
+    """
+    Thread-safe in-process LRU cache whose entries weigh at most
+    `capacity` in total. By default every entry weighs 1, so capacity is
+    an entry count; pass e.g. `weigher=len` to bound bytes instead.
+    Entries older than `ttl_s` are treated as missing.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        ttl_s: Optional[float] = None,
+        weigher: Callable[[V], int] = _unit_weight,
+    ):
+        super().__init__()
+        self._capacity = capacity
+        self._ttl_s = ttl_s
+        self._weigher = weigher
+        self._weight = 0
+        self._entries: OrderedDict[str, Tuple[float, int, V]]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def weight(self) -> int:
+        return self._weight
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+
+            expiry, weight, value = entry
+            if expiry < time.monotonic():
+                del self._entries[key]
+                self._weight -= weight
+                self.stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key: str, value: V) -> None:
+        expiry = float("inf")
+        if self._ttl_s:
+            expiry = time.monotonic() + self._ttl_s
+        weight = self._weigher(value)
+        if weight > self._capacity:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._weight -= self._entries.pop(key)[1]
+            self._entries[key] = (expiry, weight, value)
+            self._weight += weight
+            while self._weight > self._capacity:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._weight -= evicted
+                self.stats.evictions += 1
+                self.stats.evicted_weight += evicted
+
+
+class RedisVectorCache(AbstractCache[VectorT]):
+    """
+    Vector cache in Redis, shared by every process pointing at the same
+    Redis. Redis errors are logged and treated as cache misses.
+    """
+
+    def __init__(
+        self, url: str, ttl_s: Optional[float] = None, prefix: str = "emb"
+    ):
+        super().__init__()
+        self._redis = redis.Redis.from_url(url)
+        self._ttl_s = ttl_s
+        self._prefix = prefix
+
+    def get(self, key: str) -> Optional[VectorT]:
+        try:
+            data = self._redis.get(f"{self._prefix}:{key}")
+        except redis.RedisError:
+            logger.exception(f"Failed to get {key=} from redis")
+            data = None
+
+        if data is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return np.frombuffer(data, dtype=np.float32)
+
+    def set(self, key: str, value: VectorT) -> None:
+        try:
+            self._redis.set(
+                f"{self._prefix}:{key}",
+                np.ascontiguousarray(value, dtype=np.float32).tobytes(),
+                ex=int(self._ttl_s) if self._ttl_s else None,
+            )
+        except redis.RedisError:
+            logger.exception(f"Failed to set {key=} in redis")
+
+
+class SqliteCache(AbstractCache[V]):
+    """
+    Cache persisted in a table of a local SQLite file, so that it
+    survives restarts and is shared by processes on the same host.
+    Subclasses define how values are stored as blobs.
+    """
+
+    TABLE: ClassVar[str]
+
+    def __init__(self, path: str):
+        super().__init__()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.TABLE} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _encode(self, value: V) -> bytes:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _decode(self, blob: bytes) -> V:
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[V]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.TABLE} WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return self._decode(row[0])
+
+    def set(self, key: str, value: V) -> None:
+        blob = self._encode(value)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.TABLE} (key, value) "
+                "VALUES (?, ?)",
+                (key, blob),
+            )
+            self._conn.commit()
+
+
+class SqliteVectorCache(SqliteCache[VectorT]):
+    TABLE = "vectors"
+
+    def _encode(self, value: VectorT) -> bytes:
+        return np.ascontiguousarray(value, dtype=np.float32).tobytes()
+
+    def _decode(self, blob: bytes) -> VectorT:
+        return np.frombuffer(blob, dtype=np.float32)
+
+
+class SqliteTextCache(SqliteCache[str]):
+    TABLE = "texts"
+
+    def _encode(self, value: str) -> bytes:
+        return value.encode("utf-8")
+
+    def _decode(self, blob: bytes) -> str:
+        return blob.decode("utf-8")
+
+
+class TieredCache(AbstractCache[V]):
+    """
+    Looks up `local` before `shared`, and copies `shared` hits into
+    `local`. Writes go to both.
+    """
+
+    def __init__(self, local: AbstractCache[V], shared: AbstractCache[V]):
+        super().__init__()
+        self._local = local
+        self._shared = shared
+
+    def get(self, key: str) -> Optional[V]:
+        value = self._local.get(key)
+        if value is None:
+            value = self._shared.get(key)
+            if value is not None:
+                self._local.set(key, value)
+
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    def set(self, key: str, value: V) -> None:
+        self._local.set(key, value)
+        self._shared.set(key, value)
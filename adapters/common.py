@@ -0,0 +1,23 @@
+from typing import Iterator, List, Sequence, Tuple, TypeAlias
+
+import numpy as np
+import numpy.typing as npt
+
+# embeddings are carried as contiguous float32 arrays end to end. 1-D for a
+# single vector, 2-D (n, dim) for a batch
+VectorT: TypeAlias = npt.NDArray[np.float32]
+
+# (key, score) pairs, best first
+ScoredKeysT: TypeAlias = List[Tuple[str, float]]
+
+
+def length_buckets(
+    lengths: Sequence[int], batch_size: int
+) -> Iterator[List[int]]:
+    """
+    Yield batches of indices into `lengths`, ordered by length so that
+    inputs padded together have similar lengths.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    for i in range(0, len(order), batch_size):
+        yield order[i : i + batch_size]
@@ -0,0 +1,51 @@
+import logging
+import os
+import threading
+from hashlib import sha256
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+
+class MultiVectorStore:
+    """
+    On-disk store of per-object multi-vector embeddings, e.g. ColPali
+    page embeddings of shape (n_tokens, dim). Embeddings are stored as
+    float16 .npy files and memory-mapped on read, so only the pages of
+    embeddings that are actually scored are read from disk.
+    """
+
+    def __init__(self, root: str):
+        self._root = Path(root)
+        self._root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        digest = sha256(key.encode("utf-8")).hexdigest()
+        return self._root / digest[:2] / f"{digest}.npy"
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str) -> Optional[npt.NDArray[np.float16]]:
+        try:
+            return np.load(self._path(key), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, embs: npt.NDArray) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # write then rename, so that readers never see a partial file
+        tmp_path = path.with_suffix(
+            f".{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(embs, dtype=np.float16))
+        tmp_path.replace(path)
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
@@ -1,12 +1,21 @@
 from adapters.embedders.base import AbstractEmbeddingModel
+from adapters.embedders.batching import BatchingEmbeddingModel
+from adapters.embedders.cached import CachedEmbeddingModel, normalize_text
 from adapters.embedders.clip import CLIPTextModel, CLIPVisionModel
 from adapters.embedders.deplot import DePlotModel
+from adapters.embedders.lazy import LazyEmbeddingModel
+from adapters.embedders.remote import RemoteEmbeddingModel
 from adapters.embedders.unixcoder import UniXCoderModel
 
 __all__ = [
     "AbstractEmbeddingModel",
+    "BatchingEmbeddingModel",
     "CLIPTextModel",
     "CLIPVisionModel",
+    "CachedEmbeddingModel",
     "DePlotModel",
+    "LazyEmbeddingModel",
+    "RemoteEmbeddingModel",
     "UniXCoderModel",
+    "normalize_text",
 ]
@@ -5,6 +5,8 @@ import torch
 import torch.nn as nn
 from transformers import RobertaConfig, RobertaModel, RobertaTokenizer  # type: ignore
 
+from adapters.warm_start import load_pretrained
+
 
 class UniXcoder(nn.Module):
     def __init__(self, model_name):
@@ -23,8 +25,11 @@ class UniXcoder(nn.Module):
             model_name, local_files_only=True
         )
         self.config.is_decoder = True
-        self.model = RobertaModel.from_pretrained(
-            model_name, config=self.config, local_files_only=True
+        self.model = load_pretrained(
+            RobertaModel,
+            model_name,
+            config=self.config,
+            local_files_only=True,
         )
 
         self.register_buffer(
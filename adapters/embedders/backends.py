@@ -0,0 +1,187 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Dict
+
+import onnxruntime as ort  # type: ignore
+import torch
+from onnxruntime.quantization import (  # type: ignore
+    QuantType,
+    quantize_dynamic,
+)
+
+from adapters.precision import Precision, apply_precision, model_dtype
+from adapters.warm_start import weights_revision
+from config import DEVICE, EMBEDDER_BACKENDS, ONNX_CACHE_DIR, ONNX_NUM_THREADS
+
+logger = logging.getLogger(__name__)
+
+ONNX_OPSET = 17
+
+
+class Backend(str, Enum):
+    EAGER = "eager"
+    ONNX = "onnx"
+
+
+class AbstractEncoder(ABC):
+    """Tensor-in, tensor-out forward pass of an embedding model"""
+
+    dtype: torch.dtype = torch.float32
+
+    @abstractmethod
+    def __call__(self, **inputs: torch.Tensor) -> torch.Tensor:
+        raise NotImplementedError
+
+
+class TorchEncoder(AbstractEncoder):
+    def __init__(self, module: torch.nn.Module):
+        self._module = module.eval()
+        self.dtype = model_dtype(module)
+
+    def __call__(self, **inputs: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self._module(**inputs)
+
+
+class OnnxEncoder(AbstractEncoder):
+    """
+    Encoder exported once to ONNX and served by ONNX Runtime on the CPU.
+    Exported graphs are cached on disk under ONNX_CACHE_DIR, keyed by the
+    weights revision of `repo_id` and the opset, so the PyTorch model is
+    only built when the graph has not been exported yet.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        repo_id: str,
+        module_fn: Callable[[], torch.nn.Module],
+        example_inputs: Dict[str, torch.Tensor],
+        dynamic_axes: Dict[str, Dict[int, str]],
+        precision: Precision,
+        num_threads: int = ONNX_NUM_THREADS,
+    ):
+        revision = weights_revision(repo_id)
+        stem = (
+            f"{repo_id.replace('/', '--')}@{revision}.{name}"
+            f".opset{ONNX_OPSET}"
+        )
+        path = Path(ONNX_CACHE_DIR) / f"{stem}.fp32.onnx"
+        if not path.exists():
+            logger.info(f"Exporting {name} to {path}")
+            # the module is built here only, so that it is freed once the
+            # graph is exported
+            _write_replace(
+                path,
+                lambda tmp_path: self._export(
+                    tmp_path, module_fn(), example_inputs, dynamic_axes
+                ),
+            )
+
+        if precision == Precision.INT8:
+            int8_path = path.with_name(f"{stem}.int8.onnx")
+            if not int8_path.exists():
+                logger.info(f"Quantizing {path} to {int8_path}")
+                _write_replace(
+                    int8_path,
+                    lambda tmp_path: quantize_dynamic(
+                        path, tmp_path, weight_type=QuantType.QInt8
+                    ),
+                )
+            path = int8_path
+        elif precision == Precision.BF16:
+            logger.warning("bf16 is not supported by the ONNX backend")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        logger.info(f"Loading {path} into ONNX Runtime")
+        self._session = ort.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+
+    @staticmethod
+    def _export(
+        path: Path,
+        module: torch.nn.Module,
+        example_inputs: Dict[str, torch.Tensor],
+        dynamic_axes: Dict[str, Dict[int, str]],
+    ) -> None:
+        with torch.no_grad():
+            torch.onnx.export(
+                module.eval(),
+                tuple(example_inputs.values()),
+                str(path),
+                input_names=list(example_inputs),
+                output_names=["embeds"],
+                dynamic_axes={**dynamic_axes, "embeds": {0: "batch"}},
+                opset_version=ONNX_OPSET,
+                dynamo=False,
+            )
+
+    def __call__(self, **inputs: torch.Tensor) -> torch.Tensor:
+        (embeds,) = self._session.run(
+            ["embeds"], {name: t.numpy() for name, t in inputs.items()}
+        )
+        return torch.from_numpy(embeds)
+
+
+def _write_replace(path: Path, write_fn: Callable[[Path], None]) -> None:
+    """
+    Writes `path` through a tmp file of this process, then moves it into
+    place, so that workers writing the same graph never see or clobber a
+    partial one
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        write_fn(tmp_path)
+        tmp_path.replace(path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def build_encoder(
+    name: str,
+    repo_id: str,
+    module_fn: Callable[[], torch.nn.Module],
+    example_inputs: Dict[str, torch.Tensor],
+    dynamic_axes: Dict[str, Dict[int, str]],
+    backend: Backend,
+    precision: Precision,
+) -> AbstractEncoder:
+    if effective_backend(backend) != backend:
+        logger.warning(f"ONNX backend is CPU only, using eager on {DEVICE}")
+        backend = Backend.EAGER
+
+    if backend == Backend.ONNX:
+        return OnnxEncoder(
+            name, repo_id, module_fn, example_inputs, dynamic_axes, precision
+        )
+    return TorchEncoder(apply_precision(module_fn(), precision))
+
+
+def default_backend(model_name: str) -> Backend:
+    return Backend(EMBEDDER_BACKENDS.get(model_name, Backend.EAGER.value))
+
+
+def effective_backend(backend: Backend) -> Backend:
+    """The ONNX backend is CPU only, other devices fall back to eager"""
+    if backend == Backend.ONNX and DEVICE.type != "cpu":
+        return Backend.EAGER
+    return backend
+
+
+def variant_id(model_name: str, repo_id: str, *variant: str) -> str:
+    """
+    Identifies the embeddings of `model_name` computed with the locally
+    cached weights of `repo_id` and the given variant, e.g. precision
+    and backend, which all change the embeddings
+    """
+    return ":".join((f"{model_name}@{weights_revision(repo_id)}", *variant))
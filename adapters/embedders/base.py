@@ -1,6 +1,10 @@
 import logging
 from abc import ABC, abstractmethod
-from typing import ClassVar, List
+from typing import ClassVar, Sequence
+
+import numpy as np
+
+from adapters.common import VectorT
 
 logger = logging.getLogger(__name__)
 
@@ -9,10 +13,25 @@ class AbstractEmbeddingModel(ABC):
 
     EMBEDDING_DIM: ClassVar[int]
 
+    @property
+    def model_id(self) -> str:
+        """Identifies the embedding space, e.g. for keying caches"""
+        return type(self).__name__
+
     @abstractmethod
-    def embed(self, data: bytes) -> List[float]:
+    def embed(self, data: bytes) -> VectorT:
         raise NotImplementedError
 
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        """
+        Embed a batch of objects. Returns an array of shape
+        (len(data), EMBEDDING_DIM) whose rows are ordered like `data`.
+        """
+        embs = np.empty((len(data), self.EMBEDDING_DIM), dtype=np.float32)
+        for i, item in enumerate(data):
+            embs[i] = self.embed(item)
+        return embs
+
 
 class TextModel(AbstractEmbeddingModel): ...
 
@@ -0,0 +1,108 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Sequence, Tuple
+
+from adapters.common import VectorT
+from adapters.embedders.base import AbstractEmbeddingModel
+from config import (
+    QUERY_BATCH_MAX_PENDING,
+    QUERY_BATCH_MAX_WAIT_S,
+    QUERY_BATCH_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+RequestT = Tuple[bytes, "Future[VectorT]"]
+
+
+class BatchingEmbeddingModel(AbstractEmbeddingModel):
+    """
+    Coalesces concurrent `embed` calls into single `embed_many` calls of
+    `model`, run on a dedicated thread. A batch is run once it holds
+    `max_batch_size` inputs or `max_wait_s` after its first input
+    arrived, whichever comes first. Inputs arriving while a batch runs
+    are queued for the next one.
+
+    At most `max_pending` inputs are queued. `embed` blocks while the
+    queue is full, which applies backpressure to the callers.
+
+    The thread is started by the first `embed` of each process, so that
+    the model can be built before forking workers, e.g. with gunicorn
+    --preload, which does not carry threads over to the children.
+    """
+
+    def __init__(
+        self,
+        model: AbstractEmbeddingModel,
+        max_batch_size: int = QUERY_BATCH_SIZE,
+        max_wait_s: float = QUERY_BATCH_MAX_WAIT_S,
+        max_pending: int = QUERY_BATCH_MAX_PENDING,
+    ):
+        self._model = model
+        self._max_batch_size = max_batch_size
+        self._max_wait_s = max_wait_s
+        self._max_pending = max_pending
+        self.EMBEDDING_DIM = model.EMBEDDING_DIM  # type: ignore[misc]
+        self._queue: queue.Queue[RequestT] = queue.Queue(max_pending)
+        self._worker_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def model_id(self) -> str:
+        return self._model.model_id
+
+    def _ensure_worker(self) -> None:
+        if self._worker_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._worker_pid == os.getpid():
+                return
+            if self._worker_pid is not None:
+                # forked, the queue may hold requests of the parent
+                self._queue = queue.Queue(self._max_pending)
+            threading.Thread(
+                target=self._run,
+                args=(self._queue,),
+                name=f"batch-{self.model_id}",
+                daemon=True,
+            ).start()
+            self._worker_pid = os.getpid()
+
+    def embed(self, data: bytes) -> VectorT:
+        self._ensure_worker()
+        future: Future[VectorT] = Future()
+        self._queue.put((data, future))
+        return future.result()
+
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        # already batched by the caller
+        return self._model.embed_many(data)
+
+    def _next_batch(self, requests: "queue.Queue[RequestT]") -> List[RequestT]:
+        batch = [requests.get()]
+        deadline = time.monotonic() + self._max_wait_s
+        while len(batch) < self._max_batch_size:
+            timeout = max(0, deadline - time.monotonic())
+            try:
+                batch.append(requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, requests: "queue.Queue[RequestT]") -> None:
+        while True:
+            batch = self._next_batch(requests)
+            logger.debug(f"Embedding batch of {len(batch)} {self.model_id}")
+            try:
+                embs = self._model.embed_many([data for data, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), emb in zip(batch, embs):
+                # a copy, so that no caller holds a view of the batch
+                future.set_result(emb.copy())
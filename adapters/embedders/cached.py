@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import unicodedata
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from adapters.cache import AbstractCache
+from adapters.common import VectorT
+from adapters.embedders.base import AbstractEmbeddingModel
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(data: bytes) -> bytes:
+    """Unicode-normalize and collapse whitespace, preserving case"""
+    text = unicodedata.normalize("NFC", data.decode("utf-8"))
+    return " ".join(text.split()).encode("utf-8")
+
+
+class CachedEmbeddingModel(AbstractEmbeddingModel):
+    """
+    Serves embeddings of `model` from `cache`, keyed on the model id and
+    a hash of the (normalized) input. Only cache misses reach `model`.
+    """
+
+    def __init__(
+        self,
+        model: AbstractEmbeddingModel,
+        cache: AbstractCache[VectorT],
+        normalize: Callable[[bytes], bytes] = lambda data: data,
+    ):
+        self._model = model
+        self._cache = cache
+        self._normalize = normalize
+        self.EMBEDDING_DIM = model.EMBEDDING_DIM  # type: ignore[misc]
+
+    @property
+    def model_id(self) -> str:
+        return self._model.model_id
+
+    def _key(self, data: bytes) -> str:
+        digest = hashlib.sha256(self._normalize(data)).hexdigest()
+        return f"{self.model_id}:{digest}"
+
+    def embed(self, data: bytes) -> VectorT:
+        key = self._key(data)
+        if (emb := self._cache.get(key)) is not None:
+            return emb
+        emb = self._model.embed(data)
+        self._cache.set(key, emb)
+        return emb
+
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        keys = [self._key(item) for item in data]
+        embs = np.empty((len(data), self.EMBEDDING_DIM), dtype=np.float32)
+        misses: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            if key in misses:
+                misses[key].append(i)
+            elif (emb := self._cache.get(key)) is None:
+                misses[key] = [i]
+            else:
+                embs[i] = emb
+
+        if misses:
+            # duplicates within the batch are only embedded once
+            miss_embs = self._model.embed_many(
+                [data[idxs[0]] for idxs in misses.values()]
+            )
+            for (key, idxs), emb in zip(misses.items(), miss_embs):
+                embs[idxs] = emb
+                self._cache.set(key, emb)
+        logger.debug(f"{self.model_id} cache {self._cache.stats}")
+        return embs
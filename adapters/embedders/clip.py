@@ -1,17 +1,34 @@
 import logging
 from io import BytesIO
-from typing import ClassVar, List, Optional
+from typing import ClassVar, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
 import torch
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from PIL import Image
 from transformers import (  # type: ignore
     CLIPProcessor,
     CLIPTextModelWithProjection,
+    CLIPTokenizerFast,
     CLIPVisionModelWithProjection,
 )
 
+from adapters.common import VectorT, length_buckets
+from adapters.embedders.backends import (
+    Backend,
+    build_encoder,
+    default_backend,
+    effective_backend,
+    variant_id,
+)
 from adapters.embedders.base import TextModel, VisionModel
+from adapters.precision import Precision
+from adapters.warm_start import load_pretrained
+from config import (
+    CLIP_CHUNK_BUFFER_SIZE,
+    CLIP_TOKENIZE_BLOCK_CHARS,
+    EMBED_BATCH_SIZE,
+    MODEL_PRECISION,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,10 +37,91 @@ def _norm(features: torch.Tensor):
     return features / features.norm(dim=-1, keepdim=True)
 
 
+class _ImageEmbeds(torch.nn.Module):
+    def __init__(self, model: CLIPVisionModelWithProjection):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model(pixel_values=pixel_values).image_embeds
+
+
+class _TextEmbeds(torch.nn.Module):
+    def __init__(self, model: CLIPTextModelWithProjection):
+        super().__init__()
+        self.model = model
+
+    def forward(
+        self, input_ids: torch.Tensor, attention_mask: torch.Tensor
+    ) -> torch.Tensor:
+        return self.model(
+            input_ids=input_ids, attention_mask=attention_mask
+        ).text_embeds
+
+
+class _TokenChunker:
+    """
+    Splits text into overlapping windows of CLIP token ids, wrapped in
+    BOS and EOS. Text is tokenized once, in blocks cut at whitespace, so
+    that arbitrarily long texts are chunked incrementally.
+    """
+
+    MAX_LENGTH = 77  # CLIP has hard limit of 77
+    OVERLAP = 15
+
+    def __init__(self, tokenizer: CLIPTokenizerFast):
+        self._tokenizer = tokenizer
+        self._window = self.MAX_LENGTH - 2
+        self._stride = self._window - self.OVERLAP
+
+    def _blocks(self, text: str) -> Iterator[str]:
+        start = 0
+        while len(text) - start > CLIP_TOKENIZE_BLOCK_CHARS:
+            end = start + CLIP_TOKENIZE_BLOCK_CHARS
+            # cut at whitespace so that no token spans two blocks
+            cut = max(text.rfind(c, start, end) for c in " \n\t")
+            if cut <= start:
+                cut = end
+            yield text[start:cut]
+            start = cut
+        yield text[start:]
+
+    def _wrap(self, ids: List[int]) -> List[int]:
+        tokenizer = self._tokenizer
+        return [tokenizer.bos_token_id, *ids, tokenizer.eos_token_id]
+
+    def chunks(self, text: str) -> Iterator[List[int]]:
+        buffer: List[int] = []
+        for block in self._blocks(text):
+            buffer.extend(
+                self._tokenizer(block, add_special_tokens=False)["input_ids"]
+            )
+            while len(buffer) > self._window:
+                yield self._wrap(buffer[: self._window])
+                buffer = buffer[self._stride :]
+        # the remainder always holds tokens that have not been emitted,
+        # or is the whole (possibly empty) text
+        yield self._wrap(buffer)
+
+
 class CLIPMixin:
     EMBEDDING_DIM = 512
     _processor: ClassVar[Optional[CLIPProcessor]] = None
 
+    @classmethod
+    def variant_id(
+        cls,
+        precision: Precision = Precision(MODEL_PRECISION),
+        backend: Optional[Backend] = None,
+    ) -> str:
+        backend = effective_backend(backend or default_backend(cls.__name__))
+        return variant_id(
+            cls.__name__,
+            "openai/clip-vit-base-patch32",
+            precision.value,
+            backend.value,
+        )
+
     def __init__(self):
         if not CLIPMixin._processor:
             logger.info("Initializing openai/clip-vit-base-patch32 processor")
@@ -34,52 +132,133 @@ class CLIPMixin:
 
 
 class CLIPVisionModel(VisionModel, CLIPMixin):
-    def __init__(self):
+    def __init__(
+        self,
+        precision: Precision = Precision(MODEL_PRECISION),
+        backend: Optional[Backend] = None,
+    ):
         logger.info("Initializing openai/clip-vit-base-patch32 vision model")
         super().__init__()
-        self._model = CLIPVisionModelWithProjection.from_pretrained(
+        backend = backend or default_backend(type(self).__name__)
+        self._model_id = self.variant_id(precision, backend)
+        self._encoder = build_encoder(
+            "clip-vit-base-patch32-vision",
             "openai/clip-vit-base-patch32",
-            local_files_only=True,
+            lambda: _ImageEmbeds(
+                load_pretrained(
+                    CLIPVisionModelWithProjection,
+                    "openai/clip-vit-base-patch32",
+                    local_files_only=True,
+                )
+            ),
+            {"pixel_values": torch.zeros(1, 3, 224, 224)},
+            {"pixel_values": {0: "batch"}},
+            backend,
+            precision,
         )
 
-    def embed(self, data: bytes) -> List[float]:
-        image = Image.open(BytesIO(data))
-        inputs = self._processor(
-            images=image, return_tensors="pt", padding=True
-        )
-        outputs = self._model(**inputs)
-        emb: torch.Tensor
-        emb = outputs.image_embeds
-        emb = emb.reshape(-1)
-        emb = _norm(emb)
-        return emb.tolist()
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    def embed(self, data: bytes) -> VectorT:
+        return self.embed_many([data])[0]
+
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        embs = np.empty((len(data), self.EMBEDDING_DIM), dtype=np.float32)
+        for i in range(0, len(data), EMBED_BATCH_SIZE):
+            images = [
+                Image.open(BytesIO(item))
+                for item in data[i : i + EMBED_BATCH_SIZE]
+            ]
+            inputs = self._processor(images=images, return_tensors="pt")
+            outputs = self._encoder(
+                pixel_values=inputs["pixel_values"].to(self._encoder.dtype)
+            )
+            emb = _norm(outputs.float())
+            embs[i : i + len(images)] = emb.numpy()
+        return embs
 
 
 class CLIPTextModel(TextModel, CLIPMixin):
 
-    def __init__(self):
+    def __init__(
+        self,
+        precision: Precision = Precision(MODEL_PRECISION),
+        backend: Optional[Backend] = None,
+    ):
         logger.info("Initializing openai/clip-vit-base-patch32 text model")
         super().__init__()
-        self._model = CLIPTextModelWithProjection.from_pretrained(
+        backend = backend or default_backend(type(self).__name__)
+        self._model_id = self.variant_id(precision, backend)
+        self._encoder = build_encoder(
+            "clip-vit-base-patch32-text",
             "openai/clip-vit-base-patch32",
-            local_files_only=True,
+            lambda: _TextEmbeds(
+                load_pretrained(
+                    CLIPTextModelWithProjection,
+                    "openai/clip-vit-base-patch32",
+                    local_files_only=True,
+                )
+            ),
+            dict(self._processor.tokenizer(["a"], return_tensors="pt")),
+            {
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+            },
+            backend,
+            precision,
         )
+        self._chunker = _TokenChunker(self._processor.tokenizer)
+
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    def embed(self, data: bytes) -> VectorT:
+        return self.embed_many([data])[0]
 
-    def embed(self, data: bytes) -> List[float]:
-        text = data.decode("utf-8")
-        text_splitter = (
-            RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
-                self._processor.tokenizer,
-                chunk_size=77,  # CLIP has hard limit of 77
-                chunk_overlap=15,
+    def _encode_chunks(
+        self,
+        chunks: List[Tuple[int, List[int]]],
+        sums: torch.Tensor,
+        counts: torch.Tensor,
+    ) -> None:
+        """Encode (owner, token ids) chunks, summing embeddings per owner"""
+        tokenizer = self._processor.tokenizer
+        for bucket in length_buckets(
+            [len(ids) for _, ids in chunks], EMBED_BATCH_SIZE
+        ):
+            inputs = tokenizer.pad(
+                {"input_ids": [chunks[i][1] for i in bucket]},
+                return_tensors="pt",
             )
-        )
-        texts = text_splitter.split_text(text)
-        inputs = self._processor(text=texts, return_tensors="pt", padding=True)
-        outputs = self._model(**inputs)
-        emb: torch.Tensor
-        emb = outputs.text_embeds
-        emb = emb.mean(dim=0)
-        emb = emb.reshape(-1)
-        emb = _norm(emb)
-        return emb.tolist()
+            outputs = self._encoder(
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+            )
+            owners = torch.tensor([chunks[i][0] for i in bucket])
+            sums.index_add_(0, owners, outputs.float())
+            counts.index_add_(0, owners, torch.ones(len(bucket), 1))
+
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        """
+        Split every text into chunks and encode the chunks of all texts
+        together in length-bucketed batches. A text's embedding is the
+        mean of its chunk embeddings.
+
+        Chunks are streamed through a buffer of bounded size, so memory
+        use does not grow with the length of the texts.
+        """
+        sums = torch.zeros(len(data), self.EMBEDDING_DIM)
+        counts = torch.zeros(len(data), 1)
+        buffer: List[Tuple[int, List[int]]] = []
+        for i, item in enumerate(data):
+            for chunk in self._chunker.chunks(item.decode("utf-8")):
+                buffer.append((i, chunk))
+                if len(buffer) == CLIP_CHUNK_BUFFER_SIZE:
+                    self._encode_chunks(buffer, sums, counts)
+                    buffer = []
+        if buffer:
+            self._encode_chunks(buffer, sums, counts)
+        return _norm(sums / counts).numpy()
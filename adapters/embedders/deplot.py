@@ -1,6 +1,7 @@
+import hashlib
 import logging
 from io import BytesIO
-from typing import List
+from typing import List, Optional, Sequence, cast
 
 from PIL import Image
 from transformers import (  # type: ignore
@@ -8,32 +9,123 @@ from transformers import (  # type: ignore
     Pix2StructProcessor,
 )
 
+from adapters.cache import AbstractCache
+from adapters.common import VectorT
+from adapters.embedders.backends import variant_id
 from adapters.embedders.base import PlotModel, TextModel
+from adapters.precision import Precision, apply_precision, model_dtype
+from adapters.warm_start import load_pretrained
+from config import DEPLOT_BATCH_SIZE, MODEL_PRECISION
 
 logger = logging.getLogger(__name__)
 
+DEPLOT_PROMPT = "Generate underlying data table of the figure below:"
+DEPLOT_MAX_NEW_TOKENS = 512
+
 
 class DePlotModel(PlotModel):
 
     EMBEDDING_DIM = 512
 
-    def __init__(self, text_model: TextModel):
+    def __init__(
+        self,
+        text_model: TextModel,
+        precision: Precision = Precision(MODEL_PRECISION),
+        table_store: Optional[AbstractCache[str]] = None,
+    ):
         logger.info("Initializing google/deplot")
         self._processor = Pix2StructProcessor.from_pretrained("google/deplot")
-        self._deplot_model = (
-            Pix2StructForConditionalGeneration.from_pretrained("google/deplot")
+        deplot_model = load_pretrained(
+            Pix2StructForConditionalGeneration, "google/deplot"
         )
+        self._deplot_model = apply_precision(deplot_model, precision)
+        self._dtype = model_dtype(self._deplot_model)
         self._text_model = text_model
+        self._table_store = table_store
+        self._table_id = self.table_id(precision)
+        self._model_id = self.variant_id(text_model.model_id, precision)
 
-    def embed(self, data: bytes) -> List[float]:
-        image = Image.open(BytesIO(data))
-        inputs = self._processor(
-            images=image,
-            text="Generate underlying data table of the figure below:",
-            return_tensors="pt",
+    @classmethod
+    def table_id(
+        cls, precision: Precision = Precision(MODEL_PRECISION)
+    ) -> str:
+        """Identifies the data tables generated by this DePlot variant"""
+        return variant_id(
+            cls.__name__,
+            "google/deplot",
+            precision.value,
+            f"tokens{DEPLOT_MAX_NEW_TOKENS}",
         )
-        predictions = self._deplot_model.generate(**inputs, max_new_tokens=512)
-        table_str = self._processor.decode(
-            predictions[0], skip_special_tokens=True
+
+    @classmethod
+    def variant_id(
+        cls,
+        text_model_id: str,
+        precision: Precision = Precision(MODEL_PRECISION),
+    ) -> str:
+        # plot embeddings live in the text model's embedding space
+        return f"{cls.table_id(precision)}({text_model_id})"
+
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    def embed(self, data: bytes) -> VectorT:
+        return self.embed_many([data])[0]
+
+    def _generate_tables(self, data: Sequence[bytes]) -> List[str]:
+        tables: List[str] = []
+        for i in range(0, len(data), DEPLOT_BATCH_SIZE):
+            images = [
+                Image.open(BytesIO(item))
+                for item in data[i : i + DEPLOT_BATCH_SIZE]
+            ]
+            inputs = self._processor(
+                images=images,
+                text=[DEPLOT_PROMPT] * len(images),
+                return_tensors="pt",
+            )
+            inputs["flattened_patches"] = inputs["flattened_patches"].to(
+                self._dtype
+            )
+            predictions = self._deplot_model.generate(
+                **inputs, max_new_tokens=DEPLOT_MAX_NEW_TOKENS
+            )
+            tables.extend(
+                self._processor.batch_decode(
+                    predictions, skip_special_tokens=True
+                )
+            )
+        return tables
+
+    def extract_tables(self, data: Sequence[bytes]) -> List[str]:
+        """
+        Data tables of plots. Tables of plots seen before are read from
+        the table store, the rest are generated in batches and stored.
+        Tables are keyed by the DePlot variant, as another revision,
+        precision or token budget generates other tables.
+        """
+        if self._table_store is None:
+            return self._generate_tables(data)
+
+        keys = [
+            f"{self._table_id}:{hashlib.sha256(item).hexdigest()}"
+            for item in data
+        ]
+        tables = [self._table_store.get(key) for key in keys]
+        missing = [i for i, table in enumerate(tables) if table is None]
+        generated = self._generate_tables([data[i] for i in missing])
+        for i, table in zip(missing, generated):
+            self._table_store.set(keys[i], table)
+            tables[i] = table
+        return cast(List[str], tables)
+
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        """
+        Extract the data tables of all plots, then embed the tables
+        together using the text model.
+        """
+        tables = self.extract_tables(data)
+        return self._text_model.embed_many(
+            [table.encode("utf-8") for table in tables]
         )
-        return self._text_model.embed(table_str.encode("utf-8"))
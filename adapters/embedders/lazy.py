@@ -0,0 +1,40 @@
+from typing import Callable, Sequence
+
+from adapters.common import VectorT
+from adapters.embedders.base import AbstractEmbeddingModel
+from adapters.model_registry import ModelRegistry
+
+
+class LazyEmbeddingModel(AbstractEmbeddingModel):
+    """
+    Proxy of the embedding model `name` of `registry`, loaded by
+    `loader` on first use. `model_id` and `embedding_dim` are those of
+    the loaded model, given up front so that caches and vector repos
+    can be set up without loading it.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        name: str,
+        loader: Callable[[], AbstractEmbeddingModel],
+        model_id: str,
+        embedding_dim: int,
+    ):
+        registry.register(name, loader)
+        self._registry = registry
+        self._name = name
+        self._model_id = model_id
+        self.EMBEDDING_DIM = embedding_dim  # type: ignore[misc]
+
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    def embed(self, data: bytes) -> VectorT:
+        with self._registry.acquire(self._name) as model:
+            return model.embed(data)
+
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        with self._registry.acquire(self._name) as model:
+            return model.embed_many(data)
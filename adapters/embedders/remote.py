@@ -0,0 +1,32 @@
+from typing import Sequence
+
+from event_core.domain.types import Element
+
+from adapters.common import VectorT
+from adapters.embedders.base import AbstractEmbeddingModel
+from adapters.model_client import (
+    DESCRIBE,
+    EMBED,
+    EMBED_MANY,
+    ModelServerClient,
+)
+
+
+class RemoteEmbeddingModel(AbstractEmbeddingModel):
+    """Proxy of the model server's query model of element type `elem`"""
+
+    def __init__(self, client: ModelServerClient, elem: Element):
+        self._client = client
+        self._elem = elem.value
+        self._model_id, dim = client.call(DESCRIBE, self._elem)
+        self.EMBEDDING_DIM = dim  # type: ignore[misc]
+
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    def embed(self, data: bytes) -> VectorT:
+        return self._client.call(EMBED, self._elem, data)
+
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        return self._client.call(EMBED_MANY, self._elem, list(data))
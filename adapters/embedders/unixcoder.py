@@ -1,26 +1,115 @@
-from typing import List
+from typing import Optional, Sequence
 
+import numpy as np
 import torch
+from transformers import RobertaConfig, RobertaTokenizer  # type: ignore
 
+from adapters.common import VectorT, length_buckets
 from adapters.embedders._unixcoder import UniXcoder
+from adapters.embedders.backends import (
+    Backend,
+    build_encoder,
+    default_backend,
+    effective_backend,
+    variant_id,
+)
 from adapters.embedders.base import CodeModel
-from config import DEVICE
+from adapters.precision import Precision
+from config import DEVICE, EMBED_BATCH_SIZE, MODEL_PRECISION
+
+
+class _SentenceEmbeds(torch.nn.Module):
+    def __init__(self, model: UniXcoder):
+        super().__init__()
+        self.model = model
+
+    def forward(self, source_ids: torch.Tensor) -> torch.Tensor:
+        _, embedding = self.model(source_ids)
+        return embedding
+
+
+class _Tokenizer:
+    """The tokenization of UniXcoder, without loading its weights"""
+
+    tokenize = UniXcoder.tokenize
+
+    def __init__(self, model_name: str):
+        self.tokenizer = RobertaTokenizer.from_pretrained(
+            model_name, local_files_only=True
+        )
+        self.tokenizer.add_tokens(["<mask0>"], special_tokens=True)
+        self.config = RobertaConfig.from_pretrained(
+            model_name, local_files_only=True
+        )
 
 
 class UniXCoderModel(CodeModel):
 
     EMBEDDING_DIM = 768
 
-    def __init__(self):
-        self._model = UniXcoder("microsoft/unixcoder-base")
-        self._model.to(DEVICE)
+    def __init__(
+        self,
+        precision: Precision = Precision(MODEL_PRECISION),
+        backend: Optional[Backend] = None,
+    ):
+        backend = backend or default_backend(type(self).__name__)
+        self._model_id = self.variant_id(precision, backend)
+        # the PyTorch model is only built, and kept, by the eager backend
+        self._tokenizer = _Tokenizer("microsoft/unixcoder-base")
+        self._encoder = build_encoder(
+            "unixcoder-base",
+            "microsoft/unixcoder-base",
+            lambda: _SentenceEmbeds(
+                UniXcoder("microsoft/unixcoder-base").to(DEVICE)
+            ),
+            {"source_ids": torch.tensor(self._tokenizer.tokenize(["a"]))},
+            {"source_ids": {0: "batch", 1: "sequence"}},
+            backend,
+            precision,
+        )
+
+    @classmethod
+    def variant_id(
+        cls,
+        precision: Precision = Precision(MODEL_PRECISION),
+        backend: Optional[Backend] = None,
+    ) -> str:
+        backend = effective_backend(backend or default_backend(cls.__name__))
+        return variant_id(
+            cls.__name__,
+            "microsoft/unixcoder-base",
+            precision.value,
+            backend.value,
+        )
+
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    def embed(self, data: bytes) -> VectorT:
+        return self.embed_many([data])[0]
 
-    def embed(self, data: bytes) -> List[float]:
-        tokens_ids = self._model.tokenize(
-            [data.decode("utf-8")], max_length=512, mode="<encoder-only>"
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        tokens_ids = self._tokenizer.tokenize(
+            [item.decode("utf-8") for item in data],
+            max_length=512,
+            mode="<encoder-only>",
         )
-        source_ids = torch.tensor(tokens_ids).to(DEVICE)
-        with torch.no_grad():
-            _, embedding = self._model(source_ids)
-            embedding = torch.nn.functional.normalize(embedding, p=2, dim=1)
-            return embedding.reshape(-1).tolist()
+        pad_id = self._tokenizer.config.pad_token_id
+        embs = np.empty((len(data), self.EMBEDDING_DIM), dtype=np.float32)
+        for bucket in length_buckets(
+            list(map(len, tokens_ids)), EMBED_BATCH_SIZE
+        ):
+            max_len = max(len(tokens_ids[i]) for i in bucket)
+            source_ids = torch.tensor(
+                [
+                    tokens_ids[i] + [pad_id] * (max_len - len(tokens_ids[i]))
+                    for i in bucket
+                ]
+            ).to(DEVICE)
+            embedding = self._encoder(source_ids=source_ids)
+            embedding = torch.nn.functional.normalize(
+                embedding.float(), p=2, dim=1
+            )
+            embs[bucket] = embedding.cpu().numpy()
+        return embs
@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+from multiprocessing.connection import Client, Connection
+from typing import Any, Optional
+
+from config import (
+    MODEL_SERVER_CALL_TIMEOUT_S,
+    MODEL_SERVER_CONNECT_TIMEOUT_S,
+)
+
+logger = logging.getLogger(__name__)
+
+# requests are (method, args) tuples, responses are (status, result) tuples
+DESCRIBE = "describe"
+EMBED = "embed"
+EMBED_MANY = "embed_many"
+RERANK = "rerank"
+OK = "ok"
+ERROR = "error"
+
+
+class ModelServerError(RuntimeError):
+    """A request failed inside the model server"""
+
+
+class ModelServerClient:
+    """
+    Client of the model server listening on the unix socket `address`,
+    authenticated by `authkey`. Every thread talks to the server over
+    its own connection, so that concurrent requests are served
+    concurrently by the server. A request left unanswered for
+    `call_timeout_s` raises TimeoutError, and its connection is dropped
+    so that a late response is never read as the next one.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        authkey: bytes,
+        connect_timeout_s: float = MODEL_SERVER_CONNECT_TIMEOUT_S,
+        call_timeout_s: float = MODEL_SERVER_CALL_TIMEOUT_S,
+    ):
+        self._address = address
+        self._authkey = authkey
+        self._connect_timeout_s = connect_timeout_s
+        self._call_timeout_s = call_timeout_s
+        self._local = threading.local()
+
+    def _connect(self) -> Connection:
+        # the server may still be loading its models
+        deadline = time.monotonic() + self._connect_timeout_s
+        while True:
+            try:
+                return Client(
+                    self._address, family="AF_UNIX", authkey=self._authkey
+                )
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                logger.info(f"Waiting for model server at {self._address}")
+                time.sleep(1)
+
+    def call(self, method: str, *args: Any) -> Any:
+        conn: Optional[Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        try:
+            conn.send((method, args))
+            if not conn.poll(self._call_timeout_s):
+                raise TimeoutError(
+                    f"{method} got no response in {self._call_timeout_s}s"
+                )
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # reconnect on the next call, e.g. after a server restart or
+            # a timeout. TimeoutError is an OSError
+            conn.close()
+            self._local.conn = None
+            raise
+        if status == ERROR:
+            raise ModelServerError(result)
+        return result
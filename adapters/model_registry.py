@@ -0,0 +1,175 @@
+import gc
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import psutil
+import torch
+
+from config import MODEL_IDLE_EVICT_S, MODEL_MEMORY_BUDGET_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    loader: Callable[[], Any]
+    nbytes: Optional[int] = None  # declared footprint, else measured
+    model: Any = None
+    loaded_nbytes: int = 0
+    in_use: int = 0
+    last_used: float = 0.0
+
+
+def _rss() -> int:
+    return psutil.Process().memory_info().rss
+
+
+class ModelRegistry:
+    """
+    Loads models on first use and unloads them again when they are not
+    needed, so that models of element types that are rarely queried do
+    not hold memory.
+
+    A model is registered under a name with a loader, and used within
+    `acquire(name)`. Concurrent first uses of a model wait for a single
+    load. Loads are serialized, so that concurrent loads neither stack
+    their peak memory nor blur the measured footprint of a model, which
+    is the growth of the process RSS during its load unless declared.
+
+    Models outside of `acquire` are unloaded once idle for `idle_s`
+    (0 never unloads idle models), and least recently used first while
+    the footprints of the loaded models exceed `memory_budget_bytes`
+    (0 is unbounded). Models in use are never unloaded.
+    """
+
+    def __init__(
+        self,
+        idle_s: float = MODEL_IDLE_EVICT_S,
+        memory_budget_bytes: int = MODEL_MEMORY_BUDGET_BYTES,
+    ):
+        self._idle_s = idle_s
+        self._memory_budget_bytes = memory_budget_bytes
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()  # guards the entries
+        self._load_lock = threading.Lock()
+        self._closed = threading.Event()
+        if idle_s > 0:
+            threading.Thread(
+                target=self._evict_idle, name="model-evictor", daemon=True
+            ).start()
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        nbytes: Optional[int] = None,
+    ) -> None:
+        """Registers `loader` under `name`, unless already registered"""
+        with self._lock:
+            self._entries.setdefault(name, _Entry(loader, nbytes))
+
+    @property
+    def loaded(self) -> Dict[str, int]:
+        """Footprints of the loaded models, by name"""
+        with self._lock:
+            return {
+                name: entry.loaded_nbytes
+                for name, entry in self._entries.items()
+                if entry.model is not None
+            }
+
+    @contextmanager
+    def acquire(self, name: str) -> Iterator[Any]:
+        entry = self._entries[name]
+        with self._lock:
+            entry.in_use += 1
+            model = entry.model
+        try:
+            if model is None:
+                model = self._load(name, entry)
+            yield model
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def _load(self, name: str, entry: _Entry) -> Any:
+        with self._load_lock:
+            if entry.model is not None:
+                # loaded while waiting for the lock
+                return entry.model
+            logger.info(f"Loading model {name}")
+            start = time.perf_counter()
+            rss = _rss()
+            model = entry.loader()
+            with self._lock:
+                entry.model = model
+                entry.loaded_nbytes = (
+                    entry.nbytes
+                    if entry.nbytes is not None
+                    else max(_rss() - rss, 0)
+                )
+            logger.info(
+                f"Loaded model {name} in {time.perf_counter() - start:.2f}s"
+                f" ({entry.loaded_nbytes / 2**20:.0f} MiB)"
+            )
+        self._enforce_budget()
+        return model
+
+    def _unload(self, names: List[str]) -> None:
+        if not names:
+            return
+        logger.info(f"Unloading models {', '.join(names)}")
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _enforce_budget(self) -> None:
+        if not self._memory_budget_bytes:
+            return
+        evicted = []
+        with self._lock:
+            loaded = [
+                (name, entry)
+                for name, entry in self._entries.items()
+                if entry.model is not None
+            ]
+            total = sum(entry.loaded_nbytes for _, entry in loaded)
+            idle = sorted(
+                (item for item in loaded if not item[1].in_use),
+                key=lambda item: item[1].last_used,
+            )
+            for name, entry in idle:
+                if total <= self._memory_budget_bytes:
+                    break
+                entry.model = None
+                total -= entry.loaded_nbytes
+                evicted.append(name)
+        if total > self._memory_budget_bytes:
+            logger.warning(
+                f"Models in use take {total / 2**20:.0f} MiB, over the"
+                f" budget of {self._memory_budget_bytes / 2**20:.0f} MiB"
+            )
+        self._unload(evicted)
+
+    def _evict_idle(self) -> None:
+        while not self._closed.wait(min(self._idle_s, 60) / 2):
+            now = time.monotonic()
+            evicted = []
+            with self._lock:
+                for name, entry in self._entries.items():
+                    if (
+                        entry.model is not None
+                        and not entry.in_use
+                        and now - entry.last_used > self._idle_s
+                    ):
+                        entry.model = None
+                        evicted.append(name)
+            self._unload(evicted)
+
+    def close(self) -> None:
+        self._closed.set()
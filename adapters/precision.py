@@ -0,0 +1,44 @@
+import logging
+from enum import Enum
+from typing import TypeVar
+
+import torch
+
+from config import DEVICE
+
+logger = logging.getLogger(__name__)
+
+ModuleT = TypeVar("ModuleT", bound=torch.nn.Module)
+
+
+class Precision(str, Enum):
+    FP32 = "fp32"
+    BF16 = "bf16"
+    INT8 = "int8"  # dynamic int8 quantization of linear layers, CPU only
+
+
+def apply_precision(model: ModuleT, precision: Precision) -> ModuleT:
+    """
+    Convert the weights of `model` to `precision`. Inputs of models
+    converted to BF16 must be cast with `model_dtype` as well.
+    """
+    if precision == Precision.INT8 and DEVICE.type != "cpu":
+        logger.warning(f"int8 is not supported on {DEVICE}, using fp32")
+        return model
+
+    logger.info(f"Converting {type(model).__name__} to {precision.value}")
+    if precision == Precision.BF16:
+        return model.to(torch.bfloat16)
+    if precision == Precision.INT8:
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return model
+
+
+def model_dtype(model: torch.nn.Module) -> torch.dtype:
+    """Floating point dtype that inputs of `model` should be cast to"""
+    for param in model.parameters():
+        if param.is_floating_point():
+            return param.dtype
+    return torch.float32
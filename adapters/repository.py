@@ -1,12 +1,33 @@
 import logging
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, Iterable, List
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
+import numpy as np
 from pinecone import Pinecone, ServerlessSpec  # type: ignore
 from pinecone.data.index import Index  # type: ignore
 from pinecone.openapi_support.exceptions import PineconeApiException  # type: ignore
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+from urllib3 import exceptions as urllib3_exceptions
 
-from config import get_pinecone_api_key
+from adapters.common import ScoredKeysT, VectorT
+from adapters.vector_index import LocalVectorIndex
+from config import (
+    LOCAL_VECTOR_REPO_PATH,
+    PINECONE_MAX_IN_FLIGHT,
+    PINECONE_MAX_RETRIES,
+    PINECONE_UPSERT_BATCH_SIZE,
+    get_pinecone_api_key,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -14,16 +35,66 @@ logger = logging.getLogger(__name__)
 class AbstractVectorRepo(ABC):
     @abstractmethod
     def insert(
-        self, index_name: str, namespace: str, key: str, vec: List[float]
+        self, index_name: str, namespace: str, key: str, vec: VectorT
+    ) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_many(
+        self,
+        index_name: str,
+        namespace: str,
+        items: Sequence[Tuple[str, VectorT]],
+    ) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(
+        self, index_name: str, namespace: str, keys: Sequence[str]
     ) -> None:
         raise NotImplementedError
 
     @abstractmethod
     def query(
-        self, index_name: str, namespace: str, vec: List[float], top_k: int = 5
-    ) -> List[str]:
+        self, index_name: str, namespace: str, vec: VectorT, top_k: int = 5
+    ) -> ScoredKeysT:
         raise NotImplementedError
 
+    def query_many(
+        self,
+        index_name: str,
+        namespace: str,
+        vecs: Sequence[VectorT],
+        top_k: int = 5,
+    ) -> List[ScoredKeysT]:
+        return [self.query(index_name, namespace, vec, top_k) for vec in vecs]
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Connection errors, timeouts, rate limits and server errors"""
+    if isinstance(exc, PineconeApiException):
+        return exc.status == 429 or (exc.status or 0) >= 500
+    return isinstance(
+        exc,
+        (
+            ConnectionError,
+            TimeoutError,
+            urllib3_exceptions.MaxRetryError,
+            urllib3_exceptions.NewConnectionError,
+            urllib3_exceptions.ProtocolError,
+            urllib3_exceptions.TimeoutError,
+        ),
+    )
+
+
+_retry = retry(
+    retry=retry_if_exception(_is_transient),
+    stop=stop_after_attempt(PINECONE_MAX_RETRIES),
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
+
 
 class PineconeRepo(AbstractVectorRepo):
     def __init__(
@@ -35,6 +106,9 @@ class PineconeRepo(AbstractVectorRepo):
     ):
         super().__init__(*args, **kwargs)
         self._pc = Pinecone(api_key=get_pinecone_api_key())
+        self._executor = ThreadPoolExecutor(
+            max_workers=PINECONE_MAX_IN_FLIGHT, thread_name_prefix="pinecone"
+        )
         self._indexes: Dict[str, Index] = {
             name: self._get_or_create_index(name, dim)
             for name, dim in zip(map(str.lower, index_names), index_dims)
@@ -55,24 +129,172 @@ class PineconeRepo(AbstractVectorRepo):
                 pass
         return self._pc.Index(index_name)
 
+    @_retry
     def insert(
-        self, index_name: str, namespace: str, key: str, vec: List[float]
+        self, index_name: str, namespace: str, key: str, vec: VectorT
     ) -> None:
         index_name = index_name.lower()
         logger.info(f"Inserting {index_name=} {namespace=} {key=}")
         self._indexes[index_name].upsert(
-            vectors=[{"id": key, "values": vec}], namespace=namespace
+            vectors=[{"id": key, "values": vec.tolist()}],
+            namespace=namespace,
         )
 
+    @_retry
+    def _upsert(
+        self, index: Index, namespace: str, vectors: List[Dict[str, Any]]
+    ) -> None:
+        index.upsert(vectors=vectors, namespace=namespace)
+
+    def insert_many(
+        self,
+        index_name: str,
+        namespace: str,
+        items: Sequence[Tuple[str, VectorT]],
+    ) -> None:
+        """
+        Upsert in requests of at most PINECONE_UPSERT_BATCH_SIZE vectors,
+        with up to PINECONE_MAX_IN_FLIGHT requests in flight. Each request
+        is retried on its own, so a failed request does not resend the
+        vectors of requests that succeeded.
+        """
+        if not items:
+            return
+        index_name = index_name.lower()
+        logger.info(f"Inserting {index_name=} {namespace=} n={len(items)}")
+        index = self._indexes[index_name]
+        futures = [
+            self._executor.submit(
+                self._upsert,
+                index,
+                namespace,
+                [
+                    {"id": key, "values": vec.tolist()}
+                    for key, vec in items[i : i + PINECONE_UPSERT_BATCH_SIZE]
+                ],
+            )
+            for i in range(0, len(items), PINECONE_UPSERT_BATCH_SIZE)
+        ]
+        # wait for every request before raising the first failure
+        errors = [e for future in futures if (e := future.exception())]
+        if errors:
+            raise errors[0]
+
+    @_retry
+    def delete(
+        self, index_name: str, namespace: str, keys: Sequence[str]
+    ) -> None:
+        index_name = index_name.lower()
+        logger.info(f"Deleting {index_name=} {namespace=} n={len(keys)}")
+        # pinecone deletes at most 1000 ids per request
+        for i in range(0, len(keys), 1000):
+            self._indexes[index_name].delete(
+                ids=list(keys[i : i + 1000]), namespace=namespace
+            )
+
+    @_retry
     def query(
-        self, index_name: str, namespace: str, vec: List[float], top_k: int = 5
-    ) -> List[str]:
+        self, index_name: str, namespace: str, vec: VectorT, top_k: int = 5
+    ) -> ScoredKeysT:
         index_name = index_name.lower()
         results = self._indexes[index_name].query(
             namespace=namespace,
-            vector=vec,
+            vector=vec.tolist(),
             top_k=top_k,
             include_values=False,
             include_metadata=False,
         )
-        return list(map(lambda match: match["id"], results["matches"]))
+        return [(match["id"], match["score"]) for match in results["matches"]]
+
+    def query_many(
+        self,
+        index_name: str,
+        namespace: str,
+        vecs: Sequence[VectorT],
+        top_k: int = 5,
+    ) -> List[ScoredKeysT]:
+        """Run the queries concurrently, up to PINECONE_MAX_IN_FLIGHT"""
+        return list(
+            self._executor.map(
+                lambda vec: self.query(index_name, namespace, vec, top_k),
+                vecs,
+            )
+        )
+
+
+class LocalVectorRepo(AbstractVectorRepo):
+    """
+    Vector repo on the local disk, with a LocalVectorIndex per
+    (index, namespace) under `root`. Queries involve no network hop,
+    and query_many scores all its queries in one matrix product.
+    """
+
+    def __init__(
+        self,
+        index_names: Iterable[str],
+        index_dims: Iterable[int],
+        root: str = LOCAL_VECTOR_REPO_PATH,
+    ):
+        super().__init__()
+        self._root = Path(root)
+        self._dims: Dict[str, int] = dict(
+            zip(map(str.lower, index_names), index_dims)
+        )
+        self._indexes: Dict[Tuple[str, str], LocalVectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def _get_index(
+        self, index_name: str, namespace: str, create: bool = False
+    ) -> Optional[LocalVectorIndex]:
+        index_name = index_name.lower()
+        with self._lock:
+            index = self._indexes.get((index_name, namespace))
+            if index is None:
+                digest = sha256(namespace.encode("utf-8")).hexdigest()
+                path = self._root / index_name / digest
+                if not create and not path.exists():
+                    return None
+                index = LocalVectorIndex(path, self._dims[index_name])
+                self._indexes[(index_name, namespace)] = index
+            return index
+
+    def insert(
+        self, index_name: str, namespace: str, key: str, vec: VectorT
+    ) -> None:
+        self.insert_many(index_name, namespace, [(key, vec)])
+
+    def insert_many(
+        self,
+        index_name: str,
+        namespace: str,
+        items: Sequence[Tuple[str, VectorT]],
+    ) -> None:
+        if not items:
+            return
+        logger.info(f"Inserting {index_name=} {namespace=} n={len(items)}")
+        index = self._get_index(index_name, namespace, create=True)
+        assert index is not None
+        index.insert_many(items)
+
+    def delete(
+        self, index_name: str, namespace: str, keys: Sequence[str]
+    ) -> None:
+        if (index := self._get_index(index_name, namespace)) is not None:
+            index.delete(keys)
+
+    def query(
+        self, index_name: str, namespace: str, vec: VectorT, top_k: int = 5
+    ) -> ScoredKeysT:
+        return self.query_many(index_name, namespace, [vec], top_k)[0]
+
+    def query_many(
+        self,
+        index_name: str,
+        namespace: str,
+        vecs: Sequence[VectorT],
+        top_k: int = 5,
+    ) -> List[ScoredKeysT]:
+        index = self._get_index(index_name, namespace)
+        if index is None:
+            return [[] for _ in vecs]
+        return index.search(np.stack(vecs), top_k)
@@ -1,9 +1,13 @@
 from adapters.rerankers.base import AbstractReranker
 from adapters.rerankers.bge import BgeReranker
 from adapters.rerankers.colpali import ColpaliReranker
+from adapters.rerankers.lazy import LazyReranker
+from adapters.rerankers.remote import RemoteReranker
 
 __all__ = [
     "AbstractReranker",
     "BgeReranker",
     "ColpaliReranker",
+    "LazyReranker",
+    "RemoteReranker",
 ]
@@ -1,15 +1,47 @@
 import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Iterable, Iterator
+from typing import Iterator, List, Optional, Sequence, Tuple
 
 logger = logging.getLogger(__name__)
 
 TOP_K = 5
 
 
+def deadline_after(timeout_s: Optional[float]) -> Optional[float]:
+    return None if timeout_s is None else time.monotonic() + timeout_s
+
+
+def check_deadline(deadline: Optional[float]) -> None:
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError("Reranking exceeded its time budget")
+
+
 class AbstractReranker(ABC):
     @abstractmethod
     def rerank(
-        self, query: str, candidates: Iterator[bytes], top_k: int = TOP_K
-    ) -> Iterable[int]:
+        self,
+        query: str,
+        candidates: Iterator[bytes],
+        top_k: int = TOP_K,
+        keys: Optional[Sequence[str]] = None,
+        timeout_s: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Rank `candidates` against `query` and return the indices and
+        scores of the top_k candidates, best first. Scores are only
+        comparable between candidates of the same reranker. `keys` are
+        the storage keys of the candidates, for rerankers that
+        precompute candidate state.
+        Candidates are fetched lazily, so rerankers that do not need
+        the candidate objects should not consume them.
+        Rerankers raise TimeoutError between their batches once
+        reranking takes longer than `timeout_s`.
+        """
         raise NotImplementedError
+
+    def index(self, keys: Sequence[str], objs: Sequence[bytes]) -> None:
+        """
+        Precompute whatever `rerank` needs about objs ahead of query
+        time. Rerankers without precomputed state do nothing.
+        """
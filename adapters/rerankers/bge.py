@@ -1,47 +1,99 @@
 import logging
-from typing import Iterable, Iterator
+from typing import Iterator, List, Optional, Sequence, Tuple
 
+import torch
 from transformers import (  # type: ignore
     AutoModelForSequenceClassification,
     AutoTokenizer,
 )
 
-from adapters.rerankers.base import TOP_K, AbstractReranker
+from adapters.common import length_buckets
+from adapters.precision import Precision, apply_precision
+from adapters.rerankers.base import (
+    TOP_K,
+    AbstractReranker,
+    check_deadline,
+    deadline_after,
+)
+from adapters.warm_start import load_pretrained
+from config import (
+    BGE_BATCH_SIZE,
+    BGE_MAX_LENGTH,
+    BGE_MIN_SCORE,
+    MODEL_PRECISION,
+)
 
 logger = logging.getLogger(__name__)
 
 
 class BgeReranker(AbstractReranker):
-    def __init__(self):
+    def __init__(
+        self,
+        batch_size: int = BGE_BATCH_SIZE,
+        max_length: int = BGE_MAX_LENGTH,
+        min_score: Optional[float] = BGE_MIN_SCORE,
+        precision: Precision = Precision(MODEL_PRECISION),
+    ):
         logger.info("Initializing BAAI/bge-reranker-v2-m3")
         self._tokenizer = AutoTokenizer.from_pretrained(
             "BAAI/bge-reranker-v2-m3",
             local_files_only=True,
         )
-        self._model = AutoModelForSequenceClassification.from_pretrained(
-            "BAAI/bge-reranker-v2-m3",
-            local_files_only=True,
-        ).eval()
+        self._model = apply_precision(
+            load_pretrained(
+                AutoModelForSequenceClassification,
+                "BAAI/bge-reranker-v2-m3",
+                local_files_only=True,
+            ).eval(),
+            precision,
+        )
+        self._batch_size = batch_size
+        self._max_length = max_length
+        self._min_score = min_score
 
     def rerank(
-        self, query: str, candidates: Iterator[bytes], top_k: int = TOP_K
-    ) -> Iterable[int]:
-        pairs = [
-            (query, candidate.decode("utf-8")) for candidate in candidates
-        ]
-        inputs = self._tokenizer(
-            pairs,
-            padding=True,
+        self,
+        query: str,
+        candidates: Iterator[bytes],
+        top_k: int = TOP_K,
+        keys: Optional[Sequence[str]] = None,
+        timeout_s: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Score query/candidate pairs in mini-batches of similar token
+        length, so that padding is bounded by the longest pair in the
+        batch rather than the longest candidate. Candidates scoring
+        below `min_score` are cut from the results.
+        """
+        deadline = deadline_after(timeout_s)
+        texts = [candidate.decode("utf-8") for candidate in candidates]
+        if not texts:
+            return []
+
+        encodings = self._tokenizer(
+            [query] * len(texts),
+            texts,
             truncation=True,
-            return_tensors="pt",
-            max_length=512,
+            max_length=self._max_length,
         )
-        scores = (
-            self._model(**inputs, return_dict=True)
-            .logits.view(
-                -1,
-            )
-            .float()
-        )
-        idx_scores = zip(scores, range(len(scores)))
-        return [i for _, i in sorted(idx_scores, reverse=True)[:top_k]]
+        scores = torch.empty(len(texts))
+        with torch.inference_mode():
+            for bucket in length_buckets(
+                list(map(len, encodings["input_ids"])), self._batch_size
+            ):
+                check_deadline(deadline)
+                inputs = self._tokenizer.pad(
+                    {
+                        name: [values[i] for i in bucket]
+                        for name, values in encodings.items()
+                    },
+                    return_tensors="pt",
+                )
+                logits = self._model(**inputs, return_dict=True).logits
+                scores[bucket] = logits.view(-1).float()
+
+        top_scores, top_idxs = torch.topk(scores, min(top_k, len(texts)))
+        if self._min_score is not None:
+            keep = top_scores >= self._min_score
+            top_scores, top_idxs = top_scores[keep], top_idxs[keep]
+        return list(zip(top_idxs.tolist(), top_scores.tolist()))
@@ -1,66 +1,193 @@
+import hashlib
 import logging
+import time
 from io import BytesIO
-from typing import Iterable, Iterator
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
 import torch
 from colpali_engine.models import ColPali, ColPaliProcessor  # type: ignore
 from PIL import Image
 
-from adapters.rerankers.base import TOP_K, AbstractReranker
+from adapters.cache import AbstractCache
+from adapters.doc_store import MultiVectorStore
+from adapters.rerankers.base import (
+    TOP_K,
+    AbstractReranker,
+    check_deadline,
+    deadline_after,
+)
+from adapters.storage import StorageFetcher
+from adapters.warm_start import load_pretrained
 from config import DEVICE
 
 logger = logging.getLogger(__name__)
 
+InputsT = Dict[str, torch.Tensor]
+
+BATCH_SIZE = 8
+
+
+def _open(data: bytes) -> Image.Image:
+    return Image.open(BytesIO(data))
+
 
 class ColpaliReranker(AbstractReranker):
-    def __init__(self):
+    def __init__(
+        self,
+        inputs_cache: Optional[AbstractCache[InputsT]] = None,
+        doc_store: Optional[MultiVectorStore] = None,
+        storage_fetcher: Optional[StorageFetcher] = None,
+    ):
         logger.info("Initializing vidore/colpali-v1.2")
-        self._model = ColPali.from_pretrained(
-            "vidore/colpali-v1.2",
-            torch_dtype=torch.bfloat16,
-            device_map=DEVICE,
-            local_files_only=True,
-        ).eval()
+        self._model = (
+            load_pretrained(
+                ColPali,
+                "vidore/colpali-v1.2",
+                torch_dtype=torch.bfloat16,
+                device_map=DEVICE,
+                local_files_only=True,
+            )
+            .to(DEVICE)
+            .eval()
+        )
         self._processor = ColPaliProcessor.from_pretrained(
             "vidore/colpali-v1.2",
             local_files_only=True,
         )
+        self._inputs_cache = inputs_cache
+        self._doc_store = doc_store
+        self._storage_fetcher = storage_fetcher
 
-    def rerank(
-        self, query: str, candidates: Iterator[bytes], top_k: int = TOP_K
-    ) -> Iterable[int]:
-        BATCH_SIZE = 8
+    @staticmethod
+    def inputs_nbytes(inputs: InputsT) -> int:
+        return sum(t.nelement() * t.element_size() for t in inputs.values())
 
-        scores = []
-        text_input = self._processor.process_queries([query]).to(DEVICE)
-        with torch.no_grad():
-            text_emb = self._model(**text_input)
+    def _process_image(self, data: bytes) -> InputsT:
+        """
+        Decode and preprocess a single image on the CPU, reusing cached
+        inputs of identical images
+        """
+        if self._inputs_cache is None:
+            return dict(self._processor.process_images([_open(data)]))
 
-        done = False
-        while not done:
-            batch_imgs = []
+        key = hashlib.sha256(data).hexdigest()
+        if (inputs := self._inputs_cache.get(key)) is None:
+            inputs = dict(self._processor.process_images([_open(data)]))
+            self._inputs_cache.set(key, inputs)
+        return inputs
 
-            for _ in range(BATCH_SIZE):
-                try:
-                    img = Image.open(BytesIO(next(candidates)))
-                    batch_imgs.append(img)
-                except StopIteration:
-                    done = True
-                    break
+    def _embed_images(
+        self, images: Iterator[bytes], deadline: Optional[float] = None
+    ) -> List[torch.Tensor]:
+        """Embed images in batches into (n_tokens, dim) multi-vectors"""
+        embs: List[torch.Tensor] = []
+        while batch := list(islice(images, BATCH_SIZE)):
+            check_deadline(deadline)
+            batch_inputs = [self._process_image(data) for data in batch]
+            batch_img_inputs = {
+                name: torch.cat([inputs[name] for inputs in batch_inputs])
+                for name in batch_inputs[0]
+            }
+            with torch.no_grad():
+                img_embs = self._model(
+                    **{
+                        name: tensor.to(DEVICE)
+                        for name, tensor in batch_img_inputs.items()
+                    }
+                )
+            embs.extend(img_embs)
+        return embs
 
-            if not batch_imgs:
-                break
+    def _store(self, key: str, emb: torch.Tensor) -> None:
+        assert self._doc_store
+        self._doc_store.put(key, emb.to(torch.float16).cpu().numpy())
 
-            batch_img_inputs = self._processor.process_images(batch_imgs).to(
-                DEVICE
-            )
-            with torch.no_grad():
-                img_embs = self._model(**batch_img_inputs)
+    def _load_doc_embs(
+        self,
+        keys: Sequence[str],
+        candidates: Iterator[bytes],
+        deadline: Optional[float],
+    ) -> List[torch.Tensor]:
+        """
+        Load precomputed candidate embeddings. Only candidates without a
+        precomputed embedding are fetched and embedded, and their
+        embeddings are stored for later queries. Without a storage
+        fetcher, `candidates` is read up to the last missing one.
+        """
+        assert self._doc_store
+        stored = [self._doc_store.get(key) for key in keys]
+        missing = [i for i, emb in enumerate(stored) if emb is None]
+        logger.info(f"{len(keys) - len(missing)}/{len(keys)} precomputed")
+
+        embs: List[Optional[torch.Tensor]] = [
+            None if emb is None else torch.from_numpy(np.array(emb))
+            for emb in stored
+        ]
+        if missing:
+            missing_objs: Iterator[bytes]
+            if self._storage_fetcher:
+                missing_objs = self._storage_fetcher.fetch_many(
+                    [keys[i] for i in missing],
+                    None if deadline is None else deadline - time.monotonic(),
+                )
+            else:
+                missing_set = set(missing)
+                missing_objs = (
+                    obj
+                    for i, obj in enumerate(
+                        islice(candidates, missing[-1] + 1)
+                    )
+                    if i in missing_set
+                )
+            missing_embs = self._embed_images(missing_objs, deadline)
+            for i, emb in zip(missing, missing_embs):
+                self._store(keys[i], emb)
+                embs[i] = emb
+
+        res: List[torch.Tensor] = []
+        for key, emb in zip(keys, embs):
+            if emb is None:
+                raise ValueError(f"No candidate object for {key=}")
+            res.append(emb.to(DEVICE, dtype=torch.bfloat16))
+        return res
+
+    def index(self, keys: Sequence[str], objs: Sequence[bytes]) -> None:
+        if not self._doc_store:
+            return
+        todo = [i for i, key in enumerate(keys) if key not in self._doc_store]
+        embs = self._embed_images(objs[i] for i in todo)
+        for i, emb in zip(todo, embs):
+            self._store(keys[i], emb)
+
+    def rerank(
+        self,
+        query: str,
+        candidates: Iterator[bytes],
+        top_k: int = TOP_K,
+        keys: Optional[Sequence[str]] = None,
+        timeout_s: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        deadline = deadline_after(timeout_s)
+        text_input = self._processor.process_queries([query]).to(DEVICE)
+        with torch.no_grad():
+            text_emb = self._model(**text_input)
+
+        if self._doc_store and keys is not None:
+            doc_embs = self._load_doc_embs(keys, candidates, deadline)
+        else:
+            doc_embs = self._embed_images(candidates, deadline)
+        if not doc_embs:
+            return []
 
-            batch_scores = self._processor.score_multi_vector(
-                text_emb, img_embs
-            ).reshape(-1)
-            scores.extend(batch_scores)
+        scores = self._processor.score_multi_vector(
+            text_emb, doc_embs
+        ).reshape(-1)
         logger.info(scores)
-        idx_scores = zip(scores, range(len(scores)))
-        return [i for _, i in sorted(idx_scores, reverse=True)[:top_k]]
+        if self._inputs_cache is not None:
+            logger.debug(f"ColPali inputs cache {self._inputs_cache.stats}")
+        idx_scores = zip(scores.tolist(), range(len(scores)))
+        return [
+            (i, score) for score, i in sorted(idx_scores, reverse=True)[:top_k]
+        ]
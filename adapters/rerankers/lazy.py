@@ -0,0 +1,36 @@
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from adapters.model_registry import ModelRegistry
+from adapters.rerankers.base import TOP_K, AbstractReranker
+
+
+class LazyReranker(AbstractReranker):
+    """
+    Proxy of the reranker `name` of `registry`, loaded by `loader` on
+    first use
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        name: str,
+        loader: Callable[[], AbstractReranker],
+    ):
+        registry.register(name, loader)
+        self._registry = registry
+        self._name = name
+
+    def rerank(
+        self,
+        query: str,
+        candidates: Iterator[bytes],
+        top_k: int = TOP_K,
+        keys: Optional[Sequence[str]] = None,
+        timeout_s: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        with self._registry.acquire(self._name) as reranker:
+            return reranker.rerank(query, candidates, top_k, keys, timeout_s)
+
+    def index(self, keys: Sequence[str], objs: Sequence[bytes]) -> None:
+        with self._registry.acquire(self._name) as reranker:
+            reranker.index(keys, objs)
@@ -0,0 +1,33 @@
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from event_core.domain.types import Element
+
+from adapters.model_client import RERANK, ModelServerClient
+from adapters.rerankers.base import TOP_K, AbstractReranker
+
+
+class RemoteReranker(AbstractReranker):
+    """
+    Proxy of the model server's reranker of element type `elem`. When
+    `keys` are given, the server fetches the candidates from storage
+    itself, so candidate objects do not cross the socket and rerankers
+    with precomputed state skip fetching altogether.
+    """
+
+    def __init__(self, client: ModelServerClient, elem: Element):
+        self._client = client
+        self._elem = elem.value
+
+    def rerank(
+        self,
+        query: str,
+        candidates: Iterator[bytes],
+        top_k: int = TOP_K,
+        keys: Optional[Sequence[str]] = None,
+        timeout_s: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        objs = None if keys is not None else list(candidates)
+        keys = None if keys is None else list(keys)
+        return self._client.call(
+            RERANK, self._elem, query, top_k, keys, objs, timeout_s
+        )
@@ -0,0 +1,75 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Iterable, Iterator, Optional
+
+from event_core.adapters.services.storage import StorageClient
+
+from adapters.cache import AbstractCache
+
+logger = logging.getLogger(__name__)
+
+
+class StorageFetcher:
+    """
+    Fetches objects from storage on a bounded pool of worker threads.
+
+    `fetch_many` yields objects in the order of the keys while keeping
+    up to `prefetch` fetches in flight ahead of the consumer, so that
+    fetching overlaps with whatever the consumer does with the objects.
+
+    Objects found in `cache` are served without a round trip to storage.
+    """
+
+    def __init__(
+        self,
+        storage: StorageClient,
+        max_workers: int,
+        prefetch: int,
+        cache: Optional[AbstractCache[bytes]] = None,
+    ):
+        self._storage = storage
+        self._prefetch = prefetch
+        self._cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="storage"
+        )
+
+    def __getitem__(self, key: str) -> bytes:
+        if self._cache is None:
+            return self._storage[key]
+        if (obj := self._cache.get(key)) is None:
+            obj = self._storage[key]
+            self._cache.set(key, obj)
+        return obj
+
+    def fetch_many(
+        self, keys: Iterable[str], timeout_s: Optional[float] = None
+    ) -> Iterator[bytes]:
+        """
+        Raises TimeoutError once fetching takes longer than `timeout_s`
+        in total, e.g. the remaining time budget of a query
+        """
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        keys_iter = iter(keys)
+        in_flight: Deque[Future[bytes]] = deque()
+
+        def _fill() -> None:
+            while len(in_flight) < self._prefetch:
+                if (key := next(keys_iter, None)) is None:
+                    return
+                in_flight.append(self._executor.submit(self.__getitem__, key))
+
+        try:
+            _fill()
+            while in_flight:
+                obj = in_flight.popleft().result(
+                    None if deadline is None else deadline - time.monotonic()
+                )
+                _fill()
+                yield obj
+        finally:
+            # consumer stopped early, drop fetches that have not started
+            for future in in_flight:
+                future.cancel()
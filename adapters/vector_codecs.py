@@ -0,0 +1,212 @@
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Dict, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from adapters.common import VectorT
+from config import LOCAL_PQ_SUBVECTORS
+
+PQ_CENTROIDS = 256  # codes are uint8
+PQ_TRAIN_SAMPLES = PQ_CENTROIDS * 64
+PQ_KMEANS_ITERS = 15
+
+
+class Compression(str, Enum):
+    FP32 = "fp32"
+    FP16 = "fp16"
+    INT8 = "int8"
+    PQ = "pq"
+
+
+class VectorCodec(ABC):
+    """
+    Fixed-size encoding of unit-norm vectors. Every vector is encoded
+    into a single element of `dtype`, so that codes can be stored in
+    memory-mapped arrays, and codes are scored against queries without
+    decoding them first.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    @property
+    @abstractmethod
+    def dtype(self) -> np.dtype:
+        raise NotImplementedError
+
+    @property
+    def trained(self) -> bool:
+        return True
+
+    def train(self, vecs: VectorT) -> None:
+        pass
+
+    def state(self) -> Dict[str, npt.NDArray]:
+        return {}
+
+    def load_state(self, state: Dict[str, npt.NDArray]) -> None:
+        pass
+
+    @abstractmethod
+    def encode(self, vecs: VectorT) -> npt.NDArray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def decode(self, codes: npt.NDArray) -> VectorT:
+        raise NotImplementedError
+
+    @abstractmethod
+    def score(self, codes: npt.NDArray, queries: VectorT) -> VectorT:
+        """Approximate inner products of shape (n_queries, n_codes)"""
+        raise NotImplementedError
+
+
+class Float16Codec(VectorCodec):
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype((np.float16, self.dim))
+
+    def encode(self, vecs: VectorT) -> npt.NDArray:
+        return vecs.astype(np.float16)
+
+    def decode(self, codes: npt.NDArray) -> VectorT:
+        return codes.astype(np.float32)
+
+    def score(self, codes: npt.NDArray, queries: VectorT) -> VectorT:
+        # numpy has no fast float16 matmul
+        return queries @ codes.astype(np.float32).T
+
+
+class Int8Codec(VectorCodec):
+    """Symmetric int8 quantization with a float32 scale per vector"""
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(
+            [("codes", np.int8, (self.dim,)), ("scale", np.float32)]
+        )
+
+    def encode(self, vecs: VectorT) -> npt.NDArray:
+        scale = np.abs(vecs).max(axis=1) / 127
+        scale[scale == 0] = 1
+        codes = np.empty(len(vecs), dtype=self.dtype)
+        codes["codes"] = np.rint(vecs / scale[:, None])
+        codes["scale"] = scale
+        return codes
+
+    def decode(self, codes: npt.NDArray) -> VectorT:
+        return codes["codes"].astype(np.float32) * codes["scale"][:, None]
+
+    def score(self, codes: npt.NDArray, queries: VectorT) -> VectorT:
+        scores = queries @ codes["codes"].astype(np.float32).T
+        return scores * codes["scale"]
+
+
+class PQCodec(VectorCodec):
+    """
+    Product quantization: vectors are split into `n_subvectors`
+    subvectors, each encoded as the id of its nearest of 256 centroids
+    learned by k-means. Codes are scored through per-query lookup tables
+    of subvector inner products.
+    """
+
+    def __init__(self, dim: int, n_subvectors: int = LOCAL_PQ_SUBVECTORS):
+        super().__init__(dim)
+        if dim % n_subvectors:
+            raise ValueError(f"{dim=} is not divisible by {n_subvectors=}")
+        self._n_subvectors = n_subvectors
+        self._sub_dim = dim // n_subvectors
+        # (n_subvectors, PQ_CENTROIDS, sub_dim)
+        self._codebooks: Optional[VectorT] = None
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype((np.uint8, self._n_subvectors))
+
+    @property
+    def trained(self) -> bool:
+        return self._codebooks is not None
+
+    def _split(self, vecs: VectorT) -> VectorT:
+        """(n, dim) to (n_subvectors, n, sub_dim)"""
+        return vecs.reshape(
+            len(vecs), self._n_subvectors, self._sub_dim
+        ).transpose(1, 0, 2)
+
+    @staticmethod
+    def _nearest(subvecs: VectorT, centroids: VectorT) -> npt.NDArray[np.intp]:
+        # argmin |x - c|^2 = argmax x.c - |c|^2 / 2
+        half_norms = (centroids**2).sum(axis=1) / 2
+        return np.argmax(subvecs @ centroids.T - half_norms, axis=1)
+
+    def train(self, vecs: VectorT) -> None:
+        if len(vecs) < PQ_CENTROIDS:
+            return
+        rng = np.random.default_rng(0)
+        if len(vecs) > PQ_TRAIN_SAMPLES:
+            sample = rng.choice(len(vecs), PQ_TRAIN_SAMPLES, replace=False)
+            vecs = vecs[np.sort(sample)]
+        codebooks = []
+        for subvecs in self._split(vecs):
+            init = rng.choice(len(subvecs), PQ_CENTROIDS, replace=False)
+            centroids = subvecs[init]
+            for _ in range(PQ_KMEANS_ITERS):
+                assign = self._nearest(subvecs, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, subvecs)
+                counts = np.bincount(assign, minlength=PQ_CENTROIDS)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            codebooks.append(centroids)
+        self._codebooks = np.stack(codebooks).astype(np.float32)
+
+    def state(self) -> Dict[str, npt.NDArray]:
+        if self._codebooks is None:
+            return {}
+        return {"codebooks": self._codebooks}
+
+    def load_state(self, state: Dict[str, npt.NDArray]) -> None:
+        self._codebooks = state.get("codebooks")
+
+    def encode(self, vecs: VectorT) -> npt.NDArray:
+        assert self._codebooks is not None
+        return np.stack(
+            [
+                self._nearest(subvecs, centroids)
+                for subvecs, centroids in zip(
+                    self._split(vecs), self._codebooks
+                )
+            ],
+            axis=1,
+        ).astype(np.uint8)
+
+    def decode(self, codes: npt.NDArray) -> VectorT:
+        assert self._codebooks is not None
+        subvecs = [
+            centroids[sub_codes]
+            for centroids, sub_codes in zip(self._codebooks, codes.T)
+        ]
+        return np.concatenate(subvecs, axis=1)
+
+    def score(self, codes: npt.NDArray, queries: VectorT) -> VectorT:
+        assert self._codebooks is not None
+        # (n_queries, n_subvectors, PQ_CENTROIDS)
+        tables = np.einsum(
+            "sqd,scd->qsc", self._split(queries), self._codebooks
+        )
+        subvector_ids = np.arange(self._n_subvectors)
+        return np.stack(
+            [table[subvector_ids, codes].sum(axis=1) for table in tables]
+        )
+
+
+def build_codec(compression: Compression, dim: int) -> VectorCodec:
+    if compression == Compression.FP16:
+        return Float16Codec(dim)
+    if compression == Compression.INT8:
+        return Int8Codec(dim)
+    if compression == Compression.PQ:
+        return PQCodec(dim)
+    raise ValueError(f"No codec for {compression=}")
@@ -0,0 +1,495 @@
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from adapters.common import ScoredKeysT, VectorT
+from adapters.vector_codecs import Compression, VectorCodec, build_codec
+from config import (
+    LOCAL_IVF_MIN_VECTORS,
+    LOCAL_IVF_NPROBE,
+    LOCAL_KEEP_FULL_VECTORS,
+    LOCAL_RESCORE_FACTOR,
+    LOCAL_VECTOR_COMPRESSION,
+)
+
+logger = logging.getLogger(__name__)
+
+# rows are added to the memory-mapped files in steps of at least this many
+MIN_CAPACITY = 1024
+# rows scored per matrix product when scanning or assigning rows to lists
+SCAN_CHUNK_SIZE = 1 << 16
+KMEANS_ITERS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+
+
+def _normalized(vecs: npt.ArrayLike) -> VectorT:
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def _top_k(scores: npt.NDArray, top_k: int) -> npt.NDArray[np.intp]:
+    """Indices of the `top_k` highest scores, highest first"""
+    if top_k < len(scores):
+        idx = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def _take(store: npt.NDArray, rows: npt.NDArray[np.intp]) -> npt.NDArray:
+    """`store[rows]` for sorted rows, slicing when the rows are contiguous"""
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return store[rows[0] : rows[-1] + 1]
+    return store[rows]
+
+
+def _postings(
+    lists: npt.NDArray[np.int32], rows: npt.NDArray[np.intp], n_lists: int
+) -> List[npt.NDArray[np.intp]]:
+    """Sorted `rows` of every list, given the list of each row"""
+    order = np.argsort(lists, kind="stable")
+    bounds = np.searchsorted(lists[order], np.arange(1, n_lists))
+    return np.split(rows[order], bounds)
+
+
+def _kmeans(vecs: VectorT, k: int, seed: int = 0) -> VectorT:
+    """Spherical k-means, returning unit-norm centroids of shape (k, dim)"""
+    rng = np.random.default_rng(seed)
+    centroids = vecs[rng.choice(len(vecs), k, replace=False)]
+    for _ in range(KMEANS_ITERS):
+        assign = np.argmax(vecs @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vecs)
+        empty = ~sums.any(axis=1)
+        # reseed empty lists with random vectors
+        sums[empty] = vecs[rng.choice(len(vecs), int(empty.sum()))]
+        centroids = _normalized(sums)
+    return centroids
+
+
+class LocalVectorIndex:
+    """
+    Vectors of a single (index, namespace) on the local disk. Vectors
+    are unit-normalized, so that inner products are cosine similarities,
+    and stored in memory-mapped files with the row of every key in
+    SQLite.
+
+    With `compression` fp32, vectors are stored and scanned as float32.
+    Otherwise they are scanned as codes of the compression's codec. The
+    float32 vectors are then only kept when `keep_full_vectors` is set,
+    and are used to rescore the best `rescore_factor * top_k` rows of
+    the scan exactly. Product quantization requires them: its codebooks
+    are trained on them together with the IVF index, and until then
+    search is exact on the float32 vectors.
+
+    Search scans every row until the index holds `ivf_min_vectors`
+    vectors. From then on, an IVF index is trained with k-means, and
+    queries only scan the rows in the `nprobe` lists whose centroids are
+    nearest to the query, read from the postings of every list. The IVF
+    index is retrained whenever the index has doubled in size since the
+    last training.
+
+    Inserts and deletes are incremental. Deleted rows are masked out of
+    search and reused by later inserts.
+
+    Several handles, e.g. of different processes, can share an index.
+    Every write bumps a generation counter in SQLite, in the transaction
+    that serializes writers, and a handle reloads the key map and the
+    IVF index before searching or writing once the counter has moved.
+    Reloading reads every key, so shared indexes suit read-mostly use.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        dim: int,
+        ivf_min_vectors: int = LOCAL_IVF_MIN_VECTORS,
+        nprobe: int = LOCAL_IVF_NPROBE,
+        compression: Compression = Compression(LOCAL_VECTOR_COMPRESSION),
+        keep_full_vectors: bool = LOCAL_KEEP_FULL_VECTORS,
+        rescore_factor: int = LOCAL_RESCORE_FACTOR,
+    ):
+        root.mkdir(parents=True, exist_ok=True)
+        self._root = root
+        self._dim = dim
+        self._ivf_min_vectors = ivf_min_vectors
+        self._nprobe = nprobe
+        self._rescore_factor = rescore_factor
+        self._lock = threading.Lock()
+
+        # the storage layout of an existing index wins over the arguments
+        meta_path = root / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            compression = Compression(meta["compression"])
+            keep_full_vectors = meta["keep_full_vectors"]
+        keep_full_vectors |= compression == Compression.FP32
+        if compression == Compression.PQ and not keep_full_vectors:
+            raise ValueError("pq compression requires full vectors")
+        meta_path.write_text(
+            json.dumps(
+                {
+                    "compression": compression.value,
+                    "keep_full_vectors": keep_full_vectors,
+                }
+            )
+        )
+
+        self._compression = compression
+        self._codec: Optional[VectorCodec] = None
+        if compression != Compression.FP32:
+            self._codec = build_codec(compression, dim)
+
+        self._conn = sqlite3.connect(root / "keys.db", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS keys "
+            "(key TEXT PRIMARY KEY, row INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generation (value INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "INSERT INTO generation SELECT 0 "
+            "WHERE NOT EXISTS (SELECT * FROM generation)"
+        )
+        self._conn.commit()
+
+        # memory-mapped files, one row per vector
+        self._dtypes: Dict[str, np.dtype] = {"lists.i32": np.dtype(np.int32)}
+        if keep_full_vectors:
+            self._dtypes["vectors.f32"] = np.dtype((np.float32, dim))
+        if self._codec:
+            self._dtypes["codes.bin"] = self._codec.dtype
+        self._capacity = 0
+        self._stores: Dict[str, np.memmap] = {}
+
+        self._generation: Optional[int] = None
+        self._refresh()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def _refresh(self) -> None:
+        """Reload the state on disk if any handle has written since"""
+        (generation,) = self._conn.execute(
+            "SELECT value FROM generation"
+        ).fetchone()
+        if generation == self._generation:
+            return
+
+        self._rows: Dict[str, int] = dict(
+            self._conn.execute("SELECT key, row FROM keys").fetchall()
+        )
+        self._n_rows = max(self._rows.values(), default=-1) + 1
+        self._valid = np.zeros(0, dtype=bool)
+        self._reserve(self._n_rows)
+
+        self._keys: List[Optional[str]] = [None] * self._n_rows
+        for key, row in self._rows.items():
+            self._keys[row] = key
+            self._valid[row] = True
+        self._free = [r for r in range(self._n_rows) if not self._valid[r]]
+
+        codec_path = self._root / "codec.npz"
+        if self._codec and not self._codec.trained and codec_path.exists():
+            with np.load(codec_path) as state:
+                self._codec.load_state(dict(state))
+
+        self._centroids: Optional[VectorT] = None
+        self._trained_on = 0
+        # valid rows per list. searches read them outside the lock, so
+        # writes replace the postings of a list rather than update them
+        self._postings: List[npt.NDArray[np.intp]] = []
+        if (ivf_path := self._root / "ivf.npz").exists():
+            with np.load(ivf_path) as ivf:
+                self._centroids = ivf["centroids"]
+                self._trained_on = int(ivf["trained_on"])
+            rows = np.flatnonzero(self._valid[: self._n_rows])
+            self._postings = _postings(
+                self._stores["lists.i32"][rows], rows, len(self._centroids)
+            )
+        self._generation = generation
+
+    @contextmanager
+    def _write(self) -> Iterator[None]:
+        """
+        Transaction of a write, holding the SQLite write lock so that
+        handles write one at a time, on up to date state
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._refresh()
+            yield
+            self._conn.execute("UPDATE generation SET value = value + 1")
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            # the state in memory may be ahead of the state on disk
+            self._generation = None
+            raise
+        assert self._generation is not None
+        self._generation += 1
+
+    def _reserve(self, n_rows: int) -> None:
+        """Grow the memory-mapped files to hold at least `n_rows` rows"""
+        if n_rows > self._capacity or not self._stores:
+            capacity = max(n_rows, 2 * self._capacity, MIN_CAPACITY)
+            for name, dtype in self._dtypes.items():
+                path = self._root / name
+                with open(path, "ab") as f:
+                    if f.tell() < capacity * dtype.itemsize:
+                        f.truncate(capacity * dtype.itemsize)
+                rows = path.stat().st_size // dtype.itemsize
+                self._stores[name] = np.memmap(
+                    path, dtype=dtype, mode="r+", shape=(rows,)
+                )
+            self._capacity = min(len(store) for store in self._stores.values())
+        if len(self._valid) < self._capacity:
+            valid = np.zeros(self._capacity, dtype=bool)
+            valid[: len(self._valid)] = self._valid
+            self._valid = valid
+
+    @property
+    def _vectors(self) -> Optional[np.memmap]:
+        return self._stores.get("vectors.f32")
+
+    @property
+    def _codes(self) -> Optional[np.memmap]:
+        # codes are only usable once the codec is trained
+        if self._codec and self._codec.trained:
+            return self._stores["codes.bin"]
+        return None
+
+    def _read(self, rows: npt.NDArray[np.intp]) -> VectorT:
+        """Full vectors of `rows`, decoded from codes if not kept"""
+        if self._vectors is not None:
+            return _take(self._vectors, rows)
+        assert self._codec and self._codes is not None
+        return self._codec.decode(_take(self._codes, rows))
+
+    def _scan(
+        self,
+        rows: npt.NDArray[np.intp],
+        queries: VectorT,
+        codes: Optional[np.memmap],
+    ) -> VectorT:
+        """Scores of shape (n_queries, n_rows), approximate if `codes`"""
+        scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for i in range(0, len(rows), SCAN_CHUNK_SIZE):
+            chunk = rows[i : i + SCAN_CHUNK_SIZE]
+            if codes is not None:
+                assert self._codec
+                chunk_scores = self._codec.score(_take(codes, chunk), queries)
+            else:
+                chunk_scores = queries @ self._read(chunk).T
+            scores[:, i : i + len(chunk)] = chunk_scores
+        return scores
+
+    @staticmethod
+    def _assign(vecs: VectorT, centroids: VectorT) -> npt.NDArray[np.int32]:
+        return np.argmax(vecs @ centroids.T, axis=1).astype(np.int32)
+
+    def _repost(self, rows: npt.NDArray[np.intp], add: bool) -> None:
+        """Add `rows` to, or remove them from, the postings of their lists"""
+        if not self._postings or not len(rows):
+            return
+        rows = np.unique(rows)
+        lists = self._stores["lists.i32"][rows]
+        postings = list(self._postings)
+        for list_id in np.unique(lists):
+            list_rows = rows[lists == list_id]
+            if add:
+                postings[list_id] = np.union1d(postings[list_id], list_rows)
+            else:
+                postings[list_id] = np.setdiff1d(
+                    postings[list_id], list_rows, assume_unique=True
+                )
+        self._postings = postings
+
+    def _maybe_train(self) -> None:
+        n = len(self._rows)
+        if n < self._ivf_min_vectors or n < 2 * self._trained_on:
+            return
+
+        # at most a list per vector, as k-means seeds a list per vector
+        n_lists = min(int(np.clip(np.sqrt(n), 16, 4096)), n)
+        rows = np.flatnonzero(self._valid[: self._n_rows])
+        rng = np.random.default_rng(0)
+        sample = np.sort(
+            rng.choice(
+                rows, min(n, n_lists * KMEANS_SAMPLES_PER_LIST), replace=False
+            )
+        )
+        logger.info(f"Training IVF index of {self._root} {n=} {n_lists=}")
+        # searches run outside the lock on the published centroids, codec
+        # and lists, so the new ones are built aside and published last
+        centroids = _kmeans(self._read(sample), n_lists)
+        codec = None
+        if self._codec and not self._codec.trained:
+            logger.info(f"Training {type(self._codec).__name__}")
+            codec = build_codec(self._compression, self._dim)
+            codec.train(self._read(sample))
+            if not codec.trained:
+                codec = None
+
+        lists = np.empty(self._n_rows, dtype=np.int32)
+        for i in range(0, self._n_rows, SCAN_CHUNK_SIZE):
+            chunk = np.arange(i, min(i + SCAN_CHUNK_SIZE, self._n_rows))
+            vecs = self._read(chunk)
+            lists[chunk] = self._assign(vecs, centroids)
+            if codec:
+                # unused until the codec is published
+                self._stores["codes.bin"][chunk] = codec.encode(vecs)
+        self._stores["lists.i32"][: self._n_rows] = lists
+        self._flush()
+        if codec:
+            self._save("codec.npz", **codec.state())
+        self._save("ivf.npz", centroids=centroids, trained_on=n)
+
+        self._postings = _postings(lists[rows], rows, n_lists)
+        self._centroids = centroids
+        self._trained_on = n
+        if codec:
+            self._codec = codec
+
+    def _save(self, name: str, **arrays: npt.NDArray) -> None:
+        tmp_path = self._root / f"{name}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        tmp_path.replace(self._root / name)
+
+    def _flush(self) -> None:
+        for store in self._stores.values():
+            store.flush()
+
+    def insert_many(self, items: Sequence[Tuple[str, VectorT]]) -> None:
+        if not items:
+            return
+        vecs = _normalized([vec for _, vec in items])
+        with self._lock, self._write():
+            assigned: Dict[str, int] = {}
+            for key, _ in items:
+                if key in assigned:
+                    continue
+                row = self._rows.get(key)
+                if row is None:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = self._n_rows
+                        self._n_rows += 1
+                        self._keys.append(None)
+                assigned[key] = row
+            self._reserve(self._n_rows)
+
+            # write vectors before keys, so that no key points to a row
+            # that has not been written
+            rows = np.array([assigned[key] for key, _ in items])
+            if self._vectors is not None:
+                self._vectors[rows] = vecs
+            if self._codec and self._codec.trained:
+                self._stores["codes.bin"][rows] = self._codec.encode(vecs)
+            if self._centroids is not None:
+                # replaced vectors leave the lists of their old vectors
+                self._repost(rows[self._valid[rows]], add=False)
+                self._stores["lists.i32"][rows] = self._assign(
+                    vecs, self._centroids
+                )
+                self._repost(rows, add=True)
+            self._flush()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO keys (key, row) VALUES (?, ?)",
+                assigned.items(),
+            )
+
+            for key, row in assigned.items():
+                self._rows[key] = row
+                self._keys[row] = key
+                self._valid[row] = True
+            self._maybe_train()
+
+    def delete(self, keys: Sequence[str]) -> None:
+        with self._lock, self._write():
+            deleted = []
+            deleted_rows = []
+            for key in keys:
+                row = self._rows.pop(key, None)
+                if row is None:
+                    continue
+                self._keys[row] = None
+                self._valid[row] = False
+                self._free.append(row)
+                deleted.append((key,))
+                deleted_rows.append(row)
+            self._conn.executemany("DELETE FROM keys WHERE key = ?", deleted)
+            self._repost(np.array(deleted_rows, dtype=np.intp), add=False)
+
+    def _rank(
+        self,
+        rows: npt.NDArray[np.intp],
+        scores: VectorT,
+        query: VectorT,
+        top_k: int,
+        approximate: bool,
+    ) -> List[Tuple[int, float]]:
+        """Best `top_k` rows, rescored exactly if `scores` are approximate"""
+        if approximate and self._vectors is not None:
+            shortlist = np.sort(
+                rows[_top_k(scores, top_k * self._rescore_factor)]
+            )
+            rows, scores = shortlist, self._vectors[shortlist] @ query
+        idx = _top_k(scores, top_k)
+        return list(zip(rows[idx].tolist(), scores[idx].tolist()))
+
+    def search(self, queries: VectorT, top_k: int) -> List[ScoredKeysT]:
+        """(key, cosine similarity) of the `top_k` nearest per query"""
+        queries = _normalized(queries)
+        with self._lock:
+            self._refresh()
+            centroids = self._centroids
+            postings = self._postings
+            codes = self._codes
+            if centroids is None:
+                rows = np.flatnonzero(self._valid[: self._n_rows])
+
+        approximate = codes is not None
+        results: List[List[Tuple[int, float]]] = []
+        if centroids is None:
+            all_scores = self._scan(rows, queries, codes)
+            for query, scores in zip(queries, all_scores):
+                results.append(
+                    self._rank(rows, scores, query, top_k, approximate)
+                )
+        else:
+            probes = np.argsort(-(queries @ centroids.T), axis=1)
+            for query, query_probes in zip(queries, probes):
+                rows = np.sort(
+                    np.concatenate(
+                        [postings[i] for i in query_probes[: self._nprobe]]
+                    )
+                )
+                (scores,) = self._scan(rows, query[None], codes)
+                results.append(
+                    self._rank(rows, scores, query, top_k, approximate)
+                )
+
+        with self._lock:
+            # rows deleted while searching are dropped
+            return [
+                [
+                    (key, score)
+                    for row, score in result
+                    if (key := self._keys[row]) is not None
+                ]
+                for result in results
+            ]
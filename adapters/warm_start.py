@@ -0,0 +1,142 @@
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Type
+
+import torch
+from accelerate import init_empty_weights  # type: ignore
+from accelerate.utils import set_module_tensor_to_device  # type: ignore
+from huggingface_hub import try_to_load_from_cache
+from safetensors import safe_open
+from safetensors.torch import save_model
+from transformers import (  # type: ignore
+    AutoConfig,
+    GenerationConfig,
+    PreTrainedModel,
+)
+
+from config import WARM_START_DIR
+
+logger = logging.getLogger(__name__)
+
+# seconds spent in each startup phase of this process, by phase name
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = time.perf_counter() - start
+        logger.info(f"{name} took {STARTUP_TIMINGS[name]:.2f}s")
+
+
+def weights_revision(repo_id: str) -> str:
+    """
+    Commit of the weights of `repo_id` in the local hub cache, which are
+    the weights that from_pretrained loads with local_files_only
+    """
+    if Path(repo_id).is_dir():
+        return "local"
+    path = try_to_load_from_cache(repo_id, "config.json")
+    if not isinstance(path, str):
+        return "uncached"
+    # <cache>/models--<org>--<name>/snapshots/<commit>/config.json
+    return Path(path).parent.name[:12]
+
+
+def _bundle_path(model_cls: Type, repo_id: str) -> Path:
+    # bundles of other revisions of the weights are never read
+    revision = weights_revision(repo_id)
+    name = f"{repo_id.replace('/', '--')}@{revision}.{model_cls.__name__}"
+    return Path(WARM_START_DIR) / name
+
+
+def _write_bundle(model: PreTrainedModel, bundle: Path) -> None:
+    tmp = bundle.with_name(f"{bundle.name}.{os.getpid()}.tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    model.config.save_pretrained(tmp)
+    if model.can_generate():
+        model.generation_config.save_pretrained(tmp)
+    # tied weights are stored once, and re-tied on load
+    save_model(model, str(tmp / "model.safetensors"))
+    try:
+        tmp.rename(bundle)
+    except OSError:
+        # another process has written the bundle
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _read_bundle(
+    model_cls: Type, bundle: Path, torch_dtype: Optional[torch.dtype]
+) -> Optional[PreTrainedModel]:
+    name = bundle.name
+    with startup_phase(f"{name} config"):
+        config = AutoConfig.from_pretrained(bundle)
+
+    with startup_phase(f"{name} skeleton"):
+        # parameters on the meta device, neither allocated nor initialized
+        with init_empty_weights():
+            if issubclass(model_cls, PreTrainedModel):
+                model = model_cls._from_config(config, torch_dtype=torch_dtype)
+            else:
+                model = model_cls.from_config(config, torch_dtype=torch_dtype)
+        if (bundle / "generation_config.json").exists():
+            model.generation_config = GenerationConfig.from_pretrained(bundle)
+
+    with startup_phase(f"{name} weights"):
+        # one tensor at a time, rather than the whole state dict at once
+        with safe_open(str(bundle / "model.safetensors"), "pt") as f:
+            for tensor_name in f.keys():
+                set_module_tensor_to_device(
+                    model, tensor_name, "cpu", value=f.get_tensor(tensor_name)
+                )
+        model.tie_weights()
+
+    if any(t.is_meta for t in (*model.parameters(), *model.buffers())):
+        logger.warning(f"Warm start bundle {bundle} is incomplete")
+        return None
+    return model.eval()
+
+
+def load_pretrained(
+    model_cls: Type,
+    repo_id: str,
+    torch_dtype: Optional[torch.dtype] = None,
+    **kwargs: Any,
+) -> PreTrainedModel:
+    """
+    `model_cls.from_pretrained(repo_id, torch_dtype=torch_dtype, **kwargs)`,
+    served from a warm start bundle under WARM_START_DIR when there is
+    one. A bundle is the model config next to a single safetensors file
+    of the loaded weights, written by the first load of the model.
+
+    Loading a bundle skips resolving and converting checkpoints and
+    initializing weights. The module is built on the meta device and
+    the tensors streamed from the safetensors file are assigned to it.
+    Bundles are per revision of the weights in the hub cache, and a
+    bundle missing any tensor is replaced by a fresh load.
+    Precision conversion, e.g. int8 quantization, is not part of the
+    bundle and is applied by the caller after loading, as usual.
+    """
+    if WARM_START_DIR:
+        bundle = _bundle_path(model_cls, repo_id)
+        if (bundle / "model.safetensors").exists():
+            model = _read_bundle(model_cls, bundle, torch_dtype)
+            if model is not None:
+                return model
+            shutil.rmtree(bundle, ignore_errors=True)
+
+    with startup_phase(f"{repo_id} from_pretrained"):
+        model = model_cls.from_pretrained(
+            repo_id, torch_dtype=torch_dtype, **kwargs
+        )
+    if WARM_START_DIR:
+        with startup_phase(f"{repo_id} write warm start bundle"):
+            _write_bundle(model, _bundle_path(model_cls, repo_id))
+    return model
@@ -0,0 +1,504 @@
+import argparse
+import itertools
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from event_core.domain.events.elements import (
+    CodeElementStored,
+    ImageElementStored,
+    PlotElementStored,
+    TextElementStored,
+)
+from event_core.domain.types import Element
+
+from adapters.embedders import (
+    AbstractEmbeddingModel,
+    CLIPTextModel,
+    CLIPVisionModel,
+    DePlotModel,
+    UniXCoderModel,
+)
+from adapters.repository import LocalVectorRepo
+from adapters.rerankers import AbstractReranker, BgeReranker, ColpaliReranker
+from adapters.storage import StorageFetcher
+from config import (
+    CANDIDATE_PREFETCH,
+    DEVICE,
+    EMBED_BATCH_SIZE,
+    EMBEDDER_BACKENDS,
+    LOCAL_VECTOR_COMPRESSION,
+    MODEL_PRECISION,
+    STORAGE_FETCH_WORKERS,
+)
+import handlers
+from handlers import handle_element, handle_elements, handle_query_text
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path("tests/data")
+SAMPLE_FILES = {
+    "text": "text.txt",
+    "code": "code.py",
+    "image": "image.png",
+    "plot": "plot.png",
+}
+QUERY = "a chart of the quarterly revenue by region"
+
+RowT = Dict[str, Any]
+
+# every model under benchmark, with the kind of sample it takes
+MODELS: Dict[str, Tuple[Callable[["_Models"], Any], str]] = {
+    "CLIPTextModel": (lambda models: CLIPTextModel(), "text"),
+    "CLIPVisionModel": (lambda models: CLIPVisionModel(), "image"),
+    "DePlotModel": (
+        lambda models: DePlotModel(models.get("CLIPTextModel")),
+        "plot",
+    ),
+    "UniXCoderModel": (lambda models: UniXCoderModel(), "code"),
+    "BgeReranker": (lambda models: BgeReranker(), "text"),
+    "ColpaliReranker": (lambda models: ColpaliReranker(), "image"),
+}
+# ColPali is opt in, since it takes a 3B parameter model
+DEFAULT_MODELS = [name for name in MODELS if name != "ColpaliReranker"]
+# parameters identifying a result row, as opposed to its measurements
+ROW_KEYS = ("suite", "name", "batch_size", "input_chars")
+
+
+class _Models:
+    """Models under benchmark, each loaded once on first use"""
+
+    def __init__(self):
+        self._models: Dict[str, Any] = {}
+        self.load_s: Dict[str, float] = {}
+
+    def get(self, name: str) -> Any:
+        if name not in self._models:
+            start = time.perf_counter()
+            self._models[name] = MODELS[name][0](self)
+            self.load_s[name] = time.perf_counter() - start
+            logger.info(f"Loaded {name} in {self.load_s[name]:.2f}s")
+        return self._models[name]
+
+
+class _TimeoutCounter(logging.Filter):
+    """Counts the element type queries the handlers log as timed out"""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.getMessage().startswith("Timed out querying"):
+            self.count += 1
+        return True
+
+
+def _of_length(sample: bytes, n_chars: int) -> bytes:
+    text = sample.decode("utf-8")
+    return (text * (n_chars // len(text) + 1))[:n_chars].encode("utf-8")
+
+
+def _inputs(
+    kind: str, samples: Dict[str, bytes], lengths: Sequence[int]
+) -> List[Tuple[Optional[int], bytes]]:
+    """Inputs of each length, or the sample itself for images"""
+    if kind in ("image", "plot"):
+        return [(None, samples[kind])]
+    return [(n, _of_length(samples[kind], n)) for n in lengths]
+
+
+def _timed(fn: Callable[[], Any], repeats: int, warmup: int) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _row(
+    suite: str,
+    name: str,
+    items_per_call: int,
+    latencies: Sequence[float],
+    batch_size: Optional[int] = None,
+    input_chars: Optional[int] = None,
+) -> RowT:
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1e3, [50, 95, 99])
+    row = {
+        "suite": suite,
+        "name": name,
+        "batch_size": batch_size,
+        "input_chars": input_chars,
+        "calls": len(latencies),
+        "items_per_s": items_per_call * len(latencies) / sum(latencies),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+    }
+    logger.info(
+        f"{suite} {name} {batch_size=} {input_chars=}:"
+        f" {row['items_per_s']:.1f} items/s,"
+        f" p50 {p50:.1f}ms p95 {p95:.1f}ms p99 {p99:.1f}ms"
+    )
+    return row
+
+
+def bench_embedder(
+    name: str,
+    model: AbstractEmbeddingModel,
+    inputs: List[Tuple[Optional[int], bytes]],
+    batch_sizes: Sequence[int],
+    repeats: int,
+    warmup: int,
+) -> List[RowT]:
+    rows = []
+    for n_chars, data in inputs:
+        for batch_size in batch_sizes:
+            fn = (
+                partial(model.embed, data)
+                if batch_size == 1
+                else partial(model.embed_many, [data] * batch_size)
+            )
+            latencies = _timed(fn, repeats, warmup)
+            rows.append(
+                _row(
+                    "embedder",
+                    name,
+                    batch_size,
+                    latencies,
+                    batch_size,
+                    n_chars,
+                )
+            )
+    return rows
+
+
+def _rerank(reranker: AbstractReranker, candidates: List[bytes]) -> None:
+    reranker.rerank(QUERY, iter(candidates), len(candidates))
+
+
+def bench_reranker(
+    name: str,
+    reranker: AbstractReranker,
+    inputs: List[Tuple[Optional[int], bytes]],
+    batch_sizes: Sequence[int],
+    repeats: int,
+    warmup: int,
+) -> List[RowT]:
+    """Reranks `batch_size` candidates per call"""
+    rows = []
+    for n_chars, data in inputs:
+        for batch_size in batch_sizes:
+            fn = partial(_rerank, reranker, [data] * batch_size)
+            latencies = _timed(fn, repeats, warmup)
+            rows.append(
+                _row(
+                    "reranker",
+                    name,
+                    batch_size,
+                    latencies,
+                    batch_size,
+                    n_chars,
+                )
+            )
+    return rows
+
+
+def bench_end_to_end(
+    models: _Models,
+    rerankers: Dict[Element, AbstractReranker],
+    samples: Dict[str, bytes],
+    n_elements: int,
+    top_n: int,
+    repeats: int,
+    warmup: int,
+    query_timeout_s: float,
+) -> List[RowT]:
+    """
+    Ingests `n_elements` elements of each element type into a dict
+    standing in for storage and a LocalVectorRepo in a temporary
+    directory, then queries them through the handlers.
+
+    Element types whose query takes longer than `query_timeout_s` are
+    dropped from the results, which would make slow queries look fast,
+    so they are counted in the row's `timeouts`.
+    """
+    text_model = models.get("CLIPTextModel")
+    code_model = models.get("UniXCoderModel")
+    model_factory: Dict[Any, AbstractEmbeddingModel] = {
+        TextElementStored: text_model,
+        ImageElementStored: models.get("CLIPVisionModel"),
+        PlotElementStored: models.get("DePlotModel"),
+        CodeElementStored: code_model,
+    }
+    query_model_factory = {
+        Element.IMAGE: text_model,
+        Element.TEXT: text_model,
+        Element.PLOT: text_model,
+        Element.CODE: code_model,
+    }
+
+    storage: Dict[str, bytes] = {}
+    events = []
+    for event_cls, kind in (
+        (TextElementStored, "text"),
+        (ImageElementStored, "image"),
+        (PlotElementStored, "plot"),
+        (CodeElementStored, "code"),
+    ):
+        for i in range(n_elements):
+            key = f"bench/{kind}-{i}"
+            obj = samples[kind]
+            if kind in ("text", "code"):
+                # distinct objects, so that candidates are not all ties
+                obj += f"\n{i}".encode("utf-8")
+            storage[key] = obj
+            events.append(event_cls(key=key))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as root:
+        vec_repo = LocalVectorRepo(
+            (elem.value for elem in query_model_factory),
+            (model.EMBEDDING_DIM for model in query_model_factory.values()),
+            root=root,
+        )
+        handler_kwargs: Dict[str, Any] = dict(
+            storage=storage,
+            vec_repo=vec_repo,
+            model_factory=model_factory,
+            ingest_reranker_factory={},
+        )
+        start = time.perf_counter()
+        handle_elements(events, **handler_kwargs)
+        elapsed = time.perf_counter() - start
+        rows.append(
+            _row("end_to_end", "handle_elements", len(events), [elapsed])
+        )
+
+        # events are re-ingested in turn, overwriting their vectors
+        events_iter = itertools.cycle(events)
+        latencies = _timed(
+            lambda: handle_element(next(events_iter), **handler_kwargs),
+            repeats,
+            warmup,
+        )
+        rows.append(_row("end_to_end", "handle_element", 1, latencies))
+
+        storage_fetcher = StorageFetcher(
+            storage, STORAGE_FETCH_WORKERS, CANDIDATE_PREFETCH
+        )
+        timeouts = _TimeoutCounter()
+        handlers.logger.addFilter(timeouts)
+        default_timeout_s = handlers.QUERY_MODAL_TIMEOUT_S
+        handlers.QUERY_MODAL_TIMEOUT_S = query_timeout_s
+        try:
+            latencies = _timed(
+                lambda: handle_query_text(
+                    "bench",
+                    QUERY,
+                    top_n,
+                    storage_fetcher=storage_fetcher,
+                    vec_repo=vec_repo,
+                    query_model_factory=query_model_factory,
+                    reranker_factory=rerankers,
+                ),
+                repeats,
+                warmup,
+            )
+        finally:
+            handlers.QUERY_MODAL_TIMEOUT_S = default_timeout_s
+            handlers.logger.removeFilter(timeouts)
+        row = _row("end_to_end", "handle_query_text", 1, latencies)
+        row["timeouts"] = timeouts.count
+        if timeouts.count:
+            logger.warning(f"{timeouts.count} element type queries timed out")
+        rows.append(row)
+    return rows
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment() -> Dict[str, Any]:
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "machine": platform.machine(),
+        "device": str(DEVICE),
+        "torch_threads": torch.get_num_threads(),
+        "config": {
+            "MODEL_PRECISION": MODEL_PRECISION,
+            "EMBEDDER_BACKENDS": EMBEDDER_BACKENDS,
+            "EMBED_BATCH_SIZE": EMBED_BATCH_SIZE,
+            "LOCAL_VECTOR_COMPRESSION": LOCAL_VECTOR_COMPRESSION,
+        },
+    }
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """
+    Compares the rows of `results` to those of `baseline` with the same
+    parameters. Returns the rows whose throughput dropped or whose p95
+    latency grew by more than `tolerance`, as a fraction, or that timed
+    out more often.
+    """
+    baseline_rows = {
+        tuple(row[key] for key in ROW_KEYS): row for row in baseline["rows"]
+    }
+    regressions = []
+    for row in results["rows"]:
+        params = tuple(row[key] for key in ROW_KEYS)
+        if (base := baseline_rows.get(params)) is None:
+            continue
+        throughput = row["items_per_s"] / base["items_per_s"]
+        p95 = row["p95_ms"] / base["p95_ms"]
+        line = (
+            f"{' '.join(map(str, params))}:"
+            f" items/s x{throughput:.2f}, p95 x{p95:.2f}"
+        )
+        timeouts = row.get("timeouts", 0)
+        if timeouts or base.get("timeouts", 0):
+            line += f", timeouts {base.get('timeouts', 0)} -> {timeouts}"
+        print(line)
+        if (
+            throughput < 1 - tolerance
+            or p95 > 1 + tolerance
+            or timeouts > base.get("timeouts", 0)
+        ):
+            regressions.append(line)
+    return regressions
+
+
+def _ints(arg: str) -> List[int]:
+    return [int(item) for item in arg.split(",")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark embedders, rerankers and the handlers"
+    )
+    parser.add_argument(
+        "--models",
+        type=lambda arg: arg.split(","),
+        default=DEFAULT_MODELS,
+        help=f"comma separated, of {', '.join(MODELS)}",
+    )
+    parser.add_argument("--batch-sizes", type=_ints, default=[1, 8, 32])
+    parser.add_argument(
+        "--lengths",
+        type=_ints,
+        default=[64, 512, 4096],
+        help="input lengths in characters of text and code inputs",
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument(
+        "--elements",
+        type=int,
+        default=32,
+        help="elements per element type ingested by the end-to-end run",
+    )
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument(
+        "--query-timeout-s",
+        type=float,
+        default=600,
+        help="time budget of each element type query, timeouts are counted",
+    )
+    parser.add_argument("--skip-end-to-end", action="store_true")
+    parser.add_argument(
+        "--output", type=Path, help="defaults to .cache/benchmarks/"
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="results to compare with, exits with 1 on regressions",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    samples = {
+        kind: (DATA_DIR / filename).read_bytes()
+        for kind, filename in SAMPLE_FILES.items()
+    }
+    models = _Models()
+    rows: List[RowT] = []
+    for name in args.models:
+        model = models.get(name)
+        kind = MODELS[name][1]
+        bench = (
+            bench_reranker
+            if isinstance(model, AbstractReranker)
+            else bench_embedder
+        )
+        rows += bench(
+            name,
+            model,
+            _inputs(kind, samples, args.lengths),
+            args.batch_sizes,
+            args.repeats,
+            args.warmup,
+        )
+
+    if not args.skip_end_to_end:
+        rerankers = {}
+        if "BgeReranker" in args.models:
+            rerankers[Element.TEXT] = models.get("BgeReranker")
+        if "ColpaliReranker" in args.models:
+            rerankers[Element.IMAGE] = models.get("ColpaliReranker")
+        rows += bench_end_to_end(
+            models,
+            rerankers,
+            samples,
+            args.elements,
+            args.top_n,
+            args.repeats,
+            args.warmup,
+            args.query_timeout_s,
+        )
+
+    results = {**_environment(), "load_s": models.load_s, "rows": rows}
+    output = args.output or Path(
+        f".cache/benchmarks/{results['commit'] or 'unknown'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    logger.info(f"Wrote results to {output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond {args.tolerance}:")
+            print("\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -8,55 +8,258 @@ from event_core.domain.events.elements import (
 )
 from event_core.domain.types import Element
 
+from adapters.cache import (
+    LRUCache,
+    RedisVectorCache,
+    SqliteTextCache,
+    SqliteVectorCache,
+    TieredCache,
+)
+from adapters.doc_store import MultiVectorStore
 from adapters.embedders import (
+    BatchingEmbeddingModel,
     CLIPTextModel,
     CLIPVisionModel,
+    CachedEmbeddingModel,
     DePlotModel,
+    LazyEmbeddingModel,
+    RemoteEmbeddingModel,
     UniXCoderModel,
+    normalize_text,
+)
+from adapters.model_client import ModelServerClient
+from adapters.model_registry import ModelRegistry
+from adapters.repository import LocalVectorRepo, PineconeRepo
+from adapters.rerankers import (
+    BgeReranker,
+    ColpaliReranker,
+    LazyReranker,
+    RemoteReranker,
+)
+from adapters.storage import StorageFetcher
+from adapters.warm_start import startup_phase
+from config import (
+    CANDIDATE_CACHE_BYTES,
+    CANDIDATE_PREFETCH,
+    COLPALI_DOC_STORE_PATH,
+    COLPALI_INPUT_CACHE_BYTES,
+    DEPLOT_TABLE_STORE_PATH,
+    INGEST_CACHE_PATH,
+    LAZY_MODELS,
+    MODEL_SERVER_ADDRESS,
+    QUERY_BATCH_SIZE,
+    QUERY_CACHE_REDIS_URL,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL_S,
+    STORAGE_FETCH_WORKERS,
+    VECTOR_REPO,
+    get_model_server_authkey,
 )
-from adapters.repository import PineconeRepo
-from adapters.rerankers import BgeReranker, ColpaliReranker
 
 MODULES = ("handlers",)
 
+if LAZY_MODELS:
+    # models are loaded on first use, and unloaded when idle or when over
+    # the memory budget
+    _model_registry = providers.Singleton(ModelRegistry)
+
+    def _model(cls, *args, model_id=None, **kwargs):
+        return providers.Singleton(
+            LazyEmbeddingModel,
+            _model_registry,
+            cls.__name__,
+            providers.Factory(cls, *args, **kwargs).provider,
+            model_id or providers.Callable(cls.variant_id),
+            cls.EMBEDDING_DIM,
+        )
+
+    def _reranker(cls, *args, **kwargs):
+        return providers.Singleton(
+            LazyReranker,
+            _model_registry,
+            cls.__name__,
+            providers.Factory(cls, *args, **kwargs).provider,
+        )
+
+else:
+
+    def _model(cls, *args, model_id=None, **kwargs):
+        return providers.Singleton(cls, *args, **kwargs)
+
+    def _reranker(cls, *args, **kwargs):
+        return providers.Singleton(cls, *args, **kwargs)
+
 
 class DIContainer(containers.DeclarativeContainer):
 
     # embedding models
-    _text_model = providers.Singleton(CLIPTextModel)
-    _vision_model = providers.Singleton(CLIPVisionModel)
-    _plot_model = providers.Singleton(DePlotModel, _text_model)
-    _code_model = providers.Singleton(UniXCoderModel)
-    model_factory = providers.Dict(
-        {
-            CodeElementStored: _code_model,
-            ImageElementStored: _vision_model,
-            TextElementStored: _text_model,
-            PlotElementStored: _plot_model,
-        }
+    _text_model = _model(CLIPTextModel)
+    _vision_model = _model(CLIPVisionModel)
+    _plot_model = _model(
+        DePlotModel,
+        _text_model,
+        table_store=(
+            providers.Singleton(SqliteTextCache, DEPLOT_TABLE_STORE_PATH)
+            if DEPLOT_TABLE_STORE_PATH
+            else None
+        ),
+        model_id=providers.Callable(
+            DePlotModel.variant_id, _text_model.provided.model_id
+        ),
+    )
+    _code_model = _model(UniXCoderModel)
+    if INGEST_CACHE_PATH:
+        # ingest embedding models, fronted by a content-addressed cache
+        _ingest_cache = providers.Singleton(
+            SqliteVectorCache, INGEST_CACHE_PATH
+        )
+        model_factory = providers.Dict(
+            {
+                CodeElementStored: providers.Singleton(
+                    CachedEmbeddingModel, _code_model, _ingest_cache
+                ),
+                ImageElementStored: providers.Singleton(
+                    CachedEmbeddingModel, _vision_model, _ingest_cache
+                ),
+                TextElementStored: providers.Singleton(
+                    CachedEmbeddingModel, _text_model, _ingest_cache
+                ),
+                PlotElementStored: providers.Singleton(
+                    CachedEmbeddingModel, _plot_model, _ingest_cache
+                ),
+            }
+        )
+    else:
+        model_factory = providers.Dict(
+            {
+                CodeElementStored: _code_model,
+                ImageElementStored: _vision_model,
+                TextElementStored: _text_model,
+                PlotElementStored: _plot_model,
+            }
+        )
+
+    # query embedding models, fronted by a cache of query embeddings
+    _local_query_cache = providers.Singleton(
+        LRUCache, QUERY_CACHE_SIZE, QUERY_CACHE_TTL_S
     )
-    query_model_factory = providers.Dict(
+    if QUERY_CACHE_REDIS_URL:
+        _query_cache = providers.Singleton(
+            TieredCache,
+            _local_query_cache,
+            providers.Singleton(
+                RedisVectorCache, QUERY_CACHE_REDIS_URL, QUERY_CACHE_TTL_S
+            ),
+        )
+    else:
+        _query_cache = _local_query_cache
+    if QUERY_BATCH_SIZE > 1:
+        # coalesce concurrent cache misses into batched forward passes
+        _batched_text_model = providers.Singleton(
+            BatchingEmbeddingModel, _text_model
+        )
+        _batched_code_model = providers.Singleton(
+            BatchingEmbeddingModel, _code_model
+        )
+    else:
+        _batched_text_model = _text_model
+        _batched_code_model = _code_model
+    _query_text_model = providers.Singleton(
+        CachedEmbeddingModel, _batched_text_model, _query_cache, normalize_text
+    )
+    _query_code_model = providers.Singleton(
+        CachedEmbeddingModel, _batched_code_model, _query_cache, normalize_text
+    )
+    local_query_model_factory = providers.Dict(
         {
-            Element.IMAGE: _text_model,
-            Element.TEXT: _text_model,
-            Element.PLOT: _text_model,
-            Element.CODE: _code_model,
+            Element.IMAGE: _query_text_model,
+            Element.TEXT: _query_text_model,
+            Element.PLOT: _query_text_model,
+            Element.CODE: _query_code_model,
         }
     )
 
+    storage = providers.Singleton(StorageAPIClient)
+    storage_fetcher = providers.Singleton(
+        StorageFetcher,
+        storage,
+        STORAGE_FETCH_WORKERS,
+        CANDIDATE_PREFETCH,
+        (
+            providers.Singleton(LRUCache, CANDIDATE_CACHE_BYTES, weigher=len)
+            if CANDIDATE_CACHE_BYTES
+            else None
+        ),
+    )
+
     # reranker models
-    _copali_reranker = providers.Singleton(ColpaliReranker)
-    _bge_reranker = providers.Singleton(BgeReranker)
-    reranker_factory = providers.Dict(
+    _copali_reranker = _reranker(
+        ColpaliReranker,
+        (
+            providers.Singleton(
+                LRUCache,
+                COLPALI_INPUT_CACHE_BYTES,
+                weigher=ColpaliReranker.inputs_nbytes,
+            )
+            if COLPALI_INPUT_CACHE_BYTES
+            else None
+        ),
+        (
+            providers.Singleton(MultiVectorStore, COLPALI_DOC_STORE_PATH)
+            if COLPALI_DOC_STORE_PATH
+            else None
+        ),
+        storage_fetcher,
+    )
+    _bge_reranker = _reranker(BgeReranker)
+    local_reranker_factory = providers.Dict(
         {
             Element.IMAGE: _copali_reranker,
             Element.TEXT: _bge_reranker,
         }
     )
+    if MODEL_SERVER_ADDRESS:
+        # query models and rerankers live in the model server process,
+        # shared by every worker on the host
+        _model_client = providers.Singleton(
+            ModelServerClient,
+            MODEL_SERVER_ADDRESS,
+            providers.Callable(get_model_server_authkey),
+        )
+        _remote_text_model = providers.Singleton(
+            RemoteEmbeddingModel, _model_client, Element.TEXT
+        )
+        query_model_factory = providers.Dict(
+            {
+                Element.IMAGE: _remote_text_model,
+                Element.TEXT: _remote_text_model,
+                Element.PLOT: _remote_text_model,
+                Element.CODE: providers.Singleton(
+                    RemoteEmbeddingModel, _model_client, Element.CODE
+                ),
+            }
+        )
+        reranker_factory = providers.Dict(
+            {
+                Element.IMAGE: providers.Singleton(
+                    RemoteReranker, _model_client, Element.IMAGE
+                ),
+                Element.TEXT: providers.Singleton(
+                    RemoteReranker, _model_client, Element.TEXT
+                ),
+            }
+        )
+    else:
+        query_model_factory = local_query_model_factory
+        reranker_factory = local_reranker_factory
+    # rerankers that precompute candidate state at ingest
+    ingest_reranker_factory = providers.Dict(
+        {Element.IMAGE: _copali_reranker} if COLPALI_DOC_STORE_PATH else {}
+    )
 
     # external services
     vec_repo = providers.Singleton(
-        PineconeRepo,
+        LocalVectorRepo if VECTOR_REPO == "local" else PineconeRepo,
         (
             Element.CODE.value,
             Element.IMAGE.value,
@@ -70,15 +273,20 @@ class DIContainer(containers.DeclarativeContainer):
             CLIPTextModel.EMBEDDING_DIM,
         ),
     )
-    storage = providers.Singleton(StorageAPIClient)
 
 
 def bootstrap(lazy_load: bool = True) -> None:
     container = DIContainer()
 
     if not lazy_load:
-        # avoid lazy instantiation which times out requests
-        container.reranker_factory()
-        container.model_factory()
-        container.query_model_factory()
+        # avoid lazy instantiation which times out requests. with
+        # LAZY_MODELS, this only instantiates the proxies of the models
+        with startup_phase("rerankers"):
+            container.reranker_factory()
+        if not MODEL_SERVER_ADDRESS:
+            # with a model server, models are only loaded by the server
+            with startup_phase("models"):
+                container.model_factory()
+        with startup_phase("query models"):
+            container.query_model_factory()
     container.wire(modules=MODULES)
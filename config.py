@@ -1,12 +1,150 @@
+import os
+
 import torch
 from dotenv import find_dotenv, load_dotenv
 from event_core.config import get_env_var
 
 load_dotenv(find_dotenv())
 
+# local state defaults to paths under DATA_DIR, which does not depend on
+# the working directory the process is started from
+DATA_DIR = os.getenv(
+    "DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
 
 TOP_N_MULTIPLIER = 3  # fetch top 3n cands, rerank and output top n ranked
 
+# results of the element types are fused into one ranking by reciprocal
+# rank, 1 / (RRF_K + rank), or by scores standardized per element type
+FUSION_METHOD = os.getenv("FUSION_METHOD", "rrf")
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# element types are queried concurrently, each within its own time budget
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", 16))
+QUERY_MODAL_TIMEOUT_S = float(os.getenv("QUERY_MODAL_TIMEOUT_S", 10))
+
+# PineconeRepo splits bulk upserts into requests of at most
+# PINECONE_UPSERT_BATCH_SIZE vectors, keeps up to PINECONE_MAX_IN_FLIGHT
+# requests in flight and tries each request up to PINECONE_MAX_RETRIES times
+# on connection errors, timeouts, rate limits and server errors
+PINECONE_UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", 100))
+PINECONE_MAX_IN_FLIGHT = int(os.getenv("PINECONE_MAX_IN_FLIGHT", 4))
+PINECONE_MAX_RETRIES = int(os.getenv("PINECONE_MAX_RETRIES", 3))
+
+# vector repo backend, "pinecone" or "local". the local repo keeps one
+# memory-mapped matrix per (index, namespace) under LOCAL_VECTOR_REPO_PATH,
+# searched exactly up to LOCAL_IVF_MIN_VECTORS vectors and by an IVF index
+# probing LOCAL_IVF_NPROBE lists beyond
+VECTOR_REPO = os.getenv("VECTOR_REPO", "pinecone")
+LOCAL_VECTOR_REPO_PATH = os.getenv(
+    "LOCAL_VECTOR_REPO_PATH", os.path.join(DATA_DIR, "vectors")
+)
+LOCAL_IVF_MIN_VECTORS = int(os.getenv("LOCAL_IVF_MIN_VECTORS", 50_000))
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", 16))
+
+# local repo vectors are scanned as fp32, fp16, int8 (with a scale per
+# vector) or pq codes of LOCAL_PQ_SUBVECTORS bytes. with compression, the
+# best LOCAL_RESCORE_FACTOR * top_k rows are rescored exactly against the
+# fp32 vectors, if LOCAL_KEEP_FULL_VECTORS. pq requires the fp32 vectors
+LOCAL_VECTOR_COMPRESSION = os.getenv("LOCAL_VECTOR_COMPRESSION", "fp32")
+LOCAL_KEEP_FULL_VECTORS = os.getenv("LOCAL_KEEP_FULL_VECTORS", "1") == "1"
+LOCAL_RESCORE_FACTOR = int(os.getenv("LOCAL_RESCORE_FACTOR", 4))
+LOCAL_PQ_SUBVECTORS = int(os.getenv("LOCAL_PQ_SUBVECTORS", 64))
+
+# rerank candidates are fetched from storage concurrently, up to
+# CANDIDATE_PREFETCH objects ahead of the reranker
+STORAGE_FETCH_WORKERS = int(os.getenv("STORAGE_FETCH_WORKERS", 32))
+CANDIDATE_PREFETCH = int(os.getenv("CANDIDATE_PREFETCH", 16))
+
+# byte budgets of the LRU caches of rerank candidates, as fetched from
+# storage and as preprocessed ColPali inputs. 0 disables a cache
+CANDIDATE_CACHE_BYTES = int(os.getenv("CANDIDATE_CACHE_BYTES", 256 << 20))
+COLPALI_INPUT_CACHE_BYTES = int(os.getenv("COLPALI_INPUT_CACHE_BYTES", 0))
+
+# directory of ColPali page embeddings precomputed at ingest, which lets
+# the ColPali reranker skip the vision tower at query time. unset disables
+COLPALI_DOC_STORE_PATH = os.getenv("COLPALI_DOC_STORE_PATH", "")
+
+# BgeReranker scores pairs in length-bucketed mini-batches. candidates
+# whose relevance logit is below BGE_MIN_SCORE, if set, are cut
+BGE_BATCH_SIZE = int(os.getenv("BGE_BATCH_SIZE", 16))
+BGE_MAX_LENGTH = int(os.getenv("BGE_MAX_LENGTH", 512))
+_bge_min_score = os.getenv("BGE_MIN_SCORE")
+BGE_MIN_SCORE = float(_bge_min_score) if _bge_min_score else None
+
+# concurrent query embeddings that miss the query cache are coalesced into
+# batches of up to QUERY_BATCH_SIZE (1 disables batching), waiting at most
+# QUERY_BATCH_MAX_WAIT_S for a batch to fill, with at most
+# QUERY_BATCH_MAX_PENDING queries queued per model
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", 32))
+QUERY_BATCH_MAX_WAIT_S = float(os.getenv("QUERY_BATCH_MAX_WAIT_S", 0.003))
+QUERY_BATCH_MAX_PENDING = int(os.getenv("QUERY_BATCH_MAX_PENDING", 256))
+
+# with LAZY_MODELS=1, models are loaded on first use and unloaded once idle
+# for MODEL_IDLE_EVICT_S (0 never), or least recently used first while the
+# loaded models take more than MODEL_MEMORY_BUDGET_BYTES (0 is unbounded)
+LAZY_MODELS = os.getenv("LAZY_MODELS", "0") == "1"
+MODEL_IDLE_EVICT_S = float(os.getenv("MODEL_IDLE_EVICT_S", 15 * 60))
+MODEL_MEMORY_BUDGET_BYTES = int(os.getenv("MODEL_MEMORY_BUDGET_BYTES", 0))
+
+# unix socket of the model server (entrypoints/model_server.py). when set,
+# the app's query models and rerankers are proxies of the server's models.
+# the server and its clients authenticate with MODEL_SERVER_AUTHKEY
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "")
+MODEL_SERVER_CONNECT_TIMEOUT_S = float(
+    os.getenv("MODEL_SERVER_CONNECT_TIMEOUT_S", 300)
+)
+# a call left unanswered for MODEL_SERVER_CALL_TIMEOUT_S fails, and drops
+# its connection
+MODEL_SERVER_CALL_TIMEOUT_S = float(
+    os.getenv("MODEL_SERVER_CALL_TIMEOUT_S", 60)
+)
+
+# query embedding cache. set QUERY_CACHE_REDIS_URL to share cached
+# embeddings between processes, in addition to the per-process LRU
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 4096))
+QUERY_CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", 24 * 60 * 60))
+QUERY_CACHE_REDIS_URL = os.getenv("QUERY_CACHE_REDIS_URL")
+
+# content-addressed cache of element embeddings, so that duplicate objects
+# are not re-embedded on ingest. set to an empty string to disable. entries
+# are keyed by model_id, which changes with the weights revision, precision
+# and backend of a model
+INGEST_CACHE_PATH = os.getenv(
+    "INGEST_CACHE_PATH", os.path.join(DATA_DIR, "embeddings.db")
+)
+
+# micro-batching of ElementStored events in the event consumer. a batch per
+# element type is flushed once it is full or its oldest event has waited
+# INGEST_MAX_WAIT_S. INGEST_BATCH_SIZE=1 handles events one at a time, and
+# acks each event only once it is handled. batched events are acked once
+# buffered, so up to a batch per element type is lost if the process dies.
+# plot events are always batched, see PLOT_WORKERS
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 1))
+INGEST_MAX_WAIT_S = float(os.getenv("INGEST_MAX_WAIT_S", 0.5))
+
+# max number of inputs per forward pass in embed_many
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+DEPLOT_BATCH_SIZE = int(os.getenv("DEPLOT_BATCH_SIZE", 4))
+
+# CLIPTextModel tokenizes long texts in blocks of this many characters and
+# buffers at most CLIP_CHUNK_BUFFER_SIZE chunks before encoding them
+CLIP_TOKENIZE_BLOCK_CHARS = int(
+    os.getenv("CLIP_TOKENIZE_BLOCK_CHARS", 1 << 16)
+)
+CLIP_CHUNK_BUFFER_SIZE = int(os.getenv("CLIP_CHUNK_BUFFER_SIZE", 256))
+
+# plot events are batched by DEPLOT_BATCH_SIZE whatever INGEST_BATCH_SIZE,
+# and handled off the main ingest loop by PLOT_WORKERS threads with at most
+# PLOT_MAX_PENDING batches queued behind them. generated data
+# tables are persisted at DEPLOT_TABLE_STORE_PATH (empty disables)
+PLOT_WORKERS = int(os.getenv("PLOT_WORKERS", 1))
+PLOT_MAX_PENDING = int(os.getenv("PLOT_MAX_PENDING", 4))
+DEPLOT_TABLE_STORE_PATH = os.getenv(
+    "DEPLOT_TABLE_STORE_PATH", os.path.join(DATA_DIR, "deplot_tables.db")
+)
+
 
 if torch.cuda.is_available():
     DEVICE = torch.device("cuda")
@@ -18,5 +156,33 @@ else:
     DEVICE = torch.device("cpu")
 
 
+# precision of the embedding and BGE reranker models, one of fp32, bf16 or
+# int8 (dynamic quantization of linear layers, CPU only)
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
+
+
+# inference backend per embedding model, as comma separated
+# "{model class}={backend}" pairs with backend one of eager or onnx, e.g.
+# EMBEDDER_BACKENDS="CLIPTextModel=onnx,UniXCoderModel=onnx"
+EMBEDDER_BACKENDS = dict(
+    spec.strip().split("=", 1)
+    for spec in os.getenv("EMBEDDER_BACKENDS", "").split(",")
+    if spec.strip()
+)
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", os.path.join(DATA_DIR, "onnx"))
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", 0))  # 0 is ORT default
+# pre-materialized model weights for fast cold starts, empty to disable
+WARM_START_DIR = os.getenv(
+    "WARM_START_DIR", os.path.join(DATA_DIR, "warm_start")
+)
+
+
 def get_pinecone_api_key() -> str:
     return get_env_var("PINECONE_API_KEY")
+
+
+def get_model_server_authkey() -> bytes:
+    # requests are pickled, so the socket must not serve unknown clients
+    if not (authkey := get_env_var("MODEL_SERVER_AUTHKEY")):
+        raise ValueError("MODEL_SERVER_AUTHKEY is not set")
+    return authkey.encode("utf-8")
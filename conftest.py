@@ -1,9 +1,10 @@
 from collections import defaultdict
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Sequence, Tuple
 
 import pytest
 
+from adapters.common import ScoredKeysT, VectorT
 from adapters.embedders import (
     CLIPTextModel,
     CLIPVisionModel,
@@ -12,7 +13,6 @@ from adapters.embedders import (
 )
 from adapters.repository import AbstractVectorRepo
 
-VectorT = List[float]
 NamespaceT = Dict[str, Dict[str, VectorT]]
 
 TEST_DIR = Path("tests/data")
@@ -21,17 +21,33 @@ TEST_DIR = Path("tests/data")
 class FakeVectorRepo(AbstractVectorRepo):
     def __init__(self):
         super().__init__()
-        self._namespaces: NamespaceT = defaultdict(dict)
-        self._indexes: Dict[str, NamespaceT] = defaultdict(dict)
+        self._indexes: Dict[str, NamespaceT] = defaultdict(
+            lambda: defaultdict(dict)
+        )
 
     def insert(
-        self, index_name: str, namespace: str, key: str, vec: List[float]
+        self, index_name: str, namespace: str, key: str, vec: VectorT
     ) -> None:
         self._indexes[index_name][namespace][key] = vec
 
+    def insert_many(
+        self,
+        index_name: str,
+        namespace: str,
+        items: Sequence[Tuple[str, VectorT]],
+    ) -> None:
+        for key, vec in items:
+            self.insert(index_name, namespace, key, vec)
+
+    def delete(
+        self, index_name: str, namespace: str, keys: Sequence[str]
+    ) -> None:
+        for key in keys:
+            self._indexes[index_name][namespace].pop(key, None)
+
     def query(
-        self, index_name: str, namespace: str, vec: List[float], top_k: int = 5
-    ) -> List[str]:
+        self, index_name: str, namespace: str, vec: VectorT, top_k: int = 5
+    ) -> ScoredKeysT:
         return []
 
 
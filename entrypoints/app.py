@@ -1,10 +1,15 @@
+import json
 import logging
+from contextlib import closing
+from dataclasses import asdict
+from typing import Iterator, List, Optional
 
-from flask import Flask, request
+from flask import Flask, Response, request
 from flask_cors import CORS
 
+from adapters.warm_start import STARTUP_TIMINGS, startup_phase
 from bootstrap import bootstrap
-from handlers import handle_query_text
+from handlers import handle_query_text, stream_query_text
 
 logger = logging.getLogger(__name__)
 
@@ -13,21 +18,49 @@ def create_app():
     logging.basicConfig(level=logging.INFO)
     app = Flask(__name__)
     CORS(app)
-    bootstrap(lazy_load=False)
+    with startup_phase("bootstrap"):
+        bootstrap(lazy_load=False)
     return app
 
 
 app = create_app()
 
 
+def _ndjson(
+    user: str, text: str, top_n: int, exclude_elems: Optional[List[str]]
+) -> Iterator[str]:
+    """One JSON line per element type, as soon as its results are ready"""
+    # closing the stream when the client disconnects cancels pending queries
+    with closing(
+        stream_query_text(user, text, top_n, exclude_elems)
+    ) as results:
+        for elem, hits in results:
+            line = {
+                "element": elem.value,
+                "hits": [asdict(hit) for hit in hits],
+            }
+            yield json.dumps(line) + "\n"
+
+
 @app.route("/query/text", methods=["GET"])
 def query_text():
     user: str = request.args["user"]
     text: str = request.args["text"]
     top_n = int(request.args["top_n"])
     exclude_elems = request.args.get("exclude_elems", [])
+    if request.args.get("stream", type=int):
+        return Response(
+            _ndjson(user, text, top_n, exclude_elems),
+            mimetype="application/x-ndjson",
+        )
     return handle_query_text(user, text, top_n, exclude_elems)
 
 
+@app.route("/startup", methods=["GET"])
+def startup():
+    """Seconds spent in each startup phase of this worker"""
+    return STARTUP_TIMINGS
+
+
 if __name__ == "__main__":
     app.run(port=5003)
@@ -1,4 +1,9 @@
 import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence, Type
 
 from event_core.adapters.pubsub import RedisConsumer
 from event_core.domain.events import (
@@ -7,13 +12,177 @@ from event_core.domain.events import (
     PlotElementStored,
     TextElementStored,
 )
+from event_core.domain.events.elements import ElementStored
 
 from bootstrap import bootstrap
-from handlers import handle_element
+from config import (
+    DEPLOT_BATCH_SIZE,
+    INGEST_BATCH_SIZE,
+    INGEST_MAX_WAIT_S,
+    PLOT_MAX_PENDING,
+    PLOT_WORKERS,
+)
+from handlers import handle_elements
 
 logger = logging.getLogger(__name__)
 
 
+class EventBatcher:
+    """
+    Accumulates events per event type and flushes a type's batch once it
+    holds `max_batch_size` events or its oldest event has waited for
+    `max_wait_s`, whichever comes first.
+
+    Events are acknowledged by the broker once `add` returns, so events
+    still buffered when the process dies are not redelivered. Call
+    `close` on shutdown to flush what is left. Until the consumer can
+    defer acks, batching is opt in through INGEST_BATCH_SIZE.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[Sequence[ElementStored]], None],
+        max_batch_size: int,
+        max_wait_s: float,
+    ):
+        self._flush_fn = flush_fn
+        self._max_batch_size = max_batch_size
+        self._max_wait_s = max_wait_s
+        self._batches: Dict[Type[ElementStored], List[ElementStored]]
+        self._batches = defaultdict(list)
+        self._deadlines: Dict[Type[ElementStored], float] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._run_timer, daemon=True)
+        self._timer.start()
+
+    def add(self, event: ElementStored) -> None:
+        event_cls = event.__class__
+        with self._lock:
+            batch = self._batches[event_cls]
+            if not batch:
+                deadline = time.monotonic() + self._max_wait_s
+                self._deadlines[event_cls] = deadline
+            batch.append(event)
+            full = len(batch) >= self._max_batch_size
+        if full:
+            self._flush(event_cls)
+
+    def close(self) -> None:
+        self._closed.set()
+        self._timer.join()
+        for event_cls in list(self._batches):
+            self._flush(event_cls)
+
+    def _take(self, event_cls: Type[ElementStored]) -> List[ElementStored]:
+        with self._lock:
+            self._deadlines.pop(event_cls, None)
+            return self._batches.pop(event_cls, [])
+
+    def _flush(self, event_cls: Type[ElementStored]) -> None:
+        # serialize this batcher's flushes, so that flush_fn handles one
+        # batch at a time. the models are still shared with other threads,
+        # e.g. the plot workers, which is safe as inference mutates neither
+        # the eval-mode modules nor the tokenizers, always called with the
+        # same truncation and padding settings
+        with self._flush_lock:
+            if batch := self._take(event_cls):
+                try:
+                    self._flush_fn(batch)
+                except Exception:
+                    logger.exception(f"Failed to flush {len(batch)} events")
+
+    def _run_timer(self) -> None:
+        while not self._closed.wait(self._max_wait_s / 4):
+            now = time.monotonic()
+            with self._lock:
+                expired = [
+                    event_cls
+                    for event_cls, deadline in self._deadlines.items()
+                    if deadline <= now
+                ]
+            for event_cls in expired:
+                self._flush(event_cls)
+
+
+class WorkerPool:
+    """
+    Handles batches on up to `max_workers` threads with at most
+    `max_pending` batches queued. `submit` blocks while the queue is
+    full, which applies backpressure to the caller.
+    """
+
+    def __init__(
+        self,
+        handle_fn: Callable[[Sequence[ElementStored]], None],
+        max_workers: int,
+        max_pending: int,
+    ):
+        self._handle_fn = handle_fn
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="worker"
+        )
+
+    def submit(self, batch: Sequence[ElementStored]) -> None:
+        self._slots.acquire()
+        self._executor.submit(self._handle, batch)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _handle(self, batch: Sequence[ElementStored]) -> None:
+        try:
+            self._handle_fn(batch)
+        except Exception:
+            logger.exception(f"Failed to handle {len(batch)} events")
+        finally:
+            self._slots.release()
+
+
+class EventRouter:
+    """
+    Routes each event to its handler. DePlot takes seconds per plot, so
+    plot events are always batched by `plot_batch_size` and handled by
+    their own `WorkerPool` rather than stalling the other events. They
+    are acked once buffered. Other events are handled inline, and acked
+    once handled, unless `batch_size` > 1 batches them too.
+    """
+
+    def __init__(
+        self,
+        handle_fn: Callable[[Sequence[ElementStored]], None],
+        batch_size: int,
+        max_wait_s: float,
+        plot_batch_size: int,
+        plot_workers: int,
+        plot_max_pending: int,
+    ):
+        self._handle_fn = handle_fn
+        self._batcher = None
+        if batch_size > 1:
+            self._batcher = EventBatcher(handle_fn, batch_size, max_wait_s)
+        self._plot_pool = WorkerPool(handle_fn, plot_workers, plot_max_pending)
+        self._plot_batcher = EventBatcher(
+            self._plot_pool.submit, plot_batch_size, max_wait_s
+        )
+
+    def route(self, event: ElementStored) -> None:
+        if isinstance(event, PlotElementStored):
+            self._plot_batcher.add(event)
+        elif self._batcher is not None:
+            self._batcher.add(event)
+        else:
+            self._handle_fn([event])
+
+    def close(self) -> None:
+        if self._batcher is not None:
+            self._batcher.close()
+        self._plot_batcher.close()
+        self._plot_pool.close()
+
+
 def main():
     logger.info("Listening to event broker")
     with RedisConsumer() as consumer:
@@ -21,7 +190,23 @@ def main():
         consumer.subscribe(TextElementStored)
         consumer.subscribe(PlotElementStored)
         consumer.subscribe(CodeElementStored)
-        consumer.listen(handle_element)
+
+        logger.info(
+            f"Routing events {INGEST_BATCH_SIZE=} {INGEST_MAX_WAIT_S=} "
+            f"{DEPLOT_BATCH_SIZE=} {PLOT_WORKERS=}"
+        )
+        router = EventRouter(
+            handle_elements,
+            INGEST_BATCH_SIZE,
+            INGEST_MAX_WAIT_S,
+            DEPLOT_BATCH_SIZE,
+            PLOT_WORKERS,
+            PLOT_MAX_PENDING,
+        )
+        try:
+            consumer.listen(router.route)
+        finally:
+            router.close()
 
 
 if __name__ == "__main__":
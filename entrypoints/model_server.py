@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Connection, Listener
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from event_core.domain.types import Element
+
+from adapters.common import VectorT
+from adapters.embedders import AbstractEmbeddingModel
+from adapters.model_client import (
+    DESCRIBE,
+    EMBED,
+    EMBED_MANY,
+    ERROR,
+    OK,
+    RERANK,
+)
+from adapters.rerankers import AbstractReranker
+from adapters.storage import StorageFetcher
+from adapters.warm_start import startup_phase
+from bootstrap import DIContainer
+from config import MODEL_SERVER_ADDRESS, get_model_server_authkey
+
+logger = logging.getLogger(__name__)
+
+
+class ModelServer:
+    """
+    Serves the query models and rerankers of one process to the web
+    workers of the app, so that the models are loaded once per host
+    rather than once per worker. Every connection is served on its own
+    thread, and concurrent query embeddings are batched by the models.
+    """
+
+    def __init__(
+        self,
+        models: Dict[Element, AbstractEmbeddingModel],
+        rerankers: Dict[Element, AbstractReranker],
+        storage_fetcher: StorageFetcher,
+    ):
+        self._models = models
+        self._rerankers = rerankers
+        self._storage_fetcher = storage_fetcher
+        self._methods: Dict[str, Callable[..., Any]] = {
+            DESCRIBE: self._describe,
+            EMBED: self._embed,
+            EMBED_MANY: self._embed_many,
+            RERANK: self._rerank,
+        }
+
+    def _describe(self, elem: str) -> Tuple[str, int]:
+        model = self._models[Element(elem)]
+        return model.model_id, model.EMBEDDING_DIM
+
+    def _embed(self, elem: str, data: bytes) -> VectorT:
+        return self._models[Element(elem)].embed(data)
+
+    def _embed_many(self, elem: str, data: Sequence[bytes]) -> VectorT:
+        return self._models[Element(elem)].embed_many(data)
+
+    def _rerank(
+        self,
+        elem: str,
+        query: str,
+        top_k: int,
+        keys: Optional[List[str]],
+        objs: Optional[List[bytes]],
+        timeout_s: Optional[float],
+    ) -> List[Tuple[int, float]]:
+        reranker = self._rerankers[Element(elem)]
+        if objs is not None:
+            return reranker.rerank(query, iter(objs), top_k, keys, timeout_s)
+        assert keys is not None
+        candidates = self._storage_fetcher.fetch_many(keys, timeout_s)
+        return reranker.rerank(query, candidates, top_k, keys, timeout_s)
+
+    def serve(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    response = (OK, self._methods[method](*args))
+                except Exception as e:
+                    logger.exception(f"Failed to handle {method}")
+                    response = (ERROR, f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(response)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client has gone, e.g. after timing out
+                    return
+
+    def serve_forever(self, listener: Listener) -> None:
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                logger.warning("Rejected a client with a wrong authkey")
+                continue
+            threading.Thread(
+                target=self.serve, args=(conn,), daemon=True
+            ).start()
+
+
+def listen(address: str, authkey: bytes) -> Listener:
+    """
+    Listen on the unix socket `address`, which only the user running the
+    server can connect to, for clients authenticated by `authkey`
+    """
+    Path(address).unlink(missing_ok=True)
+    # no other user can connect between binding and the chmod
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(umask)
+    os.chmod(address, 0o600)
+    return listener
+
+
+def main():
+    container = DIContainer()
+    with startup_phase("model server"):
+        server = ModelServer(
+            container.local_query_model_factory(),
+            container.local_reranker_factory(),
+            container.storage_fetcher(),
+        )
+
+    logger.info(f"Serving models at {MODEL_SERVER_ADDRESS}")
+    authkey = get_model_server_authkey()
+    with listen(MODEL_SERVER_ADDRESS, authkey) as listener:
+        server.serve_forever(listener)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
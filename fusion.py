@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List
+
+import numpy as np
+from event_core.domain.types import Element
+
+from adapters.common import ScoredKeysT
+from config import FUSION_METHOD, RRF_K
+
+
+class Fusion(str, Enum):
+    RRF = "rrf"
+    ZSCORE = "zscore"
+
+
+@dataclass
+class Hit:
+    key: str
+    element: str
+    score: float
+
+
+def _fused_scores(scored: ScoredKeysT, method: Fusion) -> List[float]:
+    if method == Fusion.RRF:
+        return [1 / (RRF_K + rank) for rank in range(1, len(scored) + 1)]
+
+    scores = np.array([score for _, score in scored], dtype=np.float64)
+    std = scores.std()
+    if not std:
+        return [0.0] * len(scores)
+    return ((scores - scores.mean()) / std).tolist()
+
+
+def fuse(
+    results: Dict[Element, ScoredKeysT],
+    top_n: int,
+    method: Fusion = Fusion(FUSION_METHOD),
+) -> List[Hit]:
+    """
+    Merge the ranked candidates of every element type into one global
+    top_n. Scores of different rerankers are not comparable, so they
+    are replaced by reciprocal ranks (RRF), or standardized over the
+    candidates of each element type (zscore).
+    """
+    hits = [
+        Hit(key, elem.value, fused)
+        for elem, scored in results.items()
+        for (key, _), fused in zip(scored, _fused_scores(scored, method))
+    ]
+    # stable, so that ties keep the order of the element types
+    hits.sort(key=lambda hit: hit.score, reverse=True)
+    return hits[:top_n]
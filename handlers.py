@@ -1,21 +1,54 @@
 import logging
-from typing import Dict, Iterable, Iterator, List, Optional, Type, TypeAlias
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    TimeoutError,
+    as_completed,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
 
 from dependency_injector.wiring import Provide, inject
 from event_core.adapters.services.storage import StorageClient
 from event_core.domain.events.elements import ELEM_TYPES, ElementStored
 from event_core.domain.types import Element
 
+from adapters.common import ScoredKeysT, VectorT
 from adapters.embedders.base import AbstractEmbeddingModel
 from adapters.repository import AbstractVectorRepo
 from adapters.rerankers.base import AbstractReranker
+from adapters.storage import StorageFetcher
 from bootstrap import DIContainer
-from config import TOP_N_MULTIPLIER
+from config import (
+    FUSION_METHOD,
+    QUERY_MODAL_TIMEOUT_S,
+    QUERY_WORKERS,
+    TOP_N_MULTIPLIER,
+)
+from fusion import Fusion, Hit, fuse
 
 logger = logging.getLogger(__name__)
 
-
-KeysT: TypeAlias = List[str]
+# module level rather than per request, since shutting down a per request
+# executor would wait on element types that have already timed out
+_query_executor = ThreadPoolExecutor(
+    max_workers=QUERY_WORKERS, thread_name_prefix="query"
+)
+# element type queries submitted to the executor and not yet done
+_in_flight = 0
+_in_flight_lock = threading.Lock()
 
 
 def _user_from_key(key: str) -> str:
@@ -34,6 +67,9 @@ def handle_element(
     model_factory: Dict[Type[ElementStored], AbstractEmbeddingModel] = Provide[
         DIContainer.model_factory
     ],
+    ingest_reranker_factory: Dict[Element, AbstractReranker] = Provide[
+        DIContainer.ingest_reranker_factory
+    ],
 ) -> None:
     """
     1. Fetch element object
@@ -41,23 +77,239 @@ def handle_element(
     3. Embed element
     4. Insert into vec repo at the corresponding namespace
     """
-    logger.info(f"Handling ElementStored: {event=}")
-    key = event.key
-    event_cls = event.__class__
-    event_elem = ELEM_TYPES[event_cls]
-    model = model_factory[event_cls]
+    handle_elements(
+        [event],
+        storage=storage,
+        vec_repo=vec_repo,
+        model_factory=model_factory,
+        ingest_reranker_factory=ingest_reranker_factory,
+    )
 
+
+def _embed_isolated(
+    model: AbstractEmbeddingModel, keys: List[str], objs: List[bytes]
+) -> List[Tuple[str, VectorT]]:
+    """
+    Embed objs in a single batch. If the batch fails, fall back to
+    embedding objs one by one so that a single bad element does not
+    drop the rest of the batch.
+    """
     try:
-        vec = model.embed(storage[key])
-    except:
-        return
-
-    vec_repo.insert(
-        index_name=_get_vec_repo_idx_name(event_elem),
-        namespace=_user_from_key(key),
-        key=key,
-        vec=vec,
+        return list(zip(keys, model.embed_many(objs)))
+    except Exception:
+        logger.exception(f"Failed to embed batch of {len(objs)}, isolating")
+
+    res = []
+    for key, obj in zip(keys, objs):
+        try:
+            res.append((key, model.embed(obj)))
+        except Exception:
+            logger.exception(f"Failed to embed {key=}")
+    return res
+
+
+@inject
+def handle_elements(
+    events: Sequence[ElementStored],
+    storage: StorageClient = Provide[DIContainer.storage],
+    vec_repo: AbstractVectorRepo = Provide[DIContainer.vec_repo],
+    model_factory: Dict[Type[ElementStored], AbstractEmbeddingModel] = Provide[
+        DIContainer.model_factory
+    ],
+    ingest_reranker_factory: Dict[Element, AbstractReranker] = Provide[
+        DIContainer.ingest_reranker_factory
+    ],
+) -> None:
+    """
+    Batched variant of `handle_element`.
+
+    1. Group events by element type
+    2. Fetch element objects, skipping those that cannot be fetched
+    3. Embed each group in a single batched forward pass
+    4. Bulk insert into vec repo, one call per namespace
+    5. Precompute reranker state of the elements, if the element type's
+       reranker supports it
+    """
+    logger.info(f"Handling {len(events)} ElementStored events")
+    events_by_cls: Dict[Type[ElementStored], List[ElementStored]]
+    events_by_cls = defaultdict(list)
+    for event in events:
+        events_by_cls[event.__class__].append(event)
+
+    for event_cls, cls_events in events_by_cls.items():
+        event_elem = ELEM_TYPES[event_cls]
+        model = model_factory[event_cls]
+
+        keys: List[str] = []
+        objs: List[bytes] = []
+        for event in cls_events:
+            try:
+                objs.append(storage[event.key])
+                keys.append(event.key)
+            except Exception:
+                logger.exception(f"Failed to fetch {event.key=}")
+
+        if not objs:
+            continue
+
+        items_by_namespace: Dict[str, List[Tuple[str, VectorT]]]
+        items_by_namespace = defaultdict(list)
+        for key, vec in _embed_isolated(model, keys, objs):
+            items_by_namespace[_user_from_key(key)].append((key, vec))
+
+        for namespace, items in items_by_namespace.items():
+            vec_repo.insert_many(
+                index_name=_get_vec_repo_idx_name(event_elem),
+                namespace=namespace,
+                items=items,
+            )
+
+        if reranker := ingest_reranker_factory.get(event_elem):
+            try:
+                reranker.index(keys, objs)
+            except Exception:
+                # reranker computes what is missing at query time instead
+                logger.exception(f"Failed to index {len(keys)} for reranker")
+
+
+class _QueryEmbeddings:
+    """
+    Embeds a query at most once per distinct model. Element types whose
+    query models are the same instance share the embedding, and
+    concurrent callers wait on the first caller's result.
+    """
+
+    def __init__(self, text: str):
+        self._data = text.encode("utf-8")
+        self._lock = threading.Lock()
+        self._futures: Dict[int, Future[VectorT]] = {}
+
+    def get(self, model: AbstractEmbeddingModel) -> VectorT:
+        with self._lock:
+            future = self._futures.get(id(model))
+            is_owner = future is None
+            if future is None:
+                future = self._futures[id(model)] = Future()
+
+        if is_owner:
+            try:
+                future.set_result(model.embed(self._data))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+
+def _time_left(deadline: float) -> float:
+    if (time_left := deadline - time.monotonic()) <= 0:
+        raise TimeoutError("Query exceeded its deadline")
+    return time_left
+
+
+def _submit(fn: Callable[..., ScoredKeysT], *args: Any) -> Future[ScoredKeysT]:
+    """
+    Submit to the query executor, logging when element type queries
+    queue behind busy workers, as they then eat into their deadline
+    before they start
+    """
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+        queued = _in_flight - QUERY_WORKERS
+    if queued > 0:
+        logger.warning(f"Query executor saturated, {queued} queries queued")
+    future = _query_executor.submit(fn, *args)
+    future.add_done_callback(_on_query_done)
+    return future
+
+
+def _on_query_done(future: Future[ScoredKeysT]) -> None:
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+def _query_modal(
+    elem: Element,
+    user: str,
+    text: str,
+    top_n: int,
+    storage_fetcher: StorageFetcher,
+    vec_repo: AbstractVectorRepo,
+    text_model: AbstractEmbeddingModel,
+    reranker: Optional[AbstractReranker],
+    query_embs: _QueryEmbeddings,
+    deadline: float,
+) -> ScoredKeysT:
+    """
+    Query and rerank the candidates of a single element type, best
+    first. RRF only needs the reranked top_n. zscore fusion standardizes
+    scores over every candidate, so all of them are returned, at the
+    cost of TOP_N_MULTIPLIER times as many hits to sort, send back from
+    a model server and fuse.
+
+    The caller stops waiting at `deadline`, so the deadline is checked
+    before each step and passed on as the time budget of fetching and
+    reranking, which frees the worker rather than finishing work whose
+    result is dropped.
+    """
+    # query vector repo for candidates
+    _time_left(deadline)
+    query_vec = query_embs.get(text_model)
+    scored = vec_repo.query(
+        index_name=_get_vec_repo_idx_name(elem),
+        namespace=user,
+        vec=query_vec,
+        top_k=top_n * TOP_N_MULTIPLIER,
+    )
+    logger.info(f"Found {len(scored)} {elem.value} candidates")
+
+    if len(scored) < top_n or not reranker:
+        return scored
+
+    # rerank candidates
+    keys = [key for key, _ in scored]
+    timeout_s = _time_left(deadline)
+    top_k = len(keys) if Fusion(FUSION_METHOD) == Fusion.ZSCORE else top_n
+    ranks = reranker.rerank(
+        text,
+        storage_fetcher.fetch_many(keys, timeout_s),
+        top_k,
+        keys,
+        timeout_s,
     )
+    return [(keys[i], score) for i, score in ranks]
+
+
+def _submit_queries(
+    user: str,
+    text: str,
+    top_n: int,
+    exclude_elems: Optional[List[str]],
+    storage_fetcher: StorageFetcher,
+    vec_repo: AbstractVectorRepo,
+    query_model_factory: Dict[Element, AbstractEmbeddingModel],
+    reranker_factory: Dict[Element, AbstractReranker],
+    deadline: float,
+) -> Dict[Element, Future[ScoredKeysT]]:
+    """Query every element type that is not excluded concurrently"""
+    query_embs = _QueryEmbeddings(text)
+    return {
+        elem: _submit(
+            _query_modal,
+            elem,
+            user,
+            text,
+            top_n,
+            storage_fetcher,
+            vec_repo,
+            text_model,
+            reranker_factory.get(elem),
+            query_embs,
+            deadline,
+        )
+        for elem, text_model in query_model_factory.items()
+        if not (exclude_elems and elem.value in exclude_elems)
+    }
 
 
 @inject
@@ -66,7 +318,7 @@ def handle_query_text(
     text: str,
     top_n: int,
     exclude_elems: Optional[List[str]] = None,
-    storage: StorageClient = Provide[DIContainer.storage],
+    storage_fetcher: StorageFetcher = Provide[DIContainer.storage_fetcher],
     vec_repo: AbstractVectorRepo = Provide[DIContainer.vec_repo],
     query_model_factory: Dict[Element, AbstractEmbeddingModel] = Provide[
         DIContainer.query_model_factory
@@ -74,46 +326,98 @@ def handle_query_text(
     reranker_factory: Dict[Element, AbstractReranker] = Provide[
         DIContainer.reranker_factory
     ],
-) -> KeysT:
+) -> List[Hit]:
     """
     1. For each element type, use the corresponding embedding model to
        embed text, use the embedding to query vec repo for the most
        relevant candidates (>= top_n candidates)
     2. Rerank candidates against query text using the reranker
        specific to the modal
-    3. Return top_n elements
-    """
-
-    def _generate_objs(keys: Iterable[str]) -> Iterator[bytes]:
-        for key in keys:
-            yield storage[key]
+    3. Fuse the candidates of all element types and return the top_n
+       elements with their fused scores
 
+    Element types are processed concurrently. Element types that fail
+    or do not finish within QUERY_MODAL_TIMEOUT_S of the start of the
+    query are left out of the results.
+    """
     logger.info(f"Handling query text {user=} {text=}")
-    res: KeysT = []
-    enc_text = text.encode("utf-8")
+    deadline = time.monotonic() + QUERY_MODAL_TIMEOUT_S
+    futures = _submit_queries(
+        user,
+        text,
+        top_n,
+        exclude_elems,
+        storage_fetcher,
+        vec_repo,
+        query_model_factory,
+        reranker_factory,
+        deadline,
+    )
 
-    for elem, text_model in query_model_factory.items():
-        if exclude_elems and elem.value in exclude_elems:
-            continue
+    results: Dict[Element, ScoredKeysT] = {}
+    for elem, future in futures.items():
+        try:
+            results[elem] = future.result(
+                timeout=max(0, deadline - time.monotonic())
+            )
+        except TimeoutError:
+            future.cancel()
+            logger.warning(f"Timed out querying {elem.value} candidates")
+        except Exception:
+            logger.exception(f"Failed to query {elem.value} candidates")
+    return fuse(results, top_n)
 
-        # query vector repo for candidates
-        query_vec = text_model.embed(enc_text)
-        keys = vec_repo.query(
-            index_name=_get_vec_repo_idx_name(elem),
-            namespace=user,
-            vec=query_vec,
-            top_k=top_n * TOP_N_MULTIPLIER,
-        )
-        logger.info(f"Found {len(keys)} candidates")
 
-        if len(keys) < top_n:
-            res.extend(keys)
-            continue
+@inject
+def stream_query_text(
+    user: str,
+    text: str,
+    top_n: int,
+    exclude_elems: Optional[List[str]] = None,
+    storage_fetcher: StorageFetcher = Provide[DIContainer.storage_fetcher],
+    vec_repo: AbstractVectorRepo = Provide[DIContainer.vec_repo],
+    query_model_factory: Dict[Element, AbstractEmbeddingModel] = Provide[
+        DIContainer.query_model_factory
+    ],
+    reranker_factory: Dict[Element, AbstractReranker] = Provide[
+        DIContainer.reranker_factory
+    ],
+) -> Iterator[Tuple[Element, List[Hit]]]:
+    """
+    Streaming variant of `handle_query_text`, which yields the top_n
+    results of each element type as soon as the element type is done,
+    rather than fused once every element type is done. Scores are those
+    of the element type's reranker, or vec repo if it has none.
+    """
+    logger.info(f"Streaming query text {user=} {text=}")
+    deadline = time.monotonic() + QUERY_MODAL_TIMEOUT_S
+    futures = _submit_queries(
+        user,
+        text,
+        top_n,
+        exclude_elems,
+        storage_fetcher,
+        vec_repo,
+        query_model_factory,
+        reranker_factory,
+        deadline,
+    )
+    elems = {future: elem for elem, future in futures.items()}
 
-        # rerank candidates
-        if reranker := reranker_factory.get(elem):
-            ranks = reranker.rerank(text, _generate_objs(keys), top_n)
-            res.extend([keys[i] for i in ranks])
-        else:
-            res.extend(keys[:top_n])
-    return res
+    try:
+        for future in as_completed(
+            elems, timeout=max(0, deadline - time.monotonic())
+        ):
+            elem = elems.pop(future)
+            try:
+                scored = future.result()[:top_n]
+                yield elem, [Hit(key, elem.value, s) for key, s in scored]
+            except Exception:
+                logger.exception(f"Failed to query {elem.value} candidates")
+    except TimeoutError:
+        for elem in elems.values():
+            logger.warning(f"Timed out querying {elem.value} candidates")
+    finally:
+        # also reached when the client disconnects mid stream
+        for future in elems:
+            future.cancel()
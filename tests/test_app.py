@@ -0,0 +1,110 @@
+import importlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pytest
+from event_core.domain.types import Element
+
+import bootstrap
+import handlers
+from adapters.storage import StorageFetcher
+from fusion import Hit
+from test_handlers import FakeModel, ScoredRepo
+
+URL = "/query/text?user=u&text=query&top_n=2&stream=1"
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    # no models are loaded, the handlers are stubbed by the tests
+    monkeypatch.setattr(bootstrap, "bootstrap", lambda lazy_load=True: None)
+    import entrypoints.app
+
+    return importlib.reload(entrypoints.app)
+
+
+def _stream(vec_repo: ScoredRepo):
+    text_model = FakeModel()
+    return partial(
+        handlers.stream_query_text,
+        storage_fetcher=StorageFetcher({}, 2, 2),
+        vec_repo=vec_repo,
+        query_model_factory={
+            Element.IMAGE: text_model,
+            Element.TEXT: text_model,
+            Element.PLOT: text_model,
+            Element.CODE: FakeModel(),
+        },
+        reranker_factory={},
+    )
+
+
+def test_stream_writes_a_json_line_per_element_type(app_module, monkeypatch):
+    def stream_query_text(user, text, top_n, exclude_elems):
+        yield Element.TEXT, [Hit("u/t1", Element.TEXT.value, 0.5)]
+        yield Element.CODE, []
+
+    monkeypatch.setattr(app_module, "stream_query_text", stream_query_text)
+    response = app_module.app.test_client().get(URL)
+
+    assert response.mimetype == "application/x-ndjson"
+    body = response.get_data(as_text=True)
+    assert body.endswith("\n")
+    assert [json.loads(line) for line in body.splitlines()] == [
+        {
+            "element": Element.TEXT.value,
+            "hits": [
+                {"key": "u/t1", "element": Element.TEXT.value, "score": 0.5}
+            ],
+        },
+        {"element": Element.CODE.value, "hits": []},
+    ]
+
+
+def test_stream_writes_element_types_in_completion_order(
+    app_module, monkeypatch
+):
+    # the reverse of the order in which the queries are submitted
+    order = [
+        Element.CODE.value,
+        Element.PLOT.value,
+        Element.TEXT.value,
+        Element.IMAGE.value,
+    ]
+    gates = {elem: threading.Event() for elem in order}
+    vec_repo = ScoredRepo(gates)
+    monkeypatch.setattr(app_module, "stream_query_text", _stream(vec_repo))
+    # the test client reads the first line before returning, and every
+    # other query returns once the line of the previous one is read
+    gates[order[0]].set()
+    response = app_module.app.test_client().get(URL, buffered=False)
+    lines = []
+    for elem in order:
+        gates[elem].set()
+        lines.append(json.loads(next(response.response)))
+    response.close()
+    assert [line["element"] for line in lines] == order
+    assert all(len(line["hits"]) == 2 for line in lines)
+
+
+def test_stream_cancels_pending_queries_on_disconnect(app_module, monkeypatch):
+    # one query runs at a time, so the others are pending
+    executor = ThreadPoolExecutor(1)
+    monkeypatch.setattr(handlers, "_query_executor", executor)
+    gates = {elem.value: threading.Event() for elem in Element}
+    vec_repo = ScoredRepo(gates)
+    monkeypatch.setattr(app_module, "stream_query_text", _stream(vec_repo))
+    # the image query is submitted first, and its line is read by the test
+    # client before it returns
+    gates[Element.IMAGE.value].set()
+    response = app_module.app.test_client().get(URL, buffered=False)
+    assert json.loads(next(response.response))["hits"]
+    # the client disconnects while the second query is running
+    vec_repo.wait_queried(2)
+    response.close()
+    for gate in gates.values():
+        gate.set()
+    executor.shutdown(wait=True)
+    assert len(vec_repo.queried) == 2
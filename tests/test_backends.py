@@ -0,0 +1,93 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+from adapters.embedders import (
+    CLIPTextModel,
+    CLIPVisionModel,
+    DePlotModel,
+    UniXCoderModel,
+)
+from adapters.embedders import backends
+from adapters.embedders.backends import Backend
+from adapters.precision import Precision
+
+
+@pytest.mark.parametrize(
+    "fixture_filepath,model_cls",
+    (
+        ("test_text_filepath", CLIPTextModel),
+        ("test_image_filepath", CLIPVisionModel),
+        ("test_code_filepath", UniXCoderModel),
+    ),
+)
+def test_onnx_backend_matches_eager(
+    fixture_filepath: str, model_cls, request: pytest.FixtureRequest
+):
+    path: Path = request.getfixturevalue(fixture_filepath)
+    eager = model_cls(precision=Precision.FP32, backend=Backend.EAGER)
+    onnx = model_cls(precision=Precision.FP32, backend=Backend.ONNX)
+
+    data = path.read_bytes()
+    emb = onnx.embed(data)
+    assert emb.dtype == np.float32
+    assert np.allclose(emb, eager.embed(data), atol=1e-4)
+    embs = onnx.embed_many([data, data])
+    assert np.allclose(embs, eager.embed_many([data, data]), atol=1e-4)
+
+
+@pytest.mark.parametrize(
+    "model_cls", (CLIPTextModel, CLIPVisionModel, UniXCoderModel)
+)
+def test_model_id_changes_with_every_variant(model_cls, monkeypatch):
+    monkeypatch.setattr(backends, "weights_revision", lambda repo_id: "abc")
+    model_id = model_cls.variant_id(Precision.FP32, Backend.ONNX)
+    assert model_id.startswith(f"{model_cls.__name__}@abc")
+
+    monkeypatch.setattr(backends, "weights_revision", lambda repo_id: "def")
+    ids = {
+        model_cls.variant_id(Precision.FP32, Backend.ONNX),
+        model_cls.variant_id(Precision.INT8, Backend.ONNX),
+        model_cls.variant_id(Precision.FP32, Backend.EAGER),
+    }
+    assert model_id not in ids
+    assert len(ids) == 3
+    assert DePlotModel.variant_id(model_id) != DePlotModel.variant_id(
+        model_id, Precision.INT8
+    )
+
+
+def test_onnx_graphs_are_keyed_by_revision(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, "ONNX_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(backends, "weights_revision", lambda repo_id: "abc")
+    built = []
+
+    def module_fn() -> torch.nn.Module:
+        built.append(1)
+        return torch.nn.Linear(4, 2)
+
+    def encoder(precision: Precision) -> backends.OnnxEncoder:
+        return backends.OnnxEncoder(
+            "linear",
+            "org/linear",
+            module_fn,
+            {"x": torch.zeros(1, 4)},
+            {"x": {0: "batch"}},
+            precision,
+        )
+
+    embeds = encoder(Precision.FP32)(x=torch.ones(3, 4))
+    assert embeds.shape == (3, 2)
+    encoder(Precision.INT8)
+    assert len(built) == 1
+
+    monkeypatch.setattr(backends, "weights_revision", lambda repo_id: "def")
+    encoder(Precision.FP32)
+    assert len(built) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        f"org--linear@abc.linear.opset{backends.ONNX_OPSET}.fp32.onnx",
+        f"org--linear@abc.linear.opset{backends.ONNX_OPSET}.int8.onnx",
+        f"org--linear@def.linear.opset{backends.ONNX_OPSET}.fp32.onnx",
+    ]
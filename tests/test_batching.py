@@ -0,0 +1,77 @@
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence
+
+import numpy as np
+import pytest
+
+from adapters.common import VectorT
+from adapters.embedders import BatchingEmbeddingModel
+from adapters.embedders.base import AbstractEmbeddingModel
+
+
+class BatchCountingModel(AbstractEmbeddingModel):
+    EMBEDDING_DIM = 4
+
+    def __init__(self):
+        self.batch_sizes: List[int] = []
+
+    def embed(self, data: bytes) -> VectorT:
+        return np.full(self.EMBEDDING_DIM, len(data), dtype=np.float32)
+
+    def embed_many(self, data: Sequence[bytes]) -> VectorT:
+        self.batch_sizes.append(len(data))
+        if b"bad" in data:
+            raise ValueError("bad input")
+        return np.stack([self.embed(item) for item in data])
+
+
+def test_batching_model_coalesces_concurrent_embeds():
+    model = BatchCountingModel()
+    batching = BatchingEmbeddingModel(model, max_batch_size=8, max_wait_s=0.05)
+    inputs = [b"x" * i for i in range(16)]
+    with ThreadPoolExecutor(16) as executor:
+        embs = list(executor.map(batching.embed, inputs))
+
+    assert [emb[0] for emb in embs] == list(range(16))
+    assert sum(model.batch_sizes) == 16
+    assert len(model.batch_sizes) < 16
+    assert max(model.batch_sizes) <= 8
+
+
+def test_batching_model_propagates_errors():
+    model = BatchCountingModel()
+    batching = BatchingEmbeddingModel(model, max_wait_s=0)
+    with pytest.raises(ValueError):
+        batching.embed(b"bad")
+    assert batching.embed(b"ok")[0] == 2
+
+
+def test_batching_model_results_own_their_data():
+    batching = BatchingEmbeddingModel(BatchCountingModel(), max_wait_s=0)
+    emb = batching.embed(b"ok")
+    assert emb.base is None
+
+
+def test_batching_model_starts_its_thread_on_first_embed():
+    before = threading.active_count()
+    batching = BatchingEmbeddingModel(BatchCountingModel(), max_wait_s=0)
+    assert threading.active_count() == before
+
+    batching.embed(b"ok")
+    assert threading.active_count() == before + 1
+
+
+def test_batching_model_embeds_after_fork():
+    batching = BatchingEmbeddingModel(BatchCountingModel(), max_wait_s=0)
+    batching.embed(b"ok")
+
+    pid = os.fork()
+    if pid == 0:
+        # the parent's thread is not carried over to the child
+        signal.alarm(5)
+        os._exit(0 if batching.embed(b"child")[0] == 5 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
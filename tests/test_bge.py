@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import torch
+
+from adapters.rerankers.bge import BgeReranker
+
+
+class StubTokenizer:
+    """
+    Tokenizes a candidate "<score> w w ..." into its score followed by a
+    token per word, so that the stub model can read back the score
+    """
+
+    def __call__(
+        self,
+        queries: List[str],
+        texts: List[str],
+        truncation: bool,
+        max_length: int,
+    ) -> Dict[str, List[List[int]]]:
+        input_ids = []
+        for text in texts:
+            score, *words = text.split()
+            input_ids.append([int(score)] + [1] * len(words))
+        return {
+            "input_ids": [ids[:max_length] for ids in input_ids],
+            "attention_mask": [
+                [1] * len(ids[:max_length]) for ids in input_ids
+            ],
+        }
+
+    def pad(
+        self, encodings: Dict[str, List[List[int]]], return_tensors: str
+    ) -> Dict[str, torch.Tensor]:
+        width = max(map(len, encodings["input_ids"]))
+        return {
+            name: torch.tensor(
+                [row + [0] * (width - len(row)) for row in rows]
+            )
+            for name, rows in encodings.items()
+        }
+
+
+class StubModel:
+    """Scores a pair by its first token, and records the batch shapes"""
+
+    def __init__(self):
+        self.shapes: List[torch.Size] = []
+
+    def __call__(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        return_dict: bool,
+    ) -> SimpleNamespace:
+        self.shapes.append(input_ids.shape)
+        return SimpleNamespace(logits=input_ids[:, :1].float())
+
+
+def _reranker(
+    batch_size: int = 2, min_score: Optional[float] = None
+) -> BgeReranker:
+    reranker = BgeReranker.__new__(BgeReranker)
+    reranker._tokenizer = StubTokenizer()
+    reranker._model = StubModel()
+    reranker._batch_size = batch_size
+    reranker._max_length = 8
+    reranker._min_score = min_score
+    return reranker
+
+
+def _candidates(*score_lengths):
+    return iter(
+        " ".join([str(score)] + ["w"] * length).encode()
+        for score, length in score_lengths
+    )
+
+
+def test_rerank_maps_length_buckets_back_to_candidates():
+    reranker = _reranker(batch_size=2)
+    # scores in descending length order, so that buckets reorder them
+    candidates = _candidates((1, 6), (4, 0), (2, 5), (3, 1), (5, 3))
+    ranked = reranker.rerank("query", candidates, top_k=5)
+
+    assert ranked == [(4, 5.0), (1, 4.0), (3, 3.0), (2, 2.0), (0, 1.0)]
+    # pairs are padded to the longest pair of their bucket only
+    assert reranker._model.shapes == [(2, 2), (2, 6), (1, 7)]
+
+
+def test_rerank_returns_every_candidate_when_top_k_exceeds_them():
+    reranker = _reranker()
+    ranked = reranker.rerank("query", _candidates((2, 1), (3, 2)), top_k=10)
+
+    assert ranked == [(1, 3.0), (0, 2.0)]
+    assert reranker.rerank("query", iter([]), top_k=10) == []
+
+
+def test_rerank_cuts_candidates_below_min_score():
+    reranker = _reranker(min_score=3)
+    candidates = _candidates((1, 1), (3, 2), (5, 3), (2, 4))
+    ranked = reranker.rerank("query", candidates, top_k=3)
+
+    assert ranked == [(2, 5.0), (1, 3.0)]
@@ -0,0 +1,123 @@
+import time
+from typing import List, Sequence
+
+import numpy as np
+
+from adapters.cache import LRUCache, SqliteTextCache, SqliteVectorCache
+from adapters.common import VectorT
+from adapters.embedders import (
+    CachedEmbeddingModel,
+    DePlotModel,
+    normalize_text,
+)
+from adapters.embedders.base import AbstractEmbeddingModel
+
+
+class CountingModel(AbstractEmbeddingModel):
+    EMBEDDING_DIM = 4
+
+    def __init__(self):
+        self.calls: List[bytes] = []
+
+    def embed(self, data: bytes) -> VectorT:
+        self.calls.append(data)
+        return np.full(self.EMBEDDING_DIM, len(data), dtype=np.float32)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache: LRUCache[int] = LRUCache(capacity=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats.evictions == 1
+    assert (cache.stats.hits, cache.stats.misses) == (3, 1)
+
+
+def test_lru_cache_expires_entries():
+    cache: LRUCache[int] = LRUCache(capacity=2, ttl_s=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_cached_model_skips_inference_on_hit():
+    model = CountingModel()
+    cached = CachedEmbeddingModel(model, LRUCache(16), normalize_text)
+    first = cached.embed(b"hello  world")
+    second = cached.embed(b" hello world\n")
+    assert np.array_equal(first, second)
+    assert model.calls == [b"hello  world"]
+
+    embs = cached.embed_many([b"hello world", b"new", b"new"])
+    assert embs.shape == (3, CountingModel.EMBEDDING_DIM)
+    assert model.calls == [b"hello  world", b"new"]
+
+
+def test_sqlite_cache_persists(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    vec = np.arange(4, dtype=np.float32)
+    SqliteVectorCache(path).set("key", vec)
+
+    cache = SqliteVectorCache(path)
+    assert np.array_equal(cache.get("key"), vec)
+    assert cache.get("missing") is None
+
+
+def test_sqlite_text_cache_persists_and_replaces(tmp_path):
+    path = str(tmp_path / "tables.db")
+    SqliteTextCache(path).set("plot", "a | b\n1 | 2 ünïcode")
+
+    cache = SqliteTextCache(path)
+    assert cache.get("plot") == "a | b\n1 | 2 ünïcode"
+    cache.set("plot", "c | d")
+    assert cache.get("plot") == "c | d"
+    assert cache.get("missing") is None
+    assert (cache.stats.hits, cache.stats.misses) == (2, 1)
+
+
+def test_lru_cache_bounds_total_weight():
+    cache: LRUCache[bytes] = LRUCache(capacity=10, weigher=len)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    cache.set("c", b"1234")
+    assert cache.get("a") is None
+    assert cache.weight == 8
+    assert (cache.stats.evictions, cache.stats.evicted_weight) == (1, 4)
+
+    cache.set("too_big", b"x" * 11)
+    assert cache.get("too_big") is None
+    assert cache.weight == 8
+
+
+def _deplot(table_id: str, table_store: LRUCache[str]) -> DePlotModel:
+    model = DePlotModel.__new__(DePlotModel)
+    model._table_store = table_store
+    model._table_id = table_id
+    model.generated = []
+
+    def generate(data: Sequence[bytes]) -> List[str]:
+        model.generated.extend(data)
+        return [f"{table_id} {item.decode()}" for item in data]
+
+    model._generate_tables = generate
+    return model
+
+
+def test_deplot_table_store_keys_on_variant():
+    table_store: LRUCache[str] = LRUCache(capacity=10)
+    fp32 = _deplot("DePlotModel@abc:fp32", table_store)
+    assert fp32.extract_tables([b"p1", b"p2"]) == [
+        "DePlotModel@abc:fp32 p1",
+        "DePlotModel@abc:fp32 p2",
+    ]
+    assert fp32.extract_tables([b"p2"]) == ["DePlotModel@abc:fp32 p2"]
+    assert fp32.generated == [b"p1", b"p2"]
+
+    # another variant does not reuse the tables of the first
+    int8 = _deplot("DePlotModel@abc:int8", table_store)
+    assert int8.extract_tables([b"p1"]) == ["DePlotModel@abc:int8 p1"]
+    assert int8.generated == [b"p1"]
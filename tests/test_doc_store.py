@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+import torch
+
+from adapters.doc_store import MultiVectorStore
+from adapters.rerankers.colpali import ColpaliReranker
+from adapters.storage import StorageFetcher
+from test_storage import FakeStorage
+
+
+def test_multi_vector_store_roundtrip(tmp_path):
+    store = MultiVectorStore(str(tmp_path))
+    embs = np.random.rand(10, 128).astype(np.float32)
+    assert "user/doc.png" not in store
+    assert store.get("user/doc.png") is None
+
+    store.put("user/doc.png", embs)
+    assert "user/doc.png" in store
+    stored = store.get("user/doc.png")
+    assert stored.dtype == np.float16
+    assert np.allclose(stored, embs, atol=1e-3)
+
+    store.delete("user/doc.png")
+    assert store.get("user/doc.png") is None
+
+
+def test_multi_vector_store_concurrent_puts_of_a_key(tmp_path):
+    store = MultiVectorStore(str(tmp_path))
+    embs = np.random.rand(64, 128).astype(np.float32)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for future in [
+            executor.submit(store.put, "user/doc.png", embs) for _ in range(32)
+        ]:
+            future.result()
+
+    assert np.allclose(store.get("user/doc.png"), embs, atol=1e-3)
+    assert not list(tmp_path.glob("*/*.tmp"))
+
+
+def test_colpali_fetches_only_candidates_without_stored_embeddings(tmp_path):
+    store = MultiVectorStore(str(tmp_path))
+    keys = [f"user/doc{i}.png" for i in range(4)]
+    for key in keys[:3]:
+        store.put(key, np.ones((2, 4)))
+    storage = FakeStorage({key: key.encode() for key in keys})
+
+    reranker = ColpaliReranker.__new__(ColpaliReranker)
+    reranker._doc_store = store
+    reranker._storage_fetcher = StorageFetcher(storage, 2, 2)
+    embedded: List[bytes] = []
+
+    def _embed_images(images, deadline=None):
+        objs = list(images)
+        embedded.extend(objs)
+        return [torch.zeros((2, 4)) for _ in objs]
+
+    reranker._embed_images = _embed_images
+    # a fetch of all candidates would read every key from storage
+    candidates = (storage[key] for key in keys)
+    embs = reranker._load_doc_embs(keys, candidates, None)
+
+    assert len(embs) == len(keys)
+    assert storage.fetched == [keys[3]]
+    assert embedded == [keys[3].encode()]
+    assert keys[3] in store
@@ -1,5 +1,6 @@
 from pathlib import Path
 
+import numpy as np
 import pytest
 
 from adapters.embedders import AbstractEmbeddingModel
@@ -33,3 +34,48 @@ def test_clip_text_model(
     model: AbstractEmbeddingModel = request.getfixturevalue(fixture_model)
     emb = model.embed(path.read_bytes())
     assert len(emb) == type(model).EMBEDDING_DIM
+    assert emb.dtype == np.float32
+
+
+@pytest.mark.parametrize(
+    "fixture_filepath,fixture_model",
+    (
+        (
+            "test_text_filepath",
+            "text_model",
+        ),
+        (
+            "test_image_filepath",
+            "vision_model",
+        ),
+        (
+            "test_plot_filepath",
+            "plot_model",
+        ),
+        (
+            "test_code_filepath",
+            "code_model",
+        ),
+    ),
+)
+def test_embed_many_matches_embed(
+    fixture_filepath: str, fixture_model: str, request: pytest.FixtureRequest
+):
+    path: Path = request.getfixturevalue(fixture_filepath)
+    model: AbstractEmbeddingModel = request.getfixturevalue(fixture_model)
+    data = path.read_bytes()
+    embs = model.embed_many([data, data])
+    assert embs.shape == (2, type(model).EMBEDDING_DIM)
+    assert np.allclose(embs[0], model.embed(data), atol=1e-4)
+    assert np.allclose(embs[0], embs[1], atol=1e-4)
+
+
+@pytest.mark.parametrize("fixture_model", ("text_model", "code_model"))
+def test_embed_many_padding(
+    fixture_model: str, request: pytest.FixtureRequest
+):
+    model: AbstractEmbeddingModel = request.getfixturevalue(fixture_model)
+    data = [b"def f(x): return x", b"short", b"a much longer input " * 20]
+    embs = model.embed_many(data)
+    for emb, item in zip(embs, data):
+        assert np.allclose(emb, model.embed(item), atol=1e-4)
@@ -0,0 +1,138 @@
+import threading
+import time
+from typing import List, Sequence
+
+from event_core.domain.events.elements import (
+    ElementStored,
+    ImageElementStored,
+    PlotElementStored,
+    TextElementStored,
+)
+
+from config import (
+    DEPLOT_BATCH_SIZE,
+    INGEST_BATCH_SIZE,
+    INGEST_MAX_WAIT_S,
+    PLOT_MAX_PENDING,
+    PLOT_WORKERS,
+)
+from entrypoints.event_consumer import EventBatcher, EventRouter, WorkerPool
+
+
+class Recorder:
+    def __init__(self):
+        self.batches: List[List[str]] = []
+        self.flushed = threading.Event()
+
+    def __call__(self, batch: Sequence[ElementStored]) -> None:
+        self.batches.append([event.key for event in batch])
+        self.flushed.set()
+
+
+def test_batcher_flushes_full_batches():
+    recorder = Recorder()
+    batcher = EventBatcher(recorder, max_batch_size=2, max_wait_s=60)
+    batcher.add(TextElementStored(key="u/t1"))
+    batcher.add(ImageElementStored(key="u/i1"))
+    assert recorder.batches == []
+
+    batcher.add(TextElementStored(key="u/t2"))
+    assert recorder.batches == [["u/t1", "u/t2"]]
+    batcher.close()
+
+
+def test_batcher_flushes_batches_that_waited_max_wait_s():
+    recorder = Recorder()
+    batcher = EventBatcher(recorder, max_batch_size=100, max_wait_s=0.05)
+    start = time.monotonic()
+    batcher.add(TextElementStored(key="u/t1"))
+
+    assert recorder.flushed.wait(timeout=5)
+    assert time.monotonic() - start >= 0.05
+    assert recorder.batches == [["u/t1"]]
+    batcher.close()
+
+
+def test_batcher_close_drains_every_batch():
+    recorder = Recorder()
+    batcher = EventBatcher(recorder, max_batch_size=100, max_wait_s=60)
+    batcher.add(TextElementStored(key="u/t1"))
+    batcher.add(ImageElementStored(key="u/i1"))
+    batcher.add(TextElementStored(key="u/t2"))
+    batcher.close()
+
+    assert sorted(recorder.batches) == [["u/i1"], ["u/t1", "u/t2"]]
+
+
+def test_worker_pool_blocks_submit_while_full():
+    release = threading.Event()
+    handled: List[str] = []
+
+    def handle(batch: Sequence[ElementStored]) -> None:
+        release.wait(timeout=5)
+        handled.extend(event.key for event in batch)
+
+    pool = WorkerPool(handle, max_workers=1, max_pending=1)
+    pool.submit([TextElementStored(key="u/t1")])
+    pool.submit([TextElementStored(key="u/t2")])
+
+    blocked = threading.Thread(
+        target=pool.submit, args=([TextElementStored(key="u/t3")],)
+    )
+    blocked.start()
+    blocked.join(timeout=0.1)
+    # one batch is handled and one is queued, so the third waits
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join(timeout=5)
+    assert not blocked.is_alive()
+    pool.close()
+    assert handled == ["u/t1", "u/t2", "u/t3"]
+
+
+def test_worker_pool_frees_slots_of_failed_batches():
+    def handle(batch: Sequence[ElementStored]) -> None:
+        raise ValueError("handling failed")
+
+    pool = WorkerPool(handle, max_workers=1, max_pending=0)
+    submitted = threading.Thread(
+        target=lambda: [
+            pool.submit([TextElementStored(key=f"u/t{i}")]) for i in range(3)
+        ]
+    )
+    submitted.start()
+    submitted.join(timeout=5)
+    assert not submitted.is_alive()
+    pool.close()
+
+
+def test_router_slow_plots_do_not_block_text_with_default_config():
+    plot_started = threading.Event()
+    release = threading.Event()
+    handled: List[str] = []
+
+    def handle(batch: Sequence[ElementStored]) -> None:
+        if isinstance(batch[0], PlotElementStored):
+            plot_started.set()
+            release.wait(timeout=5)
+        handled.extend(event.key for event in batch)
+
+    router = EventRouter(
+        handle,
+        INGEST_BATCH_SIZE,
+        INGEST_MAX_WAIT_S,
+        DEPLOT_BATCH_SIZE,
+        PLOT_WORKERS,
+        PLOT_MAX_PENDING,
+    )
+    router.route(PlotElementStored(key="u/p1"))
+    assert plot_started.wait(timeout=5)
+
+    # the text event is handled while the plot is still being handled
+    router.route(TextElementStored(key="u/t1"))
+    assert handled == ["u/t1"]
+
+    release.set()
+    router.close()
+    assert handled == ["u/t1", "u/p1"]
@@ -0,0 +1,30 @@
+from event_core.domain.types import Element
+
+from fusion import Fusion, fuse
+
+
+def test_rrf_interleaves_element_types_by_rank():
+    results = {
+        Element.TEXT: [("t1", 9.0), ("t2", 8.0)],
+        Element.IMAGE: [("i1", 0.3), ("i2", 0.2), ("i3", 0.1)],
+    }
+    hits = fuse(results, 3, Fusion.RRF)
+    assert [hit.key for hit in hits] == ["t1", "i1", "t2"]
+    assert hits[1].element == Element.IMAGE.value
+    assert hits[0].score > hits[2].score
+
+
+def test_zscore_ranks_by_standardized_scores():
+    results = {
+        # i1 stands out among its element type, t1 does not
+        Element.TEXT: [("t1", 9.0), ("t2", 8.9), ("t3", 8.8)],
+        Element.IMAGE: [("i1", 0.9), ("i2", 0.1), ("i3", 0.1)],
+    }
+    hits = fuse(results, 2, Fusion.ZSCORE)
+    assert [hit.key for hit in hits] == ["i1", "t1"]
+
+
+def test_fuse_returns_at_most_top_n():
+    assert fuse({}, 5) == []
+    hits = fuse({Element.CODE: [("c1", 1.0), ("c2", 1.0)]}, 1)
+    assert [hit.key for hit in hits] == ["c1"]
@@ -0,0 +1,218 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pytest
+from event_core.domain.types import Element
+
+import handlers
+from adapters.common import ScoredKeysT, VectorT
+from adapters.embedders.base import AbstractEmbeddingModel
+from adapters.rerankers.base import TOP_K, AbstractReranker
+from adapters.storage import StorageFetcher
+from conftest import FakeVectorRepo
+from handlers import handle_query_text
+
+TOP_N = 2
+
+
+class FakeModel(AbstractEmbeddingModel):
+    EMBEDDING_DIM = 2
+
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self._fail = fail
+        self._lock = threading.Lock()
+
+    def embed(self, data: bytes) -> VectorT:
+        with self._lock:
+            self.calls += 1
+        if self._fail:
+            raise ValueError("embedding failed")
+        return np.ones(self.EMBEDDING_DIM, dtype=np.float32)
+
+
+class ScoredRepo(FakeVectorRepo):
+    """
+    Returns top_k candidates per index. Queries of an index in `gates`
+    return once its event is set, and every query waits at `barrier` if
+    given
+    """
+
+    def __init__(
+        self,
+        gates: Optional[Dict[str, threading.Event]] = None,
+        barrier: Optional[threading.Barrier] = None,
+    ):
+        super().__init__()
+        self.queried: List[str] = []
+        self._gates = gates or {}
+        self._barrier = barrier
+        self._queried_cond = threading.Condition()
+
+    def query(
+        self, index_name: str, namespace: str, vec: VectorT, top_k: int = 5
+    ) -> ScoredKeysT:
+        with self._queried_cond:
+            self.queried.append(index_name)
+            self._queried_cond.notify_all()
+        if self._barrier:
+            self._barrier.wait(timeout=5)
+        if gate := self._gates.get(index_name):
+            gate.wait(timeout=5)
+        return [
+            (f"{namespace}/{index_name}-{i}", 1 - i / top_k)
+            for i in range(top_k)
+        ]
+
+    def wait_queried(self, n: int) -> None:
+        """Wait for `n` queries to have started"""
+        with self._queried_cond:
+            assert self._queried_cond.wait_for(
+                lambda: len(self.queried) >= n, timeout=5
+            )
+
+
+class FakeReranker(AbstractReranker):
+    def __init__(self):
+        self.top_ks: List[int] = []
+        self.timeouts_s: List[Optional[float]] = []
+
+    def rerank(
+        self,
+        query: str,
+        candidates: Iterator[bytes],
+        top_k: int = TOP_K,
+        keys: Optional[Sequence[str]] = None,
+        timeout_s: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        self.top_ks.append(top_k)
+        self.timeouts_s.append(timeout_s)
+        assert keys is not None
+        return [(i, float(i)) for i in range(len(keys))][::-1][:top_k]
+
+
+def _query(
+    vec_repo: ScoredRepo,
+    exclude_elems: Optional[List[str]] = None,
+    text_model: Optional[AbstractEmbeddingModel] = None,
+    reranker: Optional[AbstractReranker] = None,
+):
+    text_model = text_model or FakeModel()
+    return handle_query_text(
+        "u",
+        "query",
+        TOP_N,
+        exclude_elems,
+        storage_fetcher=StorageFetcher({}, 2, 2),
+        vec_repo=vec_repo,
+        query_model_factory={
+            Element.IMAGE: text_model,
+            Element.TEXT: text_model,
+            Element.PLOT: text_model,
+            Element.CODE: FakeModel(),
+        },
+        reranker_factory={Element.TEXT: reranker} if reranker else {},
+    )
+
+
+def test_query_text_queries_element_types_concurrently():
+    # every element type's query waits for all of them to have started
+    vec_repo = ScoredRepo(barrier=threading.Barrier(len(Element)))
+    hits = _query(vec_repo)
+
+    assert sorted(vec_repo.queried) == sorted(elem.value for elem in Element)
+    assert len(hits) == TOP_N
+
+
+def test_query_text_drops_element_types_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(handlers, "QUERY_MODAL_TIMEOUT_S", 0.2)
+    # the code query only returns once the others have been returned
+    code_gate = threading.Event()
+    try:
+        hits = _query(ScoredRepo({Element.CODE.value: code_gate}))
+    finally:
+        code_gate.set()
+
+    assert hits
+    assert Element.CODE.value not in {hit.element for hit in hits}
+
+
+def test_query_text_passes_the_time_left_to_rerankers(monkeypatch):
+    monkeypatch.setattr(handlers, "QUERY_MODAL_TIMEOUT_S", 0.2)
+    reranker = FakeReranker()
+    hits = _query(ScoredRepo(), reranker=reranker)
+
+    assert hits
+    (timeout_s,) = reranker.timeouts_s
+    assert timeout_s is not None and 0 < timeout_s <= 0.2
+
+
+def test_query_text_skips_reranking_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(handlers, "QUERY_MODAL_TIMEOUT_S", 0.1)
+    executor = ThreadPoolExecutor(len(Element))
+    monkeypatch.setattr(handlers, "_query_executor", executor)
+    reranker = FakeReranker()
+    text_gate = threading.Event()
+    vec_repo = ScoredRepo({Element.TEXT.value: text_gate})
+    hits = _query(vec_repo, reranker=reranker)
+    # the text query returns from the repo past the deadline
+    text_gate.set()
+    executor.shutdown(wait=True)
+
+    assert Element.TEXT.value not in {hit.element for hit in hits}
+    assert reranker.timeouts_s == []
+
+
+def test_query_text_skips_excluded_element_types():
+    vec_repo = ScoredRepo()
+    hits = _query(vec_repo, exclude_elems=[Element.CODE.value])
+
+    assert Element.CODE.value not in vec_repo.queried
+    assert sorted(vec_repo.queried) == sorted(
+        elem.value for elem in Element if elem != Element.CODE
+    )
+    assert Element.CODE.value not in {hit.element for hit in hits}
+
+
+def test_time_left_raises_past_the_deadline():
+    assert handlers._time_left(time.monotonic() + 10) > 9
+    with pytest.raises(TimeoutError):
+        handlers._time_left(time.monotonic() - 1)
+
+
+def test_query_text_embeds_once_per_shared_model():
+    # IMAGE, TEXT and PLOT share the text model, whether or not their
+    # queries overlap
+    text_model = FakeModel()
+    vec_repo = ScoredRepo()
+    _query(vec_repo, text_model=text_model)
+
+    assert text_model.calls == 1
+    assert len(vec_repo.queried) == len(Element)
+
+
+def test_query_text_embedding_errors_reach_every_waiter():
+    text_model = FakeModel(fail=True)
+    vec_repo = ScoredRepo()
+    hits = _query(vec_repo, text_model=text_model)
+
+    assert text_model.calls == 1
+    assert vec_repo.queried == [Element.CODE.value]
+    assert {hit.element for hit in hits} == {Element.CODE.value}
+
+
+@pytest.mark.parametrize(
+    "fusion_method,top_k",
+    (("rrf", TOP_N), ("zscore", TOP_N * handlers.TOP_N_MULTIPLIER)),
+)
+def test_query_text_reranks_what_fusion_needs(
+    fusion_method, top_k, monkeypatch
+):
+    monkeypatch.setattr(handlers, "FUSION_METHOD", fusion_method)
+    reranker = FakeReranker()
+    _query(ScoredRepo(), reranker=reranker)
+
+    assert reranker.top_ks == [top_k]
@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from adapters.common import VectorT
+from adapters.embedders import LazyEmbeddingModel
+from adapters.embedders.base import AbstractEmbeddingModel
+from adapters.model_registry import ModelRegistry
+
+
+class ConstantModel(AbstractEmbeddingModel):
+    EMBEDDING_DIM = 4
+
+    def embed(self, data: bytes) -> VectorT:
+        return np.ones(self.EMBEDDING_DIM, dtype=np.float32)
+
+
+class CountingLoader:
+    def __init__(self, delay_s: float = 0):
+        self.loads = 0
+        self._delay_s = delay_s
+        self._lock = threading.Lock()
+
+    def __call__(self) -> ConstantModel:
+        time.sleep(self._delay_s)
+        with self._lock:
+            self.loads += 1
+        return ConstantModel()
+
+
+def test_registry_coalesces_concurrent_loads():
+    registry = ModelRegistry(idle_s=0, memory_budget_bytes=0)
+    loader = CountingLoader(delay_s=0.05)
+    model = LazyEmbeddingModel(registry, "m", loader, "m-id", 4)
+
+    assert model.model_id == "m-id"
+    assert registry.loaded == {}
+    with ThreadPoolExecutor(8) as executor:
+        embs = list(executor.map(model.embed, [b"x"] * 8))
+
+    assert loader.loads == 1
+    assert all(emb.shape == (4,) for emb in embs)
+    assert list(registry.loaded) == ["m"]
+
+
+def test_registry_evicts_idle_models():
+    registry = ModelRegistry(idle_s=0.05, memory_budget_bytes=0)
+    loader = CountingLoader()
+    registry.register("m", loader)
+
+    with registry.acquire("m"):
+        time.sleep(0.1)
+        # in use, so not evicted however long
+        assert list(registry.loaded) == ["m"]
+    time.sleep(0.2)
+    assert registry.loaded == {}
+
+    with registry.acquire("m"):
+        pass
+    assert loader.loads == 2
+    registry.close()
+
+
+def test_registry_evicts_least_recently_used_over_budget():
+    registry = ModelRegistry(idle_s=0, memory_budget_bytes=100)
+    for name in ("a", "b", "c"):
+        registry.register(name, CountingLoader(), nbytes=40)
+
+    for name in ("a", "b", "a"):
+        with registry.acquire(name):
+            pass
+    assert registry.loaded == {"a": 40, "b": 40}
+
+    with registry.acquire("c"):
+        pass
+    assert registry.loaded == {"a": 40, "c": 40}
@@ -0,0 +1,144 @@
+import os
+import socket
+import stat
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Connection
+from typing import Iterator, List
+
+import numpy as np
+import pytest
+from event_core.domain.types import Element
+
+from adapters.common import VectorT
+from adapters.embedders.remote import RemoteEmbeddingModel
+from adapters.model_client import ModelServerClient, ModelServerError
+from adapters.rerankers.remote import RemoteReranker
+from adapters.storage import StorageFetcher
+from entrypoints.model_server import ModelServer, listen
+from test_handlers import FakeModel, FakeReranker
+
+AUTHKEY = b"secret"
+
+
+class TrackingServer(ModelServer):
+    """Records its connections, so that tests can drop them"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.conns: List[Connection] = []
+
+    def serve(self, conn: Connection) -> None:
+        self.conns.append(conn)
+        super().serve(conn)
+
+    def drop_connections(self) -> None:
+        for conn in self.conns:
+            sock = socket.socket(fileno=os.dup(conn.fileno()))
+            sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+
+
+class BlockedModel(FakeModel):
+    """Embeds once `release` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def embed(self, data: bytes) -> VectorT:
+        self.release.wait(timeout=5)
+        return super().embed(data)
+
+
+@pytest.fixture
+def address(tmp_path) -> str:
+    return str(tmp_path / "models.sock")
+
+
+@pytest.fixture
+def blocked() -> Iterator[BlockedModel]:
+    blocked = BlockedModel()
+    yield blocked
+    blocked.release.set()
+
+
+@pytest.fixture
+def server(address, blocked) -> TrackingServer:
+    server = TrackingServer(
+        {
+            Element.TEXT: FakeModel(),
+            Element.CODE: FakeModel(fail=True),
+            Element.IMAGE: blocked,
+        },
+        {Element.TEXT: FakeReranker()},
+        StorageFetcher({"u/t0": b"t0", "u/t1": b"t1"}, 2, 2),
+    )
+    listener = listen(address, AUTHKEY)
+    threading.Thread(
+        target=server.serve_forever, args=(listener,), daemon=True
+    ).start()
+    return server
+
+
+def test_socket_is_private_to_its_user(server, address):
+    assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+
+
+def test_round_trip(server, address):
+    client = ModelServerClient(address, AUTHKEY, connect_timeout_s=0)
+    model = RemoteEmbeddingModel(client, Element.TEXT)
+    assert model.EMBEDDING_DIM == FakeModel.EMBEDDING_DIM
+
+    assert np.array_equal(model.embed(b"query"), np.ones(2))
+    assert model.embed_many([b"a", b"b"]).shape == (2, 2)
+
+    reranker = RemoteReranker(client, Element.TEXT)
+    keys = ["u/t0", "u/t1"]
+    assert reranker.rerank("q", iter([]), 2, keys) == [(1, 1.0), (0, 0.0)]
+    candidates = iter([b"t0", b"t1"])
+    assert reranker.rerank("q", candidates, 1, keys) == [(1, 1.0)]
+
+
+def test_remote_exceptions_propagate(server, address):
+    client = ModelServerClient(address, AUTHKEY, connect_timeout_s=0)
+    model = RemoteEmbeddingModel(client, Element.CODE)
+    with pytest.raises(ModelServerError, match="ValueError: embedding failed"):
+        model.embed(b"query")
+    # the connection keeps serving after an error
+    text_model = RemoteEmbeddingModel(client, Element.TEXT)
+    assert np.array_equal(text_model.embed(b"query"), np.ones(2))
+
+
+def test_client_reconnects_after_losing_its_connection(server, address):
+    client = ModelServerClient(address, AUTHKEY, connect_timeout_s=0)
+    model = RemoteEmbeddingModel(client, Element.TEXT)
+    server.drop_connections()
+
+    with pytest.raises((EOFError, OSError)):
+        model.embed(b"query")
+    assert np.array_equal(model.embed(b"query"), np.ones(2))
+
+
+def test_clients_with_a_wrong_authkey_are_rejected(server, address):
+    client = ModelServerClient(address, b"wrong", connect_timeout_s=0)
+    with pytest.raises(AuthenticationError):
+        RemoteEmbeddingModel(client, Element.TEXT)
+
+    # the server keeps serving other clients
+    client = ModelServerClient(address, AUTHKEY, connect_timeout_s=0)
+    assert RemoteEmbeddingModel(client, Element.TEXT).embed(b"q") is not None
+
+
+def test_calls_time_out_and_drop_their_connection(server, address, blocked):
+    client = ModelServerClient(
+        address, AUTHKEY, connect_timeout_s=0, call_timeout_s=0.1
+    )
+    with pytest.raises(TimeoutError):
+        RemoteEmbeddingModel(client, Element.IMAGE).embed(b"query")
+
+    # the late response is not read as the response of the next call
+    blocked.release.set()
+    model = RemoteEmbeddingModel(client, Element.TEXT)
+    assert np.array_equal(model.embed(b"query"), np.ones(2))
+    assert len(server.conns) == 2
@@ -0,0 +1,136 @@
+import threading
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+from pinecone.openapi_support.exceptions import PineconeApiException
+from tenacity import wait_none
+
+from adapters import repository
+from adapters.repository import PineconeRepo
+
+MAX_RETRIES = repository.PINECONE_MAX_RETRIES
+
+
+class FakeIndex:
+    """
+    Records upserted requests, failing the first `failures` of them with
+    `error`, and tracks how many requests are in flight at once
+    """
+
+    def __init__(
+        self,
+        failures: int = 0,
+        delay_s: float = 0,
+        error: Exception = ConnectionError("upsert failed"),
+    ):
+        self.requests: List[List[Dict[str, Any]]] = []
+        self.attempts = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._failures = failures
+        self._delay_s = delay_s
+        self._error = error
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str) -> None:
+        with self._lock:
+            self.attempts += 1
+            if self.attempts <= self._failures:
+                raise self._error
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        time.sleep(self._delay_s)
+        with self._lock:
+            self._in_flight -= 1
+            self.requests.append(vectors)
+
+
+class FakePinecone:
+    def __init__(self, api_key: str):
+        self.indexes: Dict[str, FakeIndex] = {}
+
+    def has_index(self, name: str) -> bool:
+        return True
+
+    def Index(self, name: str) -> FakeIndex:
+        return self.indexes.setdefault(name, FakeIndex())
+
+
+@pytest.fixture
+def repo(monkeypatch) -> PineconeRepo:
+    monkeypatch.setattr(repository, "Pinecone", FakePinecone)
+    monkeypatch.setattr(repository, "get_pinecone_api_key", lambda: "key")
+    for method in (PineconeRepo.insert, PineconeRepo._upsert):
+        monkeypatch.setattr(method.retry, "wait", wait_none())
+    return PineconeRepo(["Text"], [2])
+
+
+def _items(n: int):
+    return [(f"u/t{i}", np.full(2, i, dtype=np.float32)) for i in range(n)]
+
+
+def test_insert_many_chunks_requests(repo, monkeypatch):
+    monkeypatch.setattr(repository, "PINECONE_UPSERT_BATCH_SIZE", 4)
+    index = repo._indexes["text"] = FakeIndex()
+    repo.insert_many("Text", "u", _items(10))
+
+    assert sorted(map(len, index.requests)) == [2, 4, 4]
+    ids = sorted(vec["id"] for request in index.requests for vec in request)
+    assert ids == sorted(key for key, _ in _items(10))
+
+
+def test_insert_many_bounds_requests_in_flight(repo, monkeypatch):
+    monkeypatch.setattr(repository, "PINECONE_UPSERT_BATCH_SIZE", 1)
+    index = repo._indexes["text"] = FakeIndex(delay_s=0.05)
+    repo.insert_many(
+        "Text", "u", _items(4 * repository.PINECONE_MAX_IN_FLIGHT)
+    )
+
+    assert len(index.requests) == 4 * repository.PINECONE_MAX_IN_FLIGHT
+    assert index.max_in_flight == repository.PINECONE_MAX_IN_FLIGHT
+
+
+def test_insert_many_retries_failed_requests(repo):
+    index = repo._indexes["text"] = FakeIndex(failures=MAX_RETRIES - 1)
+    repo.insert_many("Text", "u", _items(3))
+
+    assert index.attempts == MAX_RETRIES
+    assert len(index.requests) == 1
+
+
+def test_insert_many_gives_up_after_max_retries(repo):
+    index = repo._indexes["text"] = FakeIndex(failures=MAX_RETRIES)
+    with pytest.raises(ConnectionError):
+        repo.insert_many("Text", "u", _items(3))
+    assert index.attempts == MAX_RETRIES
+    assert index.requests == []
+
+
+def test_insert_retries_then_gives_up(repo):
+    index = repo._indexes["text"] = FakeIndex(failures=MAX_RETRIES - 1)
+    repo.insert("Text", "u", "u/t0", np.zeros(2, dtype=np.float32))
+    assert index.attempts == MAX_RETRIES
+    assert index.requests == [[{"id": "u/t0", "values": [0.0, 0.0]}]]
+
+    index = repo._indexes["text"] = FakeIndex(failures=MAX_RETRIES)
+    with pytest.raises(ConnectionError):
+        repo.insert("Text", "u", "u/t0", np.zeros(2, dtype=np.float32))
+    assert index.attempts == MAX_RETRIES
+
+
+@pytest.mark.parametrize("status", (429, 503))
+def test_insert_many_retries_rate_limits_and_server_errors(repo, status):
+    error = PineconeApiException(status=status)
+    index = repo._indexes["text"] = FakeIndex(MAX_RETRIES - 1, error=error)
+    repo.insert_many("Text", "u", _items(3))
+    assert index.attempts == MAX_RETRIES
+
+
+def test_insert_many_raises_client_errors_without_retrying(repo):
+    error = PineconeApiException(status=400)
+    index = repo._indexes["text"] = FakeIndex(MAX_RETRIES, error=error)
+    with pytest.raises(PineconeApiException):
+        repo.insert_many("Text", "u", _items(3))
+    assert index.attempts == 1
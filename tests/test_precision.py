@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from adapters.embedders import (
+    CLIPTextModel,
+    CLIPVisionModel,
+    DePlotModel,
+    UniXCoderModel,
+)
+from adapters.precision import Precision
+from adapters.rerankers.bge import BgeReranker
+
+# minimum cosine similarity to the fp32 embedding of the same input
+MIN_COSINE_SIM = {
+    Precision.BF16: 0.98,
+    Precision.INT8: 0.95,
+}
+# DePlot generates text, so that one diverging token changes the rest of
+# the table and its embedding
+DEPLOT_MIN_COSINE_SIM = {
+    Precision.BF16: 0.9,
+    Precision.INT8: 0.85,
+}
+# maximum difference to the fp32 relevance score (logit) of the same pair
+BGE_MAX_SCORE_DIFF = {
+    Precision.BF16: 0.5,
+    Precision.INT8: 1.0,
+}
+BGE_QUERY = "Who created ChatGPT?"
+BGE_CANDIDATES = [
+    b"ChatGPT is a language model created by OpenAI.",
+    b"OpenAI released a chatbot that generates human-like text.",
+    b"Machine learning models learn patterns from data.",
+    b"The recipe calls for two cups of flour and an egg.",
+    b"The train to the coast leaves at noon on Sundays.",
+]
+
+
+def _cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+@pytest.mark.parametrize("precision", (Precision.BF16, Precision.INT8))
+@pytest.mark.parametrize(
+    "fixture_filepath,model_cls",
+    (
+        ("test_text_filepath", CLIPTextModel),
+        ("test_image_filepath", CLIPVisionModel),
+        ("test_code_filepath", UniXCoderModel),
+    ),
+)
+def test_reduced_precision_matches_fp32(
+    fixture_filepath: str,
+    model_cls,
+    precision: Precision,
+    request: pytest.FixtureRequest,
+):
+    path: Path = request.getfixturevalue(fixture_filepath)
+    baseline = model_cls(precision=Precision.FP32)
+    model = model_cls(precision=precision)
+
+    data = path.read_bytes()
+    emb = model.embed(data)
+    baseline_emb = baseline.embed(data)
+    assert emb.dtype == np.float32
+    assert _cosine_sim(emb, baseline_emb) >= MIN_COSINE_SIM[precision]
+
+
+@pytest.mark.parametrize("precision", (Precision.BF16, Precision.INT8))
+def test_deplot_reduced_precision_matches_fp32(
+    test_plot_filepath: Path, precision: Precision
+):
+    # the tables of every precision are embedded by the same text model
+    text_model = CLIPTextModel(precision=Precision.FP32)
+    baseline = DePlotModel(text_model, precision=Precision.FP32)
+    model = DePlotModel(text_model, precision=precision)
+
+    data = test_plot_filepath.read_bytes()
+    (table,) = model.extract_tables([data])
+    assert table.strip()
+    emb, baseline_emb = model.embed(data), baseline.embed(data)
+    assert _cosine_sim(emb, baseline_emb) >= DEPLOT_MIN_COSINE_SIM[precision]
+
+
+@pytest.mark.parametrize("precision", (Precision.BF16, Precision.INT8))
+def test_bge_reduced_precision_matches_fp32(precision: Precision):
+    baseline = BgeReranker(min_score=None, precision=Precision.FP32)
+    reranker = BgeReranker(min_score=None, precision=precision)
+
+    top_k = len(BGE_CANDIDATES)
+    baseline_ranked = baseline.rerank(
+        BGE_QUERY, iter(BGE_CANDIDATES), top_k=top_k
+    )
+    ranked = reranker.rerank(BGE_QUERY, iter(BGE_CANDIDATES), top_k=top_k)
+    # the relevant candidates keep their ranks
+    assert [i for i, _ in ranked[:2]] == [i for i, _ in baseline_ranked[:2]]
+    scores, baseline_scores = dict(ranked), dict(baseline_ranked)
+    for i, baseline_score in baseline_scores.items():
+        assert abs(scores[i] - baseline_score) <= BGE_MAX_SCORE_DIFF[precision]
@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Dict, List
+
+import pytest
+
+from adapters.cache import LRUCache
+from adapters.storage import StorageFetcher
+
+
+class FakeStorage:
+    """Dict backed storage that takes `delay_s` per fetch"""
+
+    def __init__(self, objs: Dict[str, bytes], delay_s: float = 0):
+        self._objs = objs
+        self._delay_s = delay_s
+        self._lock = threading.Lock()
+        self.fetched: List[str] = []
+
+    def __getitem__(self, key: str) -> bytes:
+        time.sleep(self._delay_s)
+        with self._lock:
+            self.fetched.append(key)
+        return self._objs[key]
+
+
+def test_fetch_many_times_out_past_the_budget():
+    storage = FakeStorage({"a": b"a", "b": b"b"}, delay_s=0.5)
+    fetcher = StorageFetcher(storage, max_workers=1, prefetch=2)
+    with pytest.raises(TimeoutError):
+        list(fetcher.fetch_many(["a", "b"], timeout_s=0.1))
+
+
+class SlowFirstStorage(FakeStorage):
+    """Fetches of earlier keys take longer than those of later keys"""
+
+    def __getitem__(self, key: str) -> bytes:
+        time.sleep(0.05 * (len(self._objs) - list(self._objs).index(key)))
+        return super().__getitem__(key)
+
+
+def _objs(n: int) -> Dict[str, bytes]:
+    return {f"k{i}": f"v{i}".encode() for i in range(n)}
+
+
+def test_fetch_many_yields_in_key_order():
+    objs = _objs(4)
+    storage = SlowFirstStorage(objs)
+    fetcher = StorageFetcher(storage, max_workers=4, prefetch=4)
+
+    assert list(fetcher.fetch_many(objs)) == list(objs.values())
+    # later keys were fetched first, concurrently
+    assert storage.fetched == list(objs)[::-1]
+
+
+def test_fetch_many_prefetches_at_most_prefetch_ahead():
+    objs = _objs(10)
+    storage = FakeStorage(objs)
+    fetcher = StorageFetcher(storage, max_workers=4, prefetch=3)
+    fetched = fetcher.fetch_many(objs)
+
+    assert next(fetched) == b"v0"
+    time.sleep(0.1)
+    # the yielded object and the prefetch window behind it
+    assert sorted(storage.fetched) == ["k0", "k1", "k2", "k3"]
+    assert list(fetched) == list(objs.values())[1:]
+
+
+def test_fetch_many_serves_cache_hits_without_storage():
+    objs = _objs(3)
+    storage = FakeStorage(objs)
+    fetcher = StorageFetcher(storage, 2, 2, cache=LRUCache(capacity=10))
+
+    assert list(fetcher.fetch_many(["k0", "k1"])) == [b"v0", b"v1"]
+    assert list(fetcher.fetch_many(objs)) == list(objs.values())
+    assert sorted(storage.fetched) == ["k0", "k1", "k2"]
+
+
+def test_fetch_many_cancels_pending_fetches_on_early_stop():
+    objs = _objs(6)
+    storage = FakeStorage(objs, delay_s=0.1)
+    fetcher = StorageFetcher(storage, max_workers=1, prefetch=4)
+    fetched = fetcher.fetch_many(objs)
+
+    assert next(fetched) == b"v0"
+    fetched.close()
+    time.sleep(0.3)
+    # k1 was running when the consumer stopped, k2 to k4 were pending
+    assert storage.fetched == ["k0", "k1"]
@@ -0,0 +1,181 @@
+import numpy as np
+import pytest
+
+from adapters.repository import LocalVectorRepo
+from adapters.vector_codecs import Compression, build_codec
+from adapters.vector_index import LocalVectorIndex
+
+
+def _vecs(n: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def _exact(vecs: np.ndarray, query: np.ndarray, top_k: int) -> list:
+    unit = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    return list(np.argsort(-(unit @ query))[:top_k])
+
+
+def test_local_index_exact_search(tmp_path):
+    vecs = _vecs(100)
+    index = LocalVectorIndex(tmp_path, 32)
+    index.insert_many([(str(i), vec) for i, vec in enumerate(vecs)])
+
+    query = _vecs(1, seed=1)[0]
+    (matches,) = index.search(query, top_k=5)
+    assert [key for key, _ in matches] == [
+        str(i) for i in _exact(vecs, query, 5)
+    ]
+    assert matches[0][1] >= matches[-1][1]
+
+
+def test_local_index_delete_reuses_rows_and_persists(tmp_path):
+    vecs = _vecs(10)
+    index = LocalVectorIndex(tmp_path, 32)
+    index.insert_many([(str(i), vec) for i, vec in enumerate(vecs)])
+    index.delete(["3"])
+    assert len(index) == 9
+    assert "3" not in [key for key, _ in index.search(vecs[3], 10)[0]]
+
+    index.insert_many([("new", vecs[3])])
+    assert index.search(vecs[3], 1)[0][0][0] == "new"
+
+    reopened = LocalVectorIndex(tmp_path, 32)
+    assert len(reopened) == 10
+    assert reopened.search(vecs[5], 1)[0][0][0] == "5"
+
+
+def test_local_index_ivf_recall(tmp_path):
+    centers = _vecs(50, seed=2)
+    rng = np.random.default_rng(3)
+    vecs = centers[rng.integers(50, size=4000)] + 0.1 * _vecs(4000, seed=4)
+    index = LocalVectorIndex(tmp_path, 32, ivf_min_vectors=1000, nprobe=8)
+    for i in range(0, len(vecs), 500):
+        index.insert_many([(str(j), vecs[j]) for j in range(i, i + 500)])
+    assert (tmp_path / "ivf.npz").exists()
+
+    queries = _vecs(20, seed=5)
+    hits = 0
+    for query, matches in zip(queries, index.search(queries, 10)):
+        expected = {str(i) for i in _exact(vecs, query, 10)}
+        hits += len(expected & {key for key, _ in matches})
+    assert hits / 200 >= 0.9
+
+
+def test_local_index_handles_see_each_others_writes(tmp_path):
+    vecs = _vecs(10)
+    writer = LocalVectorIndex(tmp_path, 32)
+    writer.insert_many([(str(i), vec) for i, vec in enumerate(vecs[:5])])
+    reader = LocalVectorIndex(tmp_path, 32)
+    assert reader.search(vecs[3], 1)[0][0][0] == "3"
+
+    # the row of "3" is reused for "new", with a different vector
+    writer.delete(["3"])
+    writer.insert_many([("new", vecs[7])])
+    matches = dict(reader.search(vecs[3], 5)[0])
+    assert "3" not in matches
+    assert reader.search(vecs[7], 1)[0][0][0] == "new"
+
+    # a write through a stale handle does not take a row in use
+    reader.insert_many([("reader", vecs[8])])
+    writer.insert_many([("writer", vecs[9])])
+    for index in (reader, writer):
+        assert len(index) == 7
+        assert index.search(vecs[8], 1)[0][0][0] == "reader"
+        assert index.search(vecs[9], 1)[0][0][0] == "writer"
+        assert index.search(vecs[7], 1)[0][0][0] == "new"
+
+
+def test_local_index_handles_see_ivf_training(tmp_path):
+    vecs = _vecs(300)
+    writer = LocalVectorIndex(tmp_path, 32, ivf_min_vectors=200, nprobe=16)
+    reader = LocalVectorIndex(tmp_path, 32, ivf_min_vectors=200, nprobe=16)
+    writer.insert_many([(str(i), vec) for i, vec in enumerate(vecs)])
+
+    assert reader.search(vecs[42], 1)[0][0][0] == "42"
+    assert reader._centroids is not None
+
+
+def test_local_index_ivf_postings_follow_writes(tmp_path):
+    vecs = _vecs(12)
+    # fewer vectors than the minimum number of lists, probing every list
+    index = LocalVectorIndex(tmp_path, 32, ivf_min_vectors=4, nprobe=16)
+    index.insert_many([(str(i), vec) for i, vec in enumerate(vecs[:10])])
+    assert index._centroids is not None
+
+    index.insert_many([("2", vecs[10]), ("new", vecs[11])])
+    index.delete(["5"])
+    expected = {str(i): vecs[i] for i in range(10) if i != 5}
+    expected.update({"2": vecs[10], "new": vecs[11]})
+    keys, exp_vecs = list(expected), np.stack(list(expected.values()))
+
+    reopened = LocalVectorIndex(tmp_path, 32, ivf_min_vectors=4, nprobe=16)
+    for handle in (index, reopened):
+        posted = np.sort(np.concatenate(handle._postings))
+        assert posted.tolist() == sorted(handle._rows.values())
+        for query in vecs:
+            (matches,) = handle.search(query, top_k=3)
+            assert [key for key, _ in matches] == [
+                keys[i] for i in _exact(exp_vecs, query, 3)
+            ]
+
+
+def test_local_vector_repo(tmp_path):
+    repo = LocalVectorRepo(["Text"], [32], root=str(tmp_path))
+    vecs = _vecs(3)
+    assert repo.query("Text", "user", vecs[0]) == []
+
+    repo.insert_many("Text", "user", [(str(i), v) for i, v in enumerate(vecs)])
+    repo.insert("Text", "other", "x", vecs[0])
+    ((key, score),) = repo.query("Text", "user", vecs[1], top_k=1)
+    assert key == "1" and np.isclose(score, 1)
+    other = repo.query_many("Text", "other", vecs[:2], top_k=3)
+    assert [[key for key, _ in matches] for matches in other] == [["x"], ["x"]]
+
+    repo.delete("Text", "user", ["1"])
+    assert "1" not in dict(repo.query("Text", "user", vecs[1]))
+
+
+@pytest.mark.parametrize(
+    "compression", [Compression.FP16, Compression.INT8, Compression.PQ]
+)
+def test_codec_roundtrip(compression):
+    vecs = _vecs(1000, dim=128)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    codec = build_codec(compression, 128)
+    codec.train(vecs)
+    codes = codec.encode(vecs)
+    decoded = codec.decode(codes)
+    cos = (decoded * vecs).sum(axis=1) / np.linalg.norm(decoded, axis=1)
+    assert cos.mean() >= (0.7 if compression == Compression.PQ else 0.99)
+    assert np.allclose(
+        codec.score(codes, vecs[:3]), vecs[:3] @ decoded.T, atol=1e-3
+    )
+
+
+@pytest.mark.parametrize(
+    "compression", [Compression.FP16, Compression.INT8, Compression.PQ]
+)
+def test_local_index_compressed_search(tmp_path, compression):
+    vecs = _vecs(2000, dim=128)
+    # probe every IVF list, so that only the compression is approximate
+    index = LocalVectorIndex(
+        tmp_path,
+        128,
+        ivf_min_vectors=1000,
+        nprobe=1000,
+        compression=compression,
+    )
+    index.insert_many([(str(i), vec) for i, vec in enumerate(vecs)])
+    assert (tmp_path / "codes.bin").exists()
+
+    queries = _vecs(10, dim=128, seed=1)
+    for query, matches in zip(queries, index.search(queries, 5)):
+        (best,) = _exact(vecs, query, 1)
+        assert matches[0][0] == str(best)
+        # rescored against the full vectors
+        expected = vecs[best] @ query
+        expected /= np.linalg.norm(vecs[best]) * np.linalg.norm(query)
+        assert np.isclose(matches[0][1], expected, atol=1e-5)
+
+    reopened = LocalVectorIndex(tmp_path, 128, compression=Compression.FP32)
+    assert reopened.search(vecs[7], 1)[0][0][0] == "7"